@@ -1,5 +1,9 @@
 from django.http import HttpResponse
 
+from wallpapers.httpcache import static_page
+
+
+@static_page
 def robots_txt(request):
     content = """User-agent: *
 Disallow: /admin/
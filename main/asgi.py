@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Set ASYNC_DOWNLOADS=True when serving this with an ASGI server so wallpaper
+downloads use the async view and one process can stream many at once.
 """
 
 import os
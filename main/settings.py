@@ -24,12 +24,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'wallpapers.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'wallpapers.middleware.StaffHintMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -38,7 +40,8 @@ ROOT_URLCONF = 'main.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # the stock Django backend, with render times recorded (metrics.py)
+        'BACKEND': 'wallpapers.metrics.DjangoTemplates',
         'DIRS': [BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -96,6 +99,137 @@ CLOUDINARY_STORAGE = {
 }
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
+# Redis (or anything speaking its protocol) in production, per-process memory otherwise
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'wallportal',
+        }
+    }
+
+# Seconds a home page listing stays cached (new uploads invalidate it immediately)
+LISTING_CACHE_TIMEOUT = int(os.getenv("LISTING_CACHE_TIMEOUT", "300"))
+
+# Rendered template fragments (cards, detail bodies, JSON-LD), keyed on the
+# wallpaper's updated_at. Download counts shown in them can lag by up to
+# the timeout. FRAGMENT_CACHE_STATS counts hits and render time per
+# fragment for ``manage.py fragment_cache_stats``, at two extra cache
+# writes per fragment.
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv("FRAGMENT_CACHE_TIMEOUT", "600"))
+FRAGMENT_CACHE_STATS = os.getenv("FRAGMENT_CACHE_STATS") == "True"
+
+# Cache-Control for anonymous public pages (seconds): browsers, shared caches
+# (CDN), and how long a CDN may serve a stale copy while it revalidates.
+# Signed-in users always get private, uncached responses. See httpcache.py.
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "60"))
+HTTP_CACHE_S_MAXAGE = int(os.getenv("HTTP_CACHE_S_MAXAGE", "300"))
+HTTP_CACHE_STALE_WHILE_REVALIDATE = int(os.getenv("HTTP_CACHE_STALE_WHILE_REVALIDATE", "600"))
+
+# Public pages never load the session, staff tools are fetched separately by
+# browsers carrying this (readable, non-secret) cookie, see middleware.py.
+# base.html's staff tools script checks for the same name.
+STAFF_HINT_COOKIE = "wp_staff"
+
+# Session storage for staff logins: "django.contrib.sessions.backends.db"
+# (default), "...backends.cached_db" or "...backends.cache" to read sessions
+# from the cache, or "...backends.signed_cookies" to keep none server side
+SESSION_ENGINE = os.getenv("SESSION_ENGINE", "django.contrib.sessions.backends.db")
+
+# Upstream (Cloudinary) fetches for downloads
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "30"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "10"))
+# "proxy" streams downloads through Django, "redirect" sends a 302 to the signed CDN URL
+DOWNLOAD_MODE = os.getenv("DOWNLOAD_MODE", "proxy")
+# serve downloads with the async view (run under main/asgi.py)
+ASYNC_DOWNLOADS = os.getenv("ASYNC_DOWNLOADS") == "True"
+
+# View/download counters are buffered in memory and written in batches
+COUNTER_FLUSH_INTERVAL = float(os.getenv("COUNTER_FLUSH_INTERVAL", "10"))
+COUNTER_MAX_PENDING = int(os.getenv("COUNTER_MAX_PENDING", "1000"))
+# Seconds ?sort=downloads pages (cached listings, ETags) may lag the counters
+COUNTS_GENERATION_INTERVAL = int(os.getenv("COUNTS_GENERATION_INTERVAL", "60"))
+
+# "auto" uses Postgres full-text search on Postgres and our own inverted index elsewhere
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+
+# "keyset" pages the home grid with cursors, "offset" keeps ?page=N only
+HOME_PAGINATION = os.getenv("HOME_PAGINATION", "keyset")
+# show "1000+ wallpapers" under cursor pages, a capped COUNT per filtered listing
+# (never run for crawlers)
+HOME_APPROXIMATE_COUNT = os.getenv("HOME_APPROXIMATE_COUNT", "True") == "True"
+
+# Batch ingest (admin multi-file upload, manage.py ingest): the upload
+# backend and how many uploads run at once
+WALLPAPER_UPLOADER = os.getenv("WALLPAPER_UPLOADER", "wallpapers.ingest.CloudinaryUploader")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "8"))
+
+# Background jobs (upload page ingest), run by ``manage.py runworker``. The
+# spool directory holds uploaded files until their job has run, so web and
+# worker processes must share it.
+JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", str(BASE_DIR / "spool"))
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+# seconds before the first retry, doubling on every further attempt
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "10"))
+# a job running longer than this is assumed to belong to a dead worker
+JOB_LOCK_TIMEOUT = int(os.getenv("JOB_LOCK_TIMEOUT", str(15 * 60)))
+
+# Perceptual-hash duplicate check on upload: "warn", "block" or "off", and
+# the largest Hamming distance (of 64 bits) that counts as the same image.
+# Keep the distance below 4, see duplicates.py.
+DUPLICATE_POLICY = os.getenv("DUPLICATE_POLICY", "warn")
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "3"))
+
+# Colour filter (?color=): how much of the image, in percent, a colour has
+# to cover for the wallpaper to be listed under it, see colors.py
+COLOR_MIN_WEIGHT = int(os.getenv("COLOR_MIN_WEIGHT", "15"))
+
+# Sitemaps: URLs per child sitemap (the protocol allows at most 50,000) and
+# how long a generated one stays cached (uploads invalidate it immediately)
+SITEMAP_SECTION_SIZE = int(os.getenv("SITEMAP_SECTION_SIZE", "50000"))
+SITEMAP_CACHE_TIMEOUT = int(os.getenv("SITEMAP_CACHE_TIMEOUT", str(60 * 60 * 24)))
+
+# Trending (?sort=trending, featured suggestions, related strip): views and
+# downloads weighted, halved every TRENDING_HALF_LIFE_HOURS, and folded in
+# by ``manage.py update_trending`` (run it every few minutes). Related
+# wallpapers get up to TRENDING_RELATED_WEIGHT * log(1 + heat) on top of
+# their similarity, 0 turns that off.
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "48"))
+TRENDING_VIEW_WEIGHT = float(os.getenv("TRENDING_VIEW_WEIGHT", "1"))
+TRENDING_DOWNLOAD_WEIGHT = float(os.getenv("TRENDING_DOWNLOAD_WEIGHT", "5"))
+TRENDING_RELATED_WEIGHT = float(os.getenv("TRENDING_RELATED_WEIGHT", "0.1"))
+FEATURED_SUGGESTIONS = int(os.getenv("FEATURED_SUGGESTIONS", "12"))
+
+# View/download event log (device, download preset) behind the admin
+# activity charts, written with the counter flush. ``manage.py
+# compact_events`` (run it hourly) rolls hours up once they have been over
+# for EVENT_COMPACT_GRACE seconds, then days, and deletes raw events after
+# EVENT_RETENTION_DAYS and hourly rollups after EVENT_HOURLY_RETENTION_DAYS.
+EVENT_LOG_ENABLED = os.getenv("EVENT_LOG_ENABLED", "True") == "True"
+EVENT_COMPACT_GRACE = int(os.getenv("EVENT_COMPACT_GRACE", "300"))
+EVENT_RETENTION_DAYS = int(os.getenv("EVENT_RETENTION_DAYS", "14"))
+EVENT_HOURLY_RETENTION_DAYS = int(os.getenv("EVENT_HOURLY_RETENTION_DAYS", "90"))
+
+# Request, query, template and Cloudinary timings, served in the Prometheus
+# text format at /metrics/ to staff or to a scraper sending
+# "Authorization: Bearer <METRICS_TOKEN>". Requests slower than
+# SLOW_REQUEST_MS (0 turns it off) are logged with their slowest queries.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", "500"))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
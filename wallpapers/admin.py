@@ -1,9 +1,182 @@
-from django.contrib import admin
-from .models import Wallpaper
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from .forms import BulkUploadForm
+from .models import Event, Job, Tag, Wallpaper
+from . import events, ingest, jobs, stats, trending
+
+# activity charts, in days
+ACTIVITY_DAYS = 30
+ACTIVITY_DAY_OPTIONS = (7, 30, 90)
+
+class TrendingFilter(admin.SimpleListFilter):
+    title = "trending"
+    parameter_name = "trending"
+
+    def lookups(self, request, model_admin):
+        return [("suggested", "Suggested for featured")]
+
+    def queryset(self, request, queryset):
+        # sort by the Heat column to see them hottest first
+        if self.value() == "suggested":
+            suggested = list(trending.featured_suggestions().values_list("pk", flat=True))
+            return queryset.filter(pk__in=suggested)
+        return queryset
+
 
 @admin.register(Wallpaper)
 class WallpaperAdmin(admin.ModelAdmin):
-    list_display = ("title", "category", "resolution_label", "downloads", "updated_at", "created_at")
+    list_display = ("title", "category", "resolution_label", "downloads", "heat", "is_featured", "updated_at", "created_at")
     search_fields = ("title","category", "device","resolution_label")
-    list_filter = ("category","resolution_label","created_at", "updated_at", "device")
+    list_filter = (TrendingFilter, "is_featured", "category","resolution_label","created_at", "updated_at", "device")
     prepopulated_fields = {"slug": ("title",)}
+    actions = ("mark_featured", "unmark_featured")
+
+    @admin.display(description="Heat", ordering="-trending_score")
+    def heat(self, obj):
+        # decayed weighted views + downloads as of now
+        return f"{trending.heat(obj.trending_score):.1f}"
+
+    @admin.action(description="Mark selected as featured")
+    def mark_featured(self, request, queryset):
+        # save() per row so the usual signals (listing caches, stats) run
+        for wp in queryset.filter(is_featured=False):
+            wp.is_featured = True
+            wp.save()
+
+    @admin.action(description="Remove selected from featured")
+    def unmark_featured(self, request, queryset):
+        for wp in queryset.filter(is_featured=True):
+            wp.is_featured = False
+            wp.save()
+
+    def changelist_view(self, request, extra_context=None):
+        # read from the precomputed stats table, no aggregation over wallpapers
+        count, size = stats.totals()
+        extra_context = {
+            **(extra_context or {}),
+            "library_count": count,
+            "library_size": size,
+            "library_breakdown": stats.breakdown(),
+        }
+        return super().changelist_view(request, extra_context=extra_context)
+
+    def change_view(self, request, object_id, form_url="", extra_context=None):
+        # from the event rollups, see events.py
+        rows, legend = events.chart(ACTIVITY_DAYS, "kind", wallpaper_id=object_id)
+        extra_context = {
+            **(extra_context or {}),
+            "activity_days": ACTIVITY_DAYS,
+            "activity_chart": rows,
+            "activity_legend": legend,
+            "activity_resolutions": events.breakdown(ACTIVITY_DAYS, "res", wallpaper_id=object_id, kind="download"),
+        }
+        return super().change_view(request, object_id, form_url, extra_context=extra_context)
+
+    def get_urls(self):
+        urls = [
+            path(
+                "bulk-upload/",
+                self.admin_site.admin_view(self.bulk_upload_view),
+                name="wallpapers_wallpaper_bulk_upload"
+            ),
+            path(
+                "activity/",
+                self.admin_site.admin_view(self.activity_view),
+                name="wallpapers_wallpaper_activity"
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def bulk_upload_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect("admin:wallpapers_wallpaper_changelist")
+
+        form = BulkUploadForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            data = form.cleaned_data
+            items = [
+                ingest.IngestItem(
+                    name=f.name,
+                    source=f,
+                    title=ingest.title_from_filename(f.name),
+                    category=data["category"],
+                    device=data["device"],
+                    tags=data["tags"],
+                    featured=data["featured"],
+                )
+                for f in data["files"]
+            ]
+            result = ingest.ingest(items)
+            if result.created:
+                messages.success(request, f"Uploaded {len(result.created)} wallpapers.")
+            for name, warning in result.warnings:
+                messages.warning(request, f"{name}: {warning}")
+            for name, error in result.failed:
+                messages.error(request, f"{name}: {error}")
+            if not result.failed:
+                return redirect("admin:wallpapers_wallpaper_changelist")
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Bulk upload wallpapers",
+            "form": form,
+        }
+        return TemplateResponse(request, "admin/wallpapers/wallpaper/bulk_upload.html", context)
+
+    def activity_view(self, request):
+        if not self.has_view_permission(request):
+            return redirect("admin:index")
+
+        try:
+            days = int(request.GET.get("days", ACTIVITY_DAYS))
+        except ValueError:
+            days = ACTIVITY_DAYS
+        days = max(1, min(days, max(ACTIVITY_DAY_OPTIONS)))
+
+        kind_chart, kind_legend = events.chart(days, "kind")
+        res_chart, res_legend = events.chart(days, "res", kind=Event.DOWNLOAD)
+        top = events.breakdown(days, "wallpaper_id", kind=Event.DOWNLOAD)[:10]
+        wallpapers = Wallpaper.objects.in_bulk([pk for pk, _ in top])
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Views and downloads",
+            "days": days,
+            "day_options": ACTIVITY_DAY_OPTIONS,
+            "kind_chart": kind_chart,
+            "kind_legend": kind_legend,
+            "res_chart": res_chart,
+            "res_legend": res_legend,
+            "devices": events.breakdown(days, "device", kind=Event.DOWNLOAD),
+            "top": [(wallpapers[pk], count) for pk, count in top if pk in wallpapers],
+        }
+        return TemplateResponse(request, "admin/wallpapers/wallpaper/activity.html", context)
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ("name", "slug", "wallpaper_count")
+    search_fields = ("name",)
+    readonly_fields = ("wallpaper_count",)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "attempts", "run_after", "created_at", "finished_at")
+    list_filter = ("status", "kind")
+    search_fields = ("key",)
+    readonly_fields = (
+        "kind", "key", "payload", "result", "attempts", "last_error",
+        "locked_by", "locked_at", "created_at", "finished_at",
+    )
+    actions = ("retry_jobs",)
+
+    @admin.action(description="Retry selected failed jobs")
+    def retry_jobs(self, request, queryset):
+        failed = list(queryset.filter(status=Job.FAILED))
+        for job in failed:
+            jobs.retry(job)
+        messages.success(request, f"Queued {len(failed)} jobs again.")
@@ -0,0 +1 @@
+"""Offline benchmarking helpers (stub servers, fakes) used by the bench_* commands."""
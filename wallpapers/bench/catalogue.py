@@ -0,0 +1,78 @@
+"""
+Synthetic wallpaper catalogue for benchmarks.
+
+Produces unsaved Wallpaper instances with plausible titles, tags,
+categories, devices, resolutions and palettes. Deterministic for a given
+seed.
+"""
+import random
+
+from wallpapers import images
+from wallpapers.models import Wallpaper
+
+SUBJECTS = {
+    "anime": ["naruto", "goku", "luffy", "eren", "sakura", "gojo", "tanjiro", "itachi"],
+    "animals": ["tiger", "wolf", "eagle", "panda", "lion", "fox", "owl", "whale"],
+    "cars": ["porsche", "lamborghini", "ferrari", "mustang", "supra", "skyline", "bmw", "audi"],
+    "cityscape": ["tokyo", "new york", "dubai", "paris", "hong kong", "london", "seoul"],
+    "fantasy": ["dragon", "castle", "wizard", "elf", "phoenix", "kingdom", "sorceress"],
+    "games": ["minecraft", "valorant", "zelda", "elden ring", "halo", "fortnite", "god of war"],
+    "movies": ["interstellar", "dune", "batman", "matrix", "avatar", "star wars", "joker"],
+    "nature": ["mountain", "forest", "waterfall", "ocean", "desert", "lake", "aurora"],
+    "space": ["galaxy", "nebula", "saturn", "black hole", "milky way", "mars", "astronaut"],
+    "sports": ["football", "cricket", "basketball", "formula one", "tennis", "messi", "ronaldo"],
+    "superheros": ["spiderman", "iron man", "superman", "thor", "wonder woman", "hulk"],
+    "technology": ["circuit", "cyberpunk", "robot", "hologram", "code", "neon grid"],
+    "other": ["abstract", "minimal", "gradient", "pattern", "texture", "geometry"],
+}
+MOODS = ["dark", "neon", "minimal", "aesthetic", "sunset", "night", "retro", "epic", "calm", "amoled"]
+STYLES = ["wallpaper", "art", "background", "illustration", "4k", "hd", "digital art"]
+
+RESOLUTIONS = {
+    "pc": [(1920, 1080), (2560, 1440), (3840, 2160), (7680, 4320), (1366, 768), (3440, 1440)],
+    "mobile": [(1080, 2400), (1440, 3200), (1170, 2532), (720, 1600), (2160, 3840)],
+}
+
+
+def fake_wallpapers(count, seed=0, start=0):
+    """Yield count unsaved Wallpaper objects"""
+    rng = random.Random(seed)
+    categories = list(SUBJECTS)
+    for i in range(start, start + count):
+        category = rng.choice(categories)
+        subject = rng.choice(SUBJECTS[category])
+        mood = rng.choice(MOODS)
+        title = f"{mood.title()} {subject.title()} {rng.choice(STYLES).title()}"
+        tags = ", ".join(dict.fromkeys([subject, mood, rng.choice(MOODS), category, rng.choice(STYLES)]))
+        device = "mobile" if rng.random() < 0.3 else "pc"
+        width, height = rng.choice(RESOLUTIONS[device])
+        public_id = f"wallpapers/bench-{seed}-{i}"
+        wp = Wallpaper(
+            title=title,
+            slug=f"bench-{seed}-{i}",
+            drive_file_id=public_id,
+            view_link=f"https://res.cloudinary.com/demo/image/upload/c_limit,w_600/{public_id}.jpg",
+            download_link=f"https://res.cloudinary.com/demo/image/upload/{public_id}.jpg",
+            mime_type="image/jpg",
+            width=width,
+            height=height,
+            size_bytes=rng.randint(300_000, 40_000_000),
+            category=category,
+            tags=tags,
+            device=device,
+            downloads=int(rng.paretovariate(1.2)) - 1,
+            views=int(rng.paretovariate(1.0) * 5),
+            is_featured=rng.random() < 0.05,
+        )
+        # bulk_create() skips save(), fill in what it would have derived
+        wp.set_dimension_fields()
+        wp.thumbnails = images.thumbnail_urls(public_id, width)
+        wp.set_palette(fake_palette(rng))
+        yield wp
+
+
+def fake_palette(rng):
+    """A few random colours with shares that add up to 100, largest first"""
+    shares = sorted((rng.randint(5, 60) for _ in range(rng.randint(2, 5))), reverse=True)
+    total = sum(shares)
+    return [(f"{rng.randrange(0x1000000):06x}", round(100 * share / total)) for share in shares]
@@ -0,0 +1,248 @@
+"""
+Load-test harness behind ``manage.py loadtest``.
+
+Drives the public pages and the upload page through Django's test client
+from a pool of threads, each with its own client and database connection,
+against whatever database the settings point at (seed it first with
+``manage.py seed_wallpapers``). Nothing leaves the process: downloads go
+to transport.FakeCloudinaryAdapter and uploads to ingest.FakeUploader.
+
+Per scenario it reports p50/p95/p99 latency, throughput, queries per
+request and status codes, plus the process RSS, as a dict that the command
+writes out as JSON so runs on different commits can be compared.
+"""
+import gc
+import html
+import io
+import itertools
+import os
+import re
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from PIL import Image
+
+from wallpapers import colors
+from wallpapers.bench.catalogue import MOODS, SUBJECTS
+from wallpapers.bench.transport import FakeCloudinaryAdapter, install
+from wallpapers.models import Wallpaper
+
+SCENARIOS = ("home", "detail", "download", "sitemap", "upload")
+
+PAGE_SIZE = 24
+NEXT_LINK_RE = re.compile(r'href="(\?[^"]*)"\s+rel="next"')
+LOC_RE = re.compile(r"<loc>https?://[^/]+(/[^<]*)</loc>")
+
+
+def home_urls(client, depth):
+    """Every filter and sort combination, then deep pages by cursor and by number"""
+    options = {
+        "q": ["", "city"],
+        "cat": ["", "nature"],
+        "res": ["", "4k"],
+        "device": ["", "pc", "mobile"],
+        "tag": ["", MOODS[0]],
+        "color": ["", colors.COLORS[0][0]],
+        "sort": ["", "downloads", "featured", "relevance"],
+    }
+    urls = []
+    for values in itertools.product(*options.values()):
+        query = "&".join(f"{key}={value}" for key, value in zip(options, values) if value)
+        urls.append(f"/?{query}" if query else "/")
+
+    # follow the "next" links of the default listing as far as depth allows
+    url = "/"
+    for _ in range(depth):
+        match = NEXT_LINK_RE.search(client.get(url).content.decode())
+        if not match:
+            break
+        url = "/" + html.unescape(match.group(1))
+        urls.append(url)
+
+    last_page = max(1, ceil(Wallpaper.objects.count() / PAGE_SIZE))
+    urls += [f"/?page={n}" for n in sorted({2, max(1, last_page // 2), last_page})]
+    return urls
+
+
+def detail_urls(rng, count):
+    slugs = list(Wallpaper.objects.order_by("?").values_list("slug", flat=True)[:count])
+    rng.shuffle(slugs)
+    return [f"/w/{slug}/" for slug in slugs]
+
+
+def download_urls(rng, count):
+    urls = []
+    presets = [""] + list(Wallpaper.DOWNLOAD_PRESETS)
+    for slug in Wallpaper.objects.order_by("?").values_list("slug", flat=True)[:count]:
+        res = rng.choice(presets)
+        urls.append(f"/w/{slug}/download/" + (f"?res={res}" if res else ""))
+    return urls
+
+
+def sitemap_urls(client):
+    body = client.get("/sitemap.xml").content.decode()
+    return ["/sitemap.xml"] + LOC_RE.findall(body)
+
+
+def fake_upload(rng, size):
+    """A unique JPEG of noise, so no two uploads are duplicates of each other"""
+    buf = io.BytesIO()
+    Image.frombytes("RGB", (size, size), os.urandom(size * size * 3)).save(buf, "JPEG", quality=85)
+    category = rng.choice(list(SUBJECTS))
+    return {
+        "title": f"{rng.choice(MOODS).title()} {rng.choice(SUBJECTS[category]).title()} Upload",
+        "category": category,
+        "device": "pc",
+        "tags": f"{category}, loadtest",
+        "image": SimpleUploadedFile("loadtest.jpg", buf.getvalue(), "image/jpeg"),
+    }
+
+
+def rss_bytes():
+    """Resident set size of this process now, None where /proc isn't there"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, ceil(p / 100 * len(values)) - 1))]
+
+
+class Runner:
+    def __init__(self, concurrency, requests, staff=None, adapter=None):
+        self.concurrency = concurrency
+        self.requests = requests
+        self.staff = staff
+        self.adapter = adapter or FakeCloudinaryAdapter()
+
+    def run(self, name, request):
+        """
+        Send self.requests requests, request(client, i) making the i-th one,
+        over self.concurrency threads; returns the scenario's figures.
+        """
+        numbers = itertools.count()
+        samples = []
+        lock = threading.Lock()
+
+        def worker():
+            client = Client()
+            if self.staff:
+                client.force_login(self.staff)
+            install(self.adapter)
+            local = []
+            try:
+                while (i := next(numbers)) < self.requests:
+                    local.append(self.one(client, request, i))
+            finally:
+                connection.close()
+                with lock:
+                    samples.extend(local)
+
+        gc.collect()
+        rss_before = rss_bytes()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="loadtest") as pool:
+            for future in [pool.submit(worker) for _ in range(self.concurrency)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+        return summarize(name, samples, elapsed, self.concurrency, rss_before)
+
+    def one(self, client, request, i):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count):
+                response = request(client, i)
+                if response.streaming:
+                    # a download isn't served until its body has been sent
+                    for _ in response.streaming_content:
+                        pass
+                response.close()
+            status = str(response.status_code)
+        except Exception as e:
+            status = type(e).__name__
+        return (time.perf_counter() - started) * 1000, queries, status
+
+
+def summarize(name, samples, elapsed, concurrency, rss_before):
+    latencies = sorted(ms for ms, _, _ in samples)
+    queries = [n for _, n, _ in samples]
+    statuses = Counter(status for _, _, status in samples)
+    rss_after = rss_bytes()
+    return {
+        "scenario": name,
+        "requests": len(samples),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(samples) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "p50": _round(percentile(latencies, 50)),
+            "p95": _round(percentile(latencies, 95)),
+            "p99": _round(percentile(latencies, 99)),
+            "mean": _round(statistics.fmean(latencies)) if latencies else None,
+            "max": _round(latencies[-1]) if latencies else None,
+        },
+        "queries": {
+            "mean": round(statistics.fmean(queries), 2) if queries else None,
+            "max": max(queries, default=None),
+        },
+        "statuses": dict(sorted(statuses.items())),
+        "errors": sum(n for status, n in statuses.items() if not status.isdigit() or int(status) >= 500),
+        "rss_mb": {
+            "before": _mb(rss_before),
+            "after": _mb(rss_after),
+            "peak": _mb(peak_rss_bytes()),
+        },
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+def _mb(value):
+    return None if value is None else round(value / (1024 * 1024), 1)
+
+
+def environment():
+    """What the results depend on besides the code, recorded with every run"""
+    return {
+        "database": connection.vendor,
+        "cache": settings.CACHES["default"]["BACKEND"].rsplit(".", 1)[-1],
+        "wallpapers": Wallpaper.objects.count(),
+        "home_pagination": settings.HOME_PAGINATION,
+        "download_mode": settings.DOWNLOAD_MODE,
+        "async_downloads": settings.ASYNC_DOWNLOADS,
+        "metrics_enabled": getattr(settings, "METRICS_ENABLED", False),
+        "cpu_count": os.cpu_count(),
+    }
@@ -0,0 +1,118 @@
+"""
+A local stand-in for Cloudinary's delivery CDN.
+
+Runs a threaded keep-alive HTTP server on 127.0.0.1 so download throughput,
+connection reuse and timeouts can be measured without network access.
+
+    /file/<bytes>    payload of the given size, honours Range, sends ETag
+    /slow/<seconds>  waits before answering (read timeout checks)
+    /status/<code>   replies with the given status code
+"""
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+CHUNK = 64 * 1024
+
+
+def byte_range(header, size):
+    """
+    (start, end, status) a CDN answers a Range header with for a file of
+    size bytes: 200 for the whole file, 206 for a part, 416 if the range
+    starts past the end.
+    """
+    start, end, status = 0, size - 1, 200
+    match = RANGE_RE.match(header or "")
+    if match:
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        elif last:
+            start = max(size - int(last), 0)
+        if start >= size:
+            return start, end, 416
+        end, status = min(end, size - 1), 206
+    return start, end, status
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate sends, without this Nagle's
+    # algorithm and delayed ACKs stall every small keep-alive response
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.hits += 1
+        parts = self.path.strip("/").split("/")
+        route, arg = parts[0], parts[1] if len(parts) > 1 else ""
+
+        if route == "file" and arg.isdigit():
+            return self.send_file(int(arg))
+        if route == "slow":
+            time.sleep(float(arg or 1))
+            return self.send_body(200, b"late")
+        if route == "status" and arg.isdigit():
+            return self.send_body(int(arg), b"")
+        return self.send_body(404, b"not found")
+
+    def send_body(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file(self, size):
+        start, end, status = byte_range(self.headers.get("Range"), size)
+        if status == 416:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        length = end - start + 1
+        self.send_response(status)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(length))
+        self.send_header("ETag", f'"stub-{size}"')
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        block = b"\xff" * CHUNK
+        while length > 0:
+            n = min(length, CHUNK)
+            self.wfile.write(block[:n])
+            length -= n
+
+
+class StubServer:
+    """Context manager that serves StubHandler on a free local port"""
+
+    def __enter__(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.hits = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def hits(self):
+        return self.httpd.hits
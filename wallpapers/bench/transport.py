@@ -0,0 +1,63 @@
+"""
+An in-memory stand-in for Cloudinary's delivery CDN at the requests level.
+
+FakeCloudinaryAdapter answers every https://res.cloudinary.com/ URL with a
+payload of a fixed size (honouring Range, like the CDN) without opening a
+socket, so download benchmarks measure the app and not the network. Use
+stub_server.StubServer instead when the connection pool itself is under
+test.
+
+Sessions in upstream.py are per thread: install() mounts the adapter on
+the calling thread's session only.
+"""
+import io
+import time
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from wallpapers import upstream
+from wallpapers.bench.stub_server import byte_range
+
+CLOUDINARY_PREFIX = "https://res.cloudinary.com/"
+
+
+class FakeCloudinaryAdapter(BaseAdapter):
+    def __init__(self, size=2 * 1024 * 1024, latency=0.0):
+        super().__init__()
+        self.size = size
+        self.latency = latency
+        self.body = b"\xff" * size
+        self.hits = 0
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        self.hits += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        headers = {"Content-Type": "image/jpeg", "ETag": f'"fake-{self.size}"', "Accept-Ranges": "bytes"}
+        start, end, status = byte_range(request.headers.get("Range"), self.size)
+        if status == 416:
+            return self.build(request, 416, {"Content-Range": f"bytes */{self.size}"}, b"")
+        if status == 206:
+            headers["Content-Range"] = f"bytes {start}-{end}/{self.size}"
+        return self.build(request, status, headers, self.body[start:end + 1])
+
+    def build(self, request, status, headers, body):
+        response = Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict({**headers, "Content-Length": str(len(body))})
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+def install(adapter):
+    """Route this thread's Cloudinary fetches to adapter"""
+    upstream.get_session().mount(CLOUDINARY_PREFIX, adapter)
@@ -0,0 +1,215 @@
+"""
+Library-wide cache helpers.
+
+Everything derived from the wallpaper table is cached under a key that
+includes the library *generation*, a counter bumped by the Wallpaper
+save/delete signals. A new upload moves everyone to fresh keys at once and
+the stale entries simply age out; nothing has to be enumerated or flushed.
+``?sort=trending`` listings also carry the trending generation, bumped
+when trending.refresh() rescores, which leaves every other cache alone.
+``?sort=downloads`` listings carry the counts generation the same way. The
+counter flush only marks counts changed, and the next read bumps it, at
+most every COUNTS_GENERATION_INTERVAL seconds. Detail pages also carry the
+trending generation and the related one, bumped when related.py rewrites
+stored neighbours, since their related strip follows both.
+
+Rendered template fragments (grid cards, detail bodies, JSON-LD blocks, see
+templatetags/fragment_cache.py) are keyed on what they show instead: a
+wallpaper's id and ``updated_at``, so saving one moves its fragments to new
+keys and leaves every other fragment cached. Backfills that rewrite rendered
+fields with bulk_update (which leaves ``updated_at`` alone) bump the
+fragment generation, part of every fragment key, instead. With
+FRAGMENT_CACHE_STATS on, hits, misses and render time are counted per
+fragment name.
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+
+GENERATION_KEY = "wallpapers:generation"
+TRENDING_GENERATION_KEY = "wallpapers:generation:trending"
+RELATED_GENERATION_KEY = "wallpapers:generation:related"
+FRAGMENT_GENERATION_KEY = "wallpapers:generation:fragments"
+COUNTS_GENERATION_KEY = "wallpapers:generation:counts"
+COUNTS_DIRTY_KEY = "wallpapers:generation:counts:dirty"
+COUNTS_THROTTLE_KEY = "wallpapers:generation:counts:throttle"
+CHANGED_AT_KEY = "{}:changed_at"
+STATS_KEY = "wallpapers:listing:{}"
+FRAGMENT_KEY = "wallpapers:fragment:{}:{}:{}"
+FRAGMENT_STATS_KEY = "wallpapers:fragment_stats:{}:{}"
+FRAGMENT_NAMES_KEY = "wallpapers:fragment_stats:names"
+FRAGMENT_STATS_FIELDS = ("hits", "misses", "hit_us", "render_us")
+
+_local_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def get_generation(key=GENERATION_KEY):
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, 1, timeout=None)
+        generation = cache.get(key, 1)
+    return generation
+
+
+def bump_generation(key=GENERATION_KEY):
+    # when, for Last-Modified, so page validators never have to query for it
+    cache.set(CHANGED_AT_KEY.format(key), time.time(), timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # key missing (evicted or first write), start a new sequence
+        cache.add(key, 1, timeout=None)
+        return cache.incr(key)
+
+
+def changed_at(key=GENERATION_KEY):
+    """When generation key was last bumped (UTC datetime), None if unknown"""
+    timestamp = cache.get(CHANGED_AT_KEY.format(key))
+    return datetime.fromtimestamp(timestamp, dt_timezone.utc) if timestamp is not None else None
+
+
+def counts_changed():
+    """Called by the counter flush when download counts moved"""
+    cache.set(COUNTS_DIRTY_KEY, 1, timeout=None)
+
+
+def counts_generation():
+    """The counts generation, bumped here once counts changed and the throttle allows"""
+    if cache.get(COUNTS_DIRTY_KEY) and cache.add(COUNTS_THROTTLE_KEY, 1, settings.COUNTS_GENERATION_INTERVAL):
+        cache.delete(COUNTS_DIRTY_KEY)
+        return bump_generation(COUNTS_GENERATION_KEY)
+    return get_generation(COUNTS_GENERATION_KEY)
+
+
+def sort_generation(sort):
+    """Generation of the scores sort orders by, None for sorts that only change with the library"""
+    if sort == "trending":
+        return get_generation(TRENDING_GENERATION_KEY)
+    if sort == "downloads":
+        return counts_generation()
+    return None
+
+
+def listing_key(filters, sort=""):
+    """Cache key for one normalized home-page filter tuple"""
+    digest = hashlib.md5(repr(filters).encode(), usedforsecurity=False).hexdigest()
+    generation = get_generation()
+    scores = sort_generation(sort)
+    if scores is not None:
+        generation = f"{generation}.{scores}"
+    return f"wallpapers:listing:{generation}:{digest}"
+
+
+def get_listing(filters, build, sort=""):
+    """Return the cached listing for filters, calling build() on a miss"""
+    key = listing_key(filters, sort)
+    payload = cache.get(key)
+    if payload is not None:
+        _record("hits")
+        return payload
+    _record("misses")
+    payload = build()
+    cache.set(key, payload, settings.LISTING_CACHE_TIMEOUT)
+    return payload
+
+
+def listing_stats():
+    """Hit/miss counters, shared across workers when the cache backend is"""
+    hits = cache.get(STATS_KEY.format("hits"), 0)
+    misses = cache.get(STATS_KEY.format("misses"), 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else 0.0,
+        "process_hits": _local_stats["hits"],
+        "process_misses": _local_stats["misses"],
+    }
+
+
+def reset_listing_stats():
+    cache.delete_many([STATS_KEY.format("hits"), STATS_KEY.format("misses")])
+    with _stats_lock:
+        _local_stats.update(hits=0, misses=0)
+
+
+def _record(outcome):
+    with _stats_lock:
+        _local_stats[outcome] += 1
+    key = STATS_KEY.format(outcome)
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass
+
+
+def fragment_key(name, parts, generation):
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return FRAGMENT_KEY.format(name, generation, digest)
+
+
+def get_fragment(name, parts, render, generation=None):
+    """
+    The cached rendering of fragment name for parts, calling render() on a
+    miss. generation is the fragment generation, read here when not given.
+    """
+    started = time.perf_counter()
+    if generation is None:
+        generation = get_generation(FRAGMENT_GENERATION_KEY)
+    key = fragment_key(name, parts, generation)
+    html = cache.get(key)
+    if html is not None:
+        _record_fragment(name, "hits", "hit_us", started)
+        return html
+    html = render()
+    cache.set(key, html, settings.FRAGMENT_CACHE_TIMEOUT)
+    _record_fragment(name, "misses", "render_us", started)
+    return html
+
+
+def fragment_stats():
+    """{name: {hits, misses, hit_ratio, hit_ms, render_ms}}, times are per request averages"""
+    names = cache.get(FRAGMENT_NAMES_KEY, [])
+    values = cache.get_many([FRAGMENT_STATS_KEY.format(n, f) for n in names for f in FRAGMENT_STATS_FIELDS])
+    stats = {}
+    for name in names:
+        hits, misses, hit_us, render_us = (
+            values.get(FRAGMENT_STATS_KEY.format(name, f), 0) for f in FRAGMENT_STATS_FIELDS
+        )
+        stats[name] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "hit_ms": hit_us / hits / 1000 if hits else 0.0,
+            "render_ms": render_us / misses / 1000 if misses else 0.0,
+        }
+    return stats
+
+
+def reset_fragment_stats():
+    names = cache.get(FRAGMENT_NAMES_KEY, [])
+    cache.delete_many([FRAGMENT_STATS_KEY.format(n, f) for n in names for f in FRAGMENT_STATS_FIELDS])
+    cache.delete(FRAGMENT_NAMES_KEY)
+
+
+def _record_fragment(name, outcome, timer, started):
+    if not settings.FRAGMENT_CACHE_STATS:
+        return
+    elapsed_us = int((time.perf_counter() - started) * 1_000_000)
+    if outcome == "misses":
+        names = cache.get(FRAGMENT_NAMES_KEY, [])
+        if name not in names:
+            cache.set(FRAGMENT_NAMES_KEY, names + [name], timeout=None)
+    for field, amount in ((outcome, 1), (timer, elapsed_us)):
+        key = FRAGMENT_STATS_KEY.format(name, field)
+        if not cache.add(key, amount, timeout=None):
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                pass
@@ -0,0 +1,127 @@
+"""
+Colour search.
+
+Every wallpaper stores a short palette (images.palette: median cut on a
+64px copy). Each palette colour is classified into one of a dozen named
+bins by hue, saturation and value, and the share of every bin goes into
+WallpaperColor, indexed on (bin, weight). ``?color=blue`` is then one
+index range scan for "blue covers at least COLOR_MIN_WEIGHT percent",
+instead of comparing colour vectors row by row.
+
+sync_colors() keeps the bins in step with ``Wallpaper.palette`` from the
+post_save signal, sync_colors_bulk() does the same for bulk_create paths
+and ``manage.py backfill_colors``.
+"""
+import colorsys
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import WallpaperColor
+
+# (name, swatch shown on the home page), the position is the stored bin
+COLORS = [
+    ("red", "#dc2626"),
+    ("orange", "#f97316"),
+    ("yellow", "#facc15"),
+    ("green", "#16a34a"),
+    ("teal", "#14b8a6"),
+    ("blue", "#2563eb"),
+    ("purple", "#9333ea"),
+    ("pink", "#ec4899"),
+    ("brown", "#92400e"),
+    ("black", "#111827"),
+    ("white", "#f9fafb"),
+    ("gray", "#9ca3af"),
+]
+BINS = {name: i for i, (name, _) in enumerate(COLORS)}
+
+# upper hue bound in degrees for each chromatic bin, checked in order
+HUES = [(15, "red"), (40, "orange"), (65, "yellow"), (160, "green"), (190, "teal"),
+        (250, "blue"), (290, "purple"), (335, "pink"), (360, "red")]
+
+HEX_RE = re.compile(r"^#?([0-9a-f]{3}|[0-9a-f]{6})$")
+
+
+def parse_hex(value):
+    """(r, g, b) for "#1e90ff", "1e90ff" or "09f", None otherwise"""
+    match = HEX_RE.match(value.strip().lower())
+    if not match:
+        return None
+    digits = match.group(1)
+    if len(digits) == 3:
+        digits = "".join(d * 2 for d in digits)
+    return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def classify(rgb):
+    """The bin number of an (r, g, b) colour"""
+    h, s, v = colorsys.rgb_to_hsv(*(c / 255 for c in rgb))
+    if v < 0.2:
+        return BINS["black"]
+    if s < 0.15:
+        return BINS["white"] if v > 0.85 else BINS["gray"]
+    hue = h * 360
+    # dark, muted reds and oranges read as brown
+    if hue < 45 and v < 0.6:
+        return BINS["brown"]
+    for bound, name in HUES:
+        if hue < bound:
+            return BINS[name]
+    return BINS["red"]
+
+
+def bins(palette):
+    """{bin: percent} for a stored palette string"""
+    weights = Counter()
+    for pair in (palette or "").split():
+        hex_value, _, percent = pair.partition(":")
+        rgb = parse_hex(hex_value)
+        if rgb is not None and percent.isdigit():
+            weights[classify(rgb)] += int(percent)
+    return {b: min(w, 100) for b, w in weights.items() if w}
+
+
+def resolve(value):
+    """The bin for a ?color= value, a bin name or a hex colour, None if neither"""
+    value = value.strip().lower()
+    if value in BINS:
+        return BINS[value]
+    rgb = parse_hex(value)
+    return classify(rgb) if rgb is not None else None
+
+
+def filter_wallpapers(qs, value):
+    """Wallpapers where value's bin covers at least COLOR_MIN_WEIGHT percent"""
+    b = resolve(value)
+    if b is None:
+        return qs.none()
+    matching = WallpaperColor.objects.filter(bin=b, weight__gte=settings.COLOR_MIN_WEIGHT)
+    return qs.filter(pk__in=matching.values("wallpaper_id"))
+
+
+def sync_colors(wp):
+    """Make wp's WallpaperColor rows match wp.palette"""
+    wanted = bins(wp.palette)
+    current = dict(WallpaperColor.objects.filter(wallpaper=wp).values_list("bin", "weight"))
+    if wanted == current:
+        return
+    with transaction.atomic():
+        WallpaperColor.objects.filter(wallpaper=wp).delete()
+        WallpaperColor.objects.bulk_create(
+            WallpaperColor(wallpaper=wp, bin=b, weight=w) for b, w in wanted.items()
+        )
+
+
+def sync_colors_bulk(instances):
+    """sync_colors() for many wallpapers, one delete and one insert"""
+    rows = [
+        WallpaperColor(wallpaper_id=wp.pk, bin=b, weight=w)
+        for wp in instances
+        for b, w in bins(wp.palette).items()
+    ]
+    with transaction.atomic():
+        WallpaperColor.objects.filter(wallpaper_id__in=[wp.pk for wp in instances]).delete()
+        WallpaperColor.objects.bulk_create(rows, batch_size=1000)
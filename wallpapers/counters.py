@@ -0,0 +1,169 @@
+"""
+Write-behind buffer for the view and download counters.
+
+Increments are collected in process memory and written every
+COUNTER_FLUSH_INTERVAL seconds by a background thread, as batched
+``UPDATE ... SET views = views + n`` statements (rows with the same deltas
+share one statement). update() skips auto_now, so counting no longer bumps
+``updated_at``. Flushes run one at a time. At interpreter exit the flusher
+is given SHUTDOWN_TIMEOUT seconds to finish before the last flush, and a
+failed flush keeps its counts for the next attempt. After a failure,
+requests that fill the buffer stop flushing inline for FAILURE_BACKOFF
+seconds and leave the retry to the flusher.
+
+A flush that moved download counts tells caching.py, so ``?sort=downloads``
+listings and their ETags move on (throttled, see counts_generation()).
+
+record() also queues an Event row (resolution, device) for the event log,
+bulk-inserted by the same flush in the same transaction (see events.py).
+
+Set COUNTER_FLUSH_INTERVAL to 0 to write every increment straight away.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import caching
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("views", "downloads")
+# Event.kind of each counter
+EVENT_KINDS = {"views": "view", "downloads": "download"}
+# seconds
+SHUTDOWN_TIMEOUT = 10
+FAILURE_BACKOFF = 30
+
+
+class CounterBuffer:
+    def __init__(self):
+        self._setup()
+
+    def _setup(self):
+        self._lock = threading.Lock()
+        # held for a whole flush, so a flush never misses rows another one took
+        self._flush_lock = threading.Lock()
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._events = []
+        self._thread = None
+        self._stop = threading.Event()
+        self._retry_at = 0.0
+
+    def increment(self, pk, field, amount=1):
+        with self._lock:
+            self._pending[pk][field] += amount
+            size = max(len(self._pending), len(self._events))
+
+        due = settings.COUNTER_FLUSH_INTERVAL <= 0 or size >= settings.COUNTER_MAX_PENDING
+        if due and time.monotonic() >= self._retry_at:
+            self.flush()
+        elif settings.COUNTER_FLUSH_INTERVAL > 0:
+            self._ensure_thread()
+
+    def record(self, pk, field, res="", device=""):
+        """increment() by one, and log the event when EVENT_LOG_ENABLED"""
+        if settings.EVENT_LOG_ENABLED:
+            event = (pk, EVENT_KINDS[field], res, device, timezone.now())
+            with self._lock:
+                self._events.append(event)
+        self.increment(pk, field)
+
+    def pending(self, pk, field):
+        """Counts recorded for pk that are not in the database yet"""
+        with self._lock:
+            return self._pending[pk][field] if pk in self._pending else 0
+
+    def flush(self):
+        """Write all pending increments and events, returns the number of rows touched"""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        from .models import Event, Wallpaper
+
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+            events, self._events = self._events, []
+        if not pending and not events:
+            return 0
+
+        # rows with identical deltas share one UPDATE
+        groups = defaultdict(list)
+        for pk, deltas in pending.items():
+            groups[tuple(deltas.get(f, 0) for f in FIELDS)].append(pk)
+
+        try:
+            with transaction.atomic():
+                for deltas, pks in groups.items():
+                    updates = {f: F(f) + d for f, d in zip(FIELDS, deltas) if d}
+                    Wallpaper.objects.filter(pk__in=pks).update(**updates)
+                Event.objects.bulk_create(
+                    Event(wallpaper_id=pk, kind=kind, res=res, device=device, created_at=created_at)
+                    for pk, kind, res, device, created_at in events
+                )
+        except Exception:
+            logger.exception("Counter flush failed, keeping %d rows for retry", len(pending))
+            self._restore(pending, events)
+            self._retry_at = time.monotonic() + FAILURE_BACKOFF
+            return 0
+        self._retry_at = 0.0
+        if any(deltas.get("downloads") for deltas in pending.values()):
+            caching.counts_changed()
+        return len(pending)
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            # it may be holding counts it just took out of the buffer
+            self._thread.join(SHUTDOWN_TIMEOUT)
+        if self.flush() == 0 and (self._pending or self._events):
+            # last chance, make sure the numbers at least end up in the logs
+            logger.error(
+                "Dropping unflushed counters at exit: %s, and %d events", dict(self._pending), len(self._events)
+            )
+
+    def reset_after_fork(self):
+        # the parent still owns its pending counts, the child starts clean
+        self._setup()
+
+    def _restore(self, pending, events):
+        with self._lock:
+            for pk, deltas in pending.items():
+                for field, delta in deltas.items():
+                    self._pending[pk][field] += delta
+            self._events[:0] = events
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="counter-flusher", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(settings.COUNTER_FLUSH_INTERVAL):
+            close_old_connections()
+            self.flush()
+        connection.close()
+
+
+buffer = CounterBuffer()
+increment = buffer.increment
+record = buffer.record
+pending = buffer.pending
+flush = buffer.flush
+
+atexit.register(buffer.shutdown)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=buffer.reset_after_fork)
@@ -0,0 +1,151 @@
+"""
+Near-duplicate detection by perceptual hash.
+
+Each wallpaper stores a 64-bit dHash (images.dhash) and the same hash split
+into four indexed 16-bit bands. Two hashes within Hamming distance 3 must
+agree exactly on at least one band (pigeonhole), so a lookup is four indexed
+equality probes whose few candidates are then checked bit by bit, instead of
+comparing against every row (multi-index hashing).
+
+Dark, flat or blank areas hash to all-zero (or all-one) bands, which a large
+share of any library has, so those bands are never probed. A hash with fewer
+informative bands probes each of them over a wider Hamming radius instead
+(distance // bands left), which keeps the guarantee except for candidates
+whose closest band is itself flat. A hash with no informative band at all
+(a uniform image) is only matched on the whole hash.
+
+DUPLICATE_MAX_DISTANCE must stay below BANDS for the guarantee to hold.
+DUPLICATE_POLICY decides what an upload does on a match: "warn", "block" or
+"off".
+"""
+import itertools
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Wallpaper
+
+BANDS = 4
+BAND_FIELDS = ("phash_0", "phash_1", "phash_2", "phash_3")
+MASK = (1 << 64) - 1
+# band values of flat regions, shared by too many wallpapers to probe
+FLAT_BANDS = (0, 0xFFFF)
+
+
+def bands(value):
+    return tuple((value >> shift) & 0xFFFF for shift in (48, 32, 16, 0))
+
+
+def unsigned(value):
+    return value & MASK
+
+
+def distance(a, b):
+    return bin(unsigned(a) ^ unsigned(b)).count("1")
+
+
+def probes(value, max_distance):
+    """
+    [(band position, {band values}), ...] to look value up by: its
+    informative bands, each widened to the radius the guarantee needs. []
+    for a hash without any, match it on the whole hash instead.
+    """
+    informative = [(i, band) for i, band in enumerate(bands(unsigned(value))) if band not in FLAT_BANDS]
+    if not informative:
+        return []
+    radius = max_distance // len(informative)
+    return [(i, _within(band, radius) - set(FLAT_BANDS)) for i, band in informative]
+
+
+def _within(band, radius):
+    """Every 16-bit value within radius bits of band"""
+    values = {band}
+    for flips in range(1, radius + 1):
+        for bits in itertools.combinations(range(16), flips):
+            values.add(band ^ sum(1 << bit for bit in bits))
+    return values
+
+
+def find_matches(hashes, max_distance=None, exclude=()):
+    """
+    {hash: [(wallpaper, distance), ...]} for every hash with a stored
+    near-duplicate, closest first. One query for the whole list.
+    """
+    max_distance = settings.DUPLICATE_MAX_DISTANCE if max_distance is None else max_distance
+    hashes = [h for h in hashes if h is not None]
+    if not hashes:
+        return {}
+
+    lookup, by_band = Q(), defaultdict(set)
+    for h in hashes:
+        found = probes(h, max_distance)
+        for i, values in found:
+            by_band[i] |= values
+        if not found:
+            lookup |= Q(**dict(zip(BAND_FIELDS, bands(unsigned(h)))))
+    for i, values in by_band.items():
+        lookup |= Q(**{f"{BAND_FIELDS[i]}__in": values})
+    candidates = list(
+        Wallpaper.objects.filter(lookup).exclude(pk__in=exclude)
+        .only("id", "slug", "title", "phash", "size_bytes")
+    )
+
+    matches = {}
+    for h in hashes:
+        found = sorted(
+            ((wp, distance(h, wp.phash)) for wp in candidates if wp.phash is not None),
+            key=lambda item: item[1]
+        )
+        found = [(wp, d) for wp, d in found if d <= max_distance]
+        if found:
+            matches[h] = found
+    return matches
+
+
+class BandIndex:
+    """The same band lookup in memory, for checking a batch against itself"""
+
+    def __init__(self, max_distance=None):
+        self.max_distance = settings.DUPLICATE_MAX_DISTANCE if max_distance is None else max_distance
+        self._buckets = defaultdict(list)
+
+    def add(self, value, obj):
+        keys = [(i, band) for i, band in enumerate(bands(unsigned(value))) if band not in FLAT_BANDS]
+        for key in keys or [("hash", unsigned(value))]:
+            self._buckets[key].append((value, obj))
+
+    def find(self, value):
+        """Objects added with a hash within max_distance of value"""
+        found, seen = [], set()
+        keys = [(i, band) for i, values in probes(value, self.max_distance) for band in values]
+        for key in keys or [("hash", unsigned(value))]:
+            for other, obj in self._buckets.get(key, ()):
+                if id(obj) not in seen and distance(value, other) <= self.max_distance:
+                    seen.add(id(obj))
+                    found.append(obj)
+        return found
+
+
+def clusters(max_distance=None):
+    """Groups of near-identical wallpaper ids across the whole library, largest first"""
+    index = BandIndex(max_distance)
+    parent = {}
+
+    def find(pk):
+        while parent[pk] != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    rows = Wallpaper.objects.filter(phash__isnull=False).values_list("id", "phash")
+    for pk, value in rows.iterator(chunk_size=5000):
+        parent[pk] = pk
+        for other in index.find(value):
+            parent[find(other)] = find(pk)
+        index.add(value, pk)
+
+    groups = defaultdict(list)
+    for pk in parent:
+        groups[find(pk)].append(pk)
+    return sorted((g for g in groups.values() if len(g) > 1), key=len, reverse=True)
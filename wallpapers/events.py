@@ -0,0 +1,222 @@
+"""
+View and download event log, and its hourly and daily rollups.
+
+counters.record() queues an Event (kind, download preset, device class)
+next to the counter increment, and its flush bulk-inserts them off the
+request path. ``manage.py compact_events`` (run hourly) calls compact():
+
+* raw events of every complete hour are counted into hourly EventRollup
+  rows, once an hour has been over for EVENT_COMPACT_GRACE seconds (longer
+  than a counter flush takes to arrive);
+* hourly rows of every complete day are summed into daily rows;
+* raw events older than EVENT_RETENTION_DAYS, and hourly rows older than
+  EVENT_HOURLY_RETENTION_DAYS, are deleted. Daily rows are kept.
+
+Where compaction got to is read back from the rollups themselves: the hour
+after the newest hourly bucket, the day after the newest daily one (also
+for hours, once their hourly rows are pruned). Hours and days that had no
+events leave no row and are simply looked at again.
+Events that arrive after their hour was rolled up are not counted.
+
+Charts and per-wallpaper stats read the rollups only (series(), below):
+daily rows, plus hourly rows for the days not rolled up yet, so they lag
+the raw log by up to an hour.
+"""
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import Event, EventRollup, Wallpaper
+
+MOBILE_RE = re.compile(r"Mobi|Android|iPhone|iPad|iPod", re.IGNORECASE)
+
+GROUP_FIELDS = ("wallpaper_id", "kind", "res", "device")
+# raw events counted per query, in whole hours
+COMPACT_WINDOW = timedelta(days=1)
+PRUNE_BATCH = 10000
+
+# admin chart series, one per value
+CHART_COLORS = ["#417690", "#e0a800", "#79aec8", "#ba2121", "#5b8a3c", "#9b59b6", "#999999"]
+
+UTC = dt_timezone.utc
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+def client_device(request):
+    """pc or mobile, the same classes as Wallpaper.device"""
+    return "mobile" if MOBILE_RE.search(request.headers.get("User-Agent", "")) else "pc"
+
+
+def floor_hour(when):
+    return when.astimezone(UTC).replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(when):
+    return floor_hour(when).replace(hour=0)
+
+
+def hourly_until():
+    """Start of the first hour not rolled up yet, None before the first compaction"""
+    latest = EventRollup.objects.filter(period=EventRollup.HOUR).aggregate(latest=Max("bucket"))["latest"]
+    # hourly rows can be pruned before the raw events, days rolled up stay done
+    return max(filter(None, (latest + HOUR if latest else None, daily_until())), default=None)
+
+
+def daily_until():
+    latest = EventRollup.objects.filter(period=EventRollup.DAY).aggregate(latest=Max("bucket"))["latest"]
+    return latest + DAY if latest else None
+
+
+def compact(now=None):
+    """Roll up what is due and prune what is old, returns counts of what was done"""
+    now = now or timezone.now()
+    cutoff = floor_hour(now - timedelta(seconds=settings.EVENT_COMPACT_GRACE))
+    done = {"hourly": 0, "daily": 0, "events_pruned": 0, "hourly_pruned": 0}
+
+    start = hourly_until()
+    if start is None:
+        first = Event.objects.aggregate(first=Min("created_at"))["first"]
+        start = floor_hour(first) if first else cutoff
+    while start < cutoff:
+        end = min(start + COMPACT_WINDOW, cutoff)
+        done["hourly"] += _roll_up_events(start, end)
+        start = end
+
+    # every hour before cutoff is rolled up now, so are the days before it
+    compacted = cutoff
+    day = daily_until()
+    if day is None:
+        first = EventRollup.objects.filter(period=EventRollup.HOUR).aggregate(first=Min("bucket"))["first"]
+        day = floor_day(first) if first else floor_day(compacted)
+    while day + DAY <= floor_day(compacted):
+        done["daily"] += _roll_up_hours(day)
+        day += DAY
+
+    # raw events only once they are rolled up
+    keep_from = min(now - timedelta(days=settings.EVENT_RETENTION_DAYS), compacted)
+    done["events_pruned"] = _prune(Event.objects.filter(created_at__lt=keep_from))
+    hourly_from = min(now - timedelta(days=settings.EVENT_HOURLY_RETENTION_DAYS), daily_until() or compacted)
+    done["hourly_pruned"] = _prune(
+        EventRollup.objects.filter(period=EventRollup.HOUR, bucket__lt=hourly_from)
+    )
+    return done
+
+
+def _roll_up_events(start, end):
+    rows = (
+        Event.objects.filter(created_at__gte=start, created_at__lt=end)
+        # the log keeps events of deleted wallpapers, the rollups can't
+        .filter(wallpaper_id__in=Wallpaper.objects.values("id"))
+        .annotate(hour=TruncHour("created_at", tzinfo=UTC))
+        .values("hour", *GROUP_FIELDS)
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    rollups = [
+        EventRollup(period=EventRollup.HOUR, bucket=row["hour"], count=row["n"], **{f: row[f] for f in GROUP_FIELDS})
+        for row in rows
+    ]
+    with transaction.atomic():
+        EventRollup.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
+
+
+def _roll_up_hours(day):
+    rows = (
+        EventRollup.objects.filter(period=EventRollup.HOUR, bucket__gte=day, bucket__lt=day + DAY)
+        .values(*GROUP_FIELDS)
+        .annotate(n=Sum("count"))
+        .order_by()
+    )
+    rollups = [
+        EventRollup(period=EventRollup.DAY, bucket=day, count=row["n"], **{f: row[f] for f in GROUP_FIELDS})
+        for row in rows
+    ]
+    with transaction.atomic():
+        EventRollup.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
+
+
+def _prune(qs):
+    """Delete qs in batches so no single statement holds locks for long"""
+    deleted = 0
+    while True:
+        pks = list(qs.values_list("pk", flat=True)[:PRUNE_BATCH])
+        if not pks:
+            return deleted
+        deleted += qs.model.objects.filter(pk__in=pks).delete()[0]
+
+
+def series(days, by=(), **filters):
+    """
+    {(day, *by values): count} over the last days days, from daily rollups
+    and, for days not rolled up yet, hourly ones. filters apply to both
+    (wallpaper_id=..., kind=...).
+    """
+    since = floor_day(timezone.now()) - (days - 1) * DAY
+    until = daily_until() or since
+    totals = defaultdict(int)
+
+    daily = (
+        EventRollup.objects.filter(period=EventRollup.DAY, bucket__gte=since, **filters)
+        .values("bucket", *by)
+        .annotate(n=Sum("count"))
+        .order_by()
+    )
+    for row in daily:
+        totals[(row["bucket"].date(), *(row[f] for f in by))] += row["n"]
+
+    hourly = (
+        EventRollup.objects.filter(period=EventRollup.HOUR, bucket__gte=max(since, until), **filters)
+        .annotate(day=TruncDay("bucket", tzinfo=UTC))
+        .values("day", *by)
+        .annotate(n=Sum("count"))
+        .order_by()
+    )
+    for row in hourly:
+        day = row["day"].date() if isinstance(row["day"], datetime) else row["day"]
+        totals[(day, *(row[f] for f in by))] += row["n"]
+    return dict(totals)
+
+
+def day_range(days):
+    """The dates series() covers, oldest first"""
+    today = floor_day(timezone.now()).date()
+    return [today - timedelta(days=n) for n in range(days - 1, -1, -1)]
+
+
+def breakdown(days, field, **filters):
+    """[(value of field, count), ...] over the last days days, largest first"""
+    totals = defaultdict(int)
+    for (_, value), count in series(days, by=(field,), **filters).items():
+        totals[value] += count
+    return sorted(totals.items(), key=lambda item: -item[1])
+
+
+def chart(days, by="kind", **filters):
+    """
+    Stacked daily bars: [(date, total, [(value, count, percent of the
+    busiest day, colour), ...]), ...] and the legend [(value, total, colour)].
+    """
+    totals = series(days, by=(by,), **filters)
+    legend = [
+        (value, total, CHART_COLORS[i % len(CHART_COLORS)])
+        for i, (value, total) in enumerate(breakdown(days, by, **filters))
+    ]
+    days_totals = {day: sum(totals.get((day, value), 0) for value, _, _ in legend) for day in day_range(days)}
+    peak = max(days_totals.values(), default=0) or 1
+    rows = []
+    for day, total in days_totals.items():
+        segments = []
+        for value, _, colour in legend:
+            count = totals.get((day, value), 0)
+            segments.append((value, count, round(100 * count / peak, 1), colour))
+        rows.append((day, total, segments))
+    return rows, legend
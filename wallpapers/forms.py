@@ -1,5 +1,6 @@
 from django import forms
 from django.core.validators import FileExtensionValidator
+from .models import Wallpaper
 
 class UploadForm(forms.Form):
     title = forms.CharField(
@@ -41,3 +42,37 @@ class UploadForm(forms.Form):
         return file
 
 
+
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleImageField(forms.ImageField):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("widget", MultipleFileInput(attrs={'accept': 'image/jpeg, image/png, image/webp'}))
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(d, initial) for d in data]
+        return [single_file_clean(data, initial)]
+
+
+class BulkUploadForm(forms.Form):
+    files = MultipleImageField(
+        validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp'])],
+        help_text="Titles are taken from the file names"
+    )
+    category = forms.ChoiceField(choices=Wallpaper.CATEGORY_CHOICES)
+    device = forms.ChoiceField(choices=Wallpaper.DEVICE_CHOICES)
+    tags = forms.CharField(max_length=255, required=False, help_text="Comma-separated, applied to every file")
+    featured = forms.BooleanField(required=False)
+
+    def clean_files(self):
+        files = self.cleaned_data['files']
+        for f in files:
+            if f.size > 20 * 1024 * 1024:  # 20MB limit
+                raise forms.ValidationError(f"{f.name}: file size must be less than 20MB")
+        return files
@@ -0,0 +1,121 @@
+"""
+HTTP caching for the public pages.
+
+cache_policy() wraps a view so anonymous GETs get validators and shared
+cache headers:
+
+* an ETag (and Last-Modified where known) from cheap inputs: the library
+  generation and the time it was last bumped (caching.py), plus
+  ``Wallpaper.updated_at`` and the related and trending generations on
+  the detail page. If-None-Match / If-Modified-Since are checked *before* the view
+  runs, so a revalidation is a cache read (and one indexed lookup on the
+  detail page) answered with a 304, nothing is queried or rendered.
+* ``Cache-Control: public, max-age, s-maxage, stale-while-revalidate``, so a
+  CDN in front answers most anonymous traffic itself and refreshes in the
+  background.
+
+Requests carrying a session cookie (staff) get private, uncacheable
+responses and skip the 304 shortcut. That is decided from the cookie alone,
+the session itself is never loaded for a public page.
+
+``?sort=downloads`` pages revalidate against the counts generation, so
+their order lags the counters by at most COUNTS_GENERATION_INTERVAL.
+Counts shown elsewhere can lag until the next library change.
+Pages served from a cache never reach the view, so the detail page counts
+views with a beacon (views.count_view) rather than in detail().
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import add_never_cache_headers, get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import caching
+from .models import Wallpaper
+
+# about, privacy, terms and robots.txt only change with a deploy
+STATIC_MAX_AGE = 60 * 60
+STATIC_S_MAXAGE = 60 * 60 * 24
+
+
+def cache_policy(validators=None, max_age=None, s_maxage=None, stale_while_revalidate=None):
+    """
+    validators(request, *args, **kwargs) returns (etag, last_modified), or
+    None when there is nothing to validate against (the view then runs as
+    usual, e.g. to 404).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+
+            if settings.SESSION_COOKIE_NAME in request.COOKIES:
+                response = view(request, *args, **kwargs)
+                add_never_cache_headers(response)
+                patch_cache_control(response, private=True)
+                return response
+
+            etag = last_modified = None
+            found = validators(request, *args, **kwargs) if validators else None
+            if found:
+                etag, last_modified = found
+                # weak, the same page can differ in ways that don't matter (counts)
+                etag = f'W/"{etag}"' if etag else None
+                timestamp = int(last_modified.timestamp()) if last_modified else None
+                response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+            else:
+                response = view(request, *args, **kwargs)
+
+            if response.status_code not in (200, 304):
+                return response
+            if etag and not response.has_header("ETag"):
+                response.headers["ETag"] = etag
+            if last_modified and not response.has_header("Last-Modified"):
+                response.headers["Last-Modified"] = http_date(last_modified.timestamp())
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=settings.HTTP_CACHE_MAX_AGE if max_age is None else max_age,
+                s_maxage=settings.HTTP_CACHE_S_MAXAGE if s_maxage is None else s_maxage,
+                stale_while_revalidate=(
+                    settings.HTTP_CACHE_STALE_WHILE_REVALIDATE
+                    if stale_while_revalidate is None else stale_while_revalidate
+                ),
+            )
+            return response
+        return wrapper
+    return decorator
+
+
+def library_validators(request, *args, **kwargs):
+    """Listing pages change with the library, and the trending and download sorts with their scores"""
+    sort = request.GET.get("sort", "").strip()
+    scores = caching.sort_generation(sort)
+    if scores is not None:
+        # rescored without a library change, so no Last-Modified to go by
+        return f"g{caching.get_generation()}-{sort}{scores}", None
+    return f"g{caching.get_generation()}", caching.changed_at()
+
+
+def wallpaper_validators(request, slug):
+    """
+    The wallpaper's own updated_at, plus what the related strip follows:
+    the library, the stored neighbours and the trending scores that rerank them
+    """
+    updated_at = Wallpaper.objects.filter(slug=slug).values_list("updated_at", flat=True).first()
+    if updated_at is None:
+        return None
+    keys = (caching.GENERATION_KEY, caching.RELATED_GENERATION_KEY, caching.TRENDING_GENERATION_KEY)
+    generations = "-".join(str(caching.get_generation(key)) for key in keys)
+    # unknown once the cache lost one of them (or it never moved), the ETag still validates
+    changed = [caching.changed_at(key) for key in keys]
+    last_modified = None if None in changed else max(updated_at, *changed)
+    return f"g{generations}-{int(updated_at.timestamp())}", last_modified
+
+
+def static_page(view):
+    """cache_policy() for pages that only change with a deploy"""
+    return cache_policy(max_age=STATIC_MAX_AGE, s_maxage=STATIC_S_MAXAGE)(view)
@@ -0,0 +1,149 @@
+"""
+Responsive thumbnails and blur-up placeholders for the wallpaper grids.
+
+At upload every wallpaper gets width-stepped Cloudinary URLs (THUMBNAIL_WIDTHS)
+in AVIF and WebP, stored in ``Wallpaper.thumbnails`` and rendered as
+``<picture>`` sources with ``srcset``/``sizes``, so the browser picks the
+smallest file that fills the slot instead of everyone downloading the
+same 600/1000px preview. ``Wallpaper.placeholder`` is a tiny inline WebP
+(a few hundred bytes as a data URI) drawn behind the image until it loads.
+
+dhash() is the perceptual hash duplicates.py matches uploads against, and
+palette() the dominant colours colors.py indexes for the colour filter.
+"""
+import base64
+import io
+import logging
+
+from PIL import Image
+from cloudinary.utils import cloudinary_url
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (240, 480, 960, 1440)
+THUMBNAIL_FORMATS = ("avif", "webp")
+
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 40
+# small Cloudinary rendition fetched when the original bytes aren't at hand
+PLACEHOLDER_SOURCE_WIDTH = 64
+
+# palette(): colours kept and the size of the copy median cut runs on
+PALETTE_COLORS = 5
+PALETTE_SAMPLE = 64
+
+# dhash() compares HASH_SIZE + 1 columns per row, giving HASH_SIZE**2 bits
+HASH_SIZE = 8
+
+# slot widths of the grid columns in home.html and the detail page's related strip
+GRID_SIZES = "(min-width: 1024px) 25vw, (min-width: 768px) 33vw, (min-width: 640px) 50vw, 100vw"
+RELATED_SIZES = "(min-width: 1024px) 25vw, (min-width: 640px) 33vw, 50vw"
+
+
+def thumbnail_urls(public_id, width=None):
+    """{format: {width: url}} for every thumbnail step up to the image width"""
+    widths = [w for w in THUMBNAIL_WIDTHS if not width or w <= width] or [THUMBNAIL_WIDTHS[0]]
+    urls = {}
+    for fmt in THUMBNAIL_FORMATS:
+        urls[fmt] = {}
+        for w in widths:
+            urls[fmt][str(w)], _ = cloudinary_url(
+                public_id,
+                transformation=[{"width": w, "crop": "limit", "quality": "auto"}],
+                format=fmt,
+                secure=True
+            )
+    return urls
+
+
+def srcset(thumbnails, fmt):
+    """The srcset attribute value for one format"""
+    return ", ".join(f"{url} {w}w" for w, url in sorted(
+        thumbnails.get(fmt, {}).items(), key=lambda item: int(item[0])
+    ))
+
+
+def placeholder(fileobj):
+    """A PLACEHOLDER_SIZE px WebP data URI of the image, or "" if it can't be read"""
+    try:
+        fileobj.seek(0)
+        with Image.open(fileobj) as img:
+            # JPEGs decode straight at 1/8 scale, the full image is never built
+            img.draft("RGB", (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+            img = img.convert("RGB")
+            img.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+            out = io.BytesIO()
+            img.save(out, "WEBP", quality=PLACEHOLDER_QUALITY)
+    except Exception as e:
+        logger.warning("Pillow error building placeholder: %s", e)
+        return ""
+    finally:
+        fileobj.seek(0)
+    return "data:image/webp;base64," + base64.b64encode(out.getvalue()).decode()
+
+
+def fetch_rendition(public_id):
+    """A small JPEG rendition as a file object, for wallpapers uploaded earlier"""
+    from . import upstream
+
+    url, _ = cloudinary_url(
+        public_id,
+        transformation=[{"width": PLACEHOLDER_SOURCE_WIDTH, "crop": "limit"}],
+        format="jpg",
+        secure=True
+    )
+    r = upstream.get_session().get(url, timeout=upstream.get_timeouts())
+    r.raise_for_status()
+    return io.BytesIO(r.content)
+
+
+def dhash(fileobj):
+    """64-bit difference hash: one bit per horizontal gradient of a 9x8 greyscale copy"""
+    try:
+        fileobj.seek(0)
+        with Image.open(fileobj) as img:
+            img.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+            small = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    except Exception as e:
+        logger.warning("Pillow error hashing image: %s", e)
+        return None
+    finally:
+        fileobj.seek(0)
+
+    pixels = small.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+def palette(fileobj, colors=PALETTE_COLORS):
+    """
+    Dominant colours by median cut on a PALETTE_SAMPLE px copy, as
+    [(hex, percent), ...] most common first.
+    """
+    try:
+        fileobj.seek(0)
+        with Image.open(fileobj) as img:
+            img.draft("RGB", (PALETTE_SAMPLE, PALETTE_SAMPLE))
+            small = img.convert("RGB")
+            small.thumbnail((PALETTE_SAMPLE, PALETTE_SAMPLE))
+    except Exception as e:
+        logger.warning("Pillow error extracting palette: %s", e)
+        return []
+    finally:
+        fileobj.seek(0)
+
+    quantized = small.quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+    rgb = quantized.getpalette()
+    counts = sorted(quantized.getcolors(), reverse=True)
+    total = sum(count for count, _ in counts)
+    result = []
+    for count, index in counts:
+        r, g, b = rgb[index * 3:index * 3 + 3]
+        percent = round(100 * count / total)
+        if percent:
+            result.append((f"{r:02x}{g:02x}{b:02x}", percent))
+    return result
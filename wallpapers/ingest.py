@@ -0,0 +1,428 @@
+"""
+Batch ingest: upload many images and create their Wallpaper rows at once.
+
+Used by the admin multi-file upload and ``manage.py ingest <dir>``. Each file
+gets its dimensions from a header-only Pillow read and its placeholder and
+perceptual hash from a reduced-scale decode, is screened for duplicates
+(DUPLICATE_POLICY), then uploaded on a bounded thread pool. The resulting
+rows are written with bulk_create followed by signals.wallpapers_created().
+A file that fails is reported and skipped, it doesn't stop the batch.
+
+The uploader is pluggable (WALLPAPER_UPLOADER, a dotted path) so the
+pipeline can run against FakeUploader without touching Cloudinary.
+
+The upload page runs the same pipeline in the background: enqueue_upload()
+spools the file to JOB_SPOOL_DIR and queues an "ingest" job keyed on its
+SHA-256, and run_job() is that job's handler (see jobs.py). The job uploads
+to a public_id derived from the SHA-256 too, so a job run again (requeued
+after JOB_LOCK_TIMEOUT, or after a crash past the insert) finds its
+wallpaper and returns it rather than uploading and creating it twice.
+"""
+import hashlib
+import logging
+import os
+import time
+import uuid
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PIL import Image
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.module_loading import import_string
+
+from .models import Wallpaper
+from . import duplicates, images, metrics, slugs
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+BULK_BATCH_SIZE = 500
+
+
+class CloudinaryUploader:
+    def upload(self, fileobj, title, public_id=None):
+        import cloudinary.uploader
+
+        # a given public_id is kept, uploading it again returns the existing asset
+        target = {"public_id": public_id, "overwrite": False} if public_id else {"folder": "wallpapers"}
+        with metrics.timed("upload"):
+            return cloudinary.uploader.upload(
+                fileobj,
+                resource_type="image",
+                **target,
+                context={
+                    "site_name": "WallPortal",
+                    "author": "Sreerag A",
+                    "url": f"https://wallportal.onrender.com/wallpapers/{title.replace(' ', '-').lower()}/"
+                }
+            )
+
+    def preview_url(self, public_id, device):
+        from cloudinary.utils import cloudinary_url
+
+        preview_size = {"width": 600, "height": 600, "crop": "limit"}
+        if device == "mobile":
+            preview_size = {"width": 1000, "height": 1000, "crop": "limit"}
+        url, _ = cloudinary_url(
+            public_id,
+            transformation=[preview_size, {"quality": "auto:low", "fetch_format": "auto"}],
+            secure=True
+        )
+        return url
+
+    def delete(self, public_id):
+        import cloudinary.uploader
+
+        with metrics.timed("delete"):
+            cloudinary.uploader.destroy(public_id, resource_type="image")
+
+
+class FakeUploader:
+    """Answers like Cloudinary without any network, for local runs and benchmarks"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def upload(self, fileobj, title, public_id=None):
+        size = 0
+        for chunk in iter(lambda: fileobj.read(64 * 1024), b""):
+            size += len(chunk)
+        if self.delay:
+            time.sleep(self.delay)
+        public_id = public_id or f"wallpapers/fake-{uuid.uuid4().hex[:12]}"
+        return {
+            "public_id": public_id,
+            "secure_url": f"https://res.cloudinary.com/demo/image/upload/{public_id}.jpg",
+            "bytes": size,
+            "format": "jpg",
+        }
+
+    def preview_url(self, public_id, device):
+        return f"https://res.cloudinary.com/demo/image/upload/c_limit,w_600/{public_id}.jpg"
+
+    def delete(self, public_id):
+        pass
+
+
+class IngestItem:
+    """
+    One file to ingest plus the metadata its Wallpaper row gets. source is a
+    path (opened only while it is read) or an open binary file.
+    """
+
+    def __init__(self, name, source, title, category="", device="pc", tags="", featured=False, public_id=None):
+        self.name = name
+        self.source = source
+        self.title = title
+        self.category = category
+        self.device = device
+        self.tags = tags
+        self.featured = featured
+        # None lets the uploader pick one
+        self.public_id = public_id
+        # filled by read_features()
+        self.width = self.height = self.phash = None
+        self.placeholder = ""
+        self.palette = []
+
+
+class IngestResult:
+    def __init__(self):
+        self.created = []
+        self.failed = []
+        # (name, message) for files created despite a suspected duplicate
+        self.warnings = []
+        # names in failed that may well work on another try (upload errors)
+        self.retryable = []
+
+    def __bool__(self):
+        return bool(self.created)
+
+
+def _open(source):
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "rb")
+    source.seek(0)
+    return nullcontext(source)
+
+
+def get_uploader():
+    return import_string(settings.WALLPAPER_UPLOADER)()
+
+
+def title_from_filename(name):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return " ".join(stem.replace("_", " ").replace("-", " ").split()).title() or "Wallpaper"
+
+
+def read_features(item):
+    """
+    Fill item.width/height from the image header, then its placeholder,
+    perceptual hash and palette from reduced-scale decodes. False if it
+    isn't an image.
+    """
+    try:
+        with _open(item.source) as fileobj:
+            with Image.open(fileobj) as img:
+                item.width, item.height = img.size
+            item.placeholder = images.placeholder(fileobj)
+            item.phash = images.dhash(fileobj)
+            item.palette = images.palette(fileobj)
+    except Exception as e:
+        logger.warning("Pillow error reading %s: %s", item.name, e)
+        return False
+    return True
+
+
+def _upload(uploader, item):
+    with _open(item.source) as fileobj:
+        return uploader.upload(fileobj, item.title, public_id=item.public_id)
+
+
+def ingest(items, uploader=None, workers=None, progress=None):
+    """
+    Upload items in parallel and create their wallpapers. progress, if given,
+    is called as progress(item, error) once per file as it finishes.
+    """
+    uploader = uploader or get_uploader()
+    workers = workers or settings.INGEST_WORKERS
+    result = IngestResult()
+
+    def report(item, error=None, retryable=False):
+        if error is not None:
+            result.failed.append((item.name, error))
+            if retryable:
+                result.retryable.append(item.name)
+        if progress:
+            progress(item, error)
+
+    pending = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest") as pool:
+        items = list(items)
+        readable = []
+        for item, ok in zip(items, pool.map(read_features, items)):
+            if ok:
+                readable.append(item)
+            else:
+                report(item, "not a readable image")
+
+        futures = {
+            pool.submit(_upload, uploader, item): item
+            for item in _screen_duplicates(readable, result, report)
+        }
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                uploaded = future.result()
+            except Exception as e:
+                report(item, f"upload failed: {e}", retryable=True)
+                continue
+            pending.append((item, _build_wallpaper(item, uploaded, uploader)))
+
+    for start in range(0, len(pending), BULK_BATCH_SIZE):
+        _commit(pending[start:start + BULK_BATCH_SIZE], uploader, result, report)
+
+    if result.created:
+        from .signals import wallpapers_created
+
+        wallpapers_created(result.created)
+    return result
+
+
+def _screen_duplicates(items, result, report):
+    """Apply DUPLICATE_POLICY against the library and the rest of the batch"""
+    if settings.DUPLICATE_POLICY == "off":
+        return items
+
+    matches = duplicates.find_matches([item.phash for item in items])
+    batch_index = duplicates.BandIndex()
+    accepted = []
+    for item in items:
+        if item.phash is None:
+            accepted.append(item)
+            continue
+        found = [wp.slug for wp, _ in matches.get(item.phash, [])]
+        found += [other.name for other in batch_index.find(item.phash)]
+        if found:
+            message = f"looks like a duplicate of {', '.join(found[:3])}"
+            if settings.DUPLICATE_POLICY == "block":
+                report(item, message)
+                continue
+            result.warnings.append((item.name, message))
+        batch_index.add(item.phash, item)
+        accepted.append(item)
+    return accepted
+
+
+def _build_wallpaper(item, uploaded, uploader):
+    public_id = uploaded["public_id"]
+    wp = Wallpaper(
+        title=item.title,
+        category=item.category,
+        drive_file_id=public_id,
+        view_link=uploader.preview_url(public_id, item.device),
+        download_link=uploaded["secure_url"],
+        mime_type=f"image/{uploaded.get('format', '')}",
+        width=uploaded.get("width") or item.width,
+        height=uploaded.get("height") or item.height,
+        device=item.device,
+        is_featured=item.featured,
+        tags=item.tags,
+        size_bytes=uploaded.get("bytes", 0),
+        placeholder=item.placeholder,
+    )
+    wp.set_phash(item.phash)
+    wp.set_palette(item.palette)
+    # bulk_create() skips save(), fill in what it would have derived
+    wp.set_dimension_fields()
+    wp.download_urls = wp.build_download_urls()
+    wp.thumbnails = images.thumbnail_urls(public_id, wp.width)
+    return wp
+
+
+def _commit(batch, uploader, result, report):
+    wallpapers = [wp for _, wp in batch]
+    slugs.assign_slugs(wallpapers)
+    try:
+        with transaction.atomic():
+            Wallpaper.objects.bulk_create(wallpapers)
+    except IntegrityError:
+        # a slug set by hand clashed with a reserved one, or a duplicate
+        # file id: insert one by one to find the offending rows
+        for item, wp in batch:
+            try:
+                _insert_one(wp)
+            except IntegrityError as e:
+                existing = Wallpaper.objects.filter(drive_file_id=wp.drive_file_id).first()
+                if existing:
+                    # the same asset, inserted by another run: it isn't ours to delete
+                    report(item, f"already uploaded as {existing.slug}")
+                    continue
+                _discard(uploader, wp)
+                report(item, f"database error: {e}")
+                continue
+            result.created.append(wp)
+            report(item)
+        return
+
+    result.created.extend(wallpapers)
+    for item, _ in batch:
+        report(item)
+
+
+def _insert_one(wp):
+    for attempt in range(slugs.MAX_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                Wallpaper.objects.bulk_create([wp])
+            return
+        except IntegrityError:
+            if attempt == slugs.MAX_ATTEMPTS - 1 or not Wallpaper.objects.filter(slug=wp.slug).exists():
+                raise
+            wp.slug = ""
+            slugs.assign_slugs([wp])
+
+
+def _discard(uploader, wp):
+    # don't leave an orphaned asset behind for a row that was never written
+    try:
+        uploader.delete(wp.drive_file_id)
+    except Exception as e:
+        logger.warning("Cloudinary delete error: %s", e)
+
+
+def spool(fileobj):
+    """Copy an uploaded file into JOB_SPOOL_DIR, returns (path, sha256 hex)"""
+    os.makedirs(settings.JOB_SPOOL_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    path = os.path.join(settings.JOB_SPOOL_DIR, f"{uuid.uuid4().hex}{os.path.splitext(fileobj.name)[1].lower()}")
+    with open(path, "wb") as out:
+        for chunk in fileobj.chunks():
+            digest.update(chunk)
+            out.write(chunk)
+    return path, digest.hexdigest()
+
+
+def enqueue_upload(fileobj, title, category="", device="pc", tags="", featured=False):
+    """
+    Spool fileobj and queue its ingest, returns (job, created). The same
+    bytes uploaded again get the existing job back, or re-run it if it failed.
+    """
+    from . import jobs
+    from .models import Job
+
+    path, digest = spool(fileobj)
+    payload = {
+        "path": path,
+        "sha256": digest,
+        "name": fileobj.name,
+        "title": title,
+        "category": category,
+        "device": device,
+        "tags": tags,
+        "featured": featured,
+    }
+    job, created = jobs.enqueue("ingest", payload, key=f"ingest:{digest}")
+    if not created:
+        if job.status == Job.FAILED:
+            # a failed upload keeps its file for an admin retry, this one replaces it
+            stale = job.payload.get("path")
+            jobs.retry(job, payload)
+            if stale and stale != path and os.path.exists(stale):
+                os.remove(stale)
+        else:
+            os.remove(path)
+    return job, created
+
+
+def run_job(job):
+    """Handler of "ingest" jobs: upload one spooled file and create its wallpaper"""
+    from .jobs import PermanentError
+
+    payload = job.payload
+    # jobs queued before the digest was in the payload upload as they used to
+    public_id = f"wallpapers/{payload['sha256']}" if payload.get("sha256") else None
+    existing = _uploaded(public_id)
+    if existing:
+        _remove_spooled(payload["path"])
+        return _job_result(existing)
+    if not os.path.exists(payload["path"]):
+        raise PermanentError("the uploaded file is gone from the spool")
+
+    item = IngestItem(
+        name=payload["name"],
+        source=payload["path"],
+        title=payload["title"],
+        category=payload["category"],
+        device=payload["device"],
+        tags=payload["tags"],
+        featured=payload["featured"],
+        public_id=public_id,
+    )
+    result = ingest([item], workers=1)
+    if result.failed and result.retryable:
+        # keep the file for the next attempt
+        raise RuntimeError(result.failed[0][1])
+
+    _remove_spooled(payload["path"])
+    if result.failed:
+        # another run of this job may have inserted it first
+        existing = _uploaded(public_id)
+        if existing:
+            return _job_result(existing)
+        raise PermanentError(result.failed[0][1])
+    return _job_result(result.created[0], [message for _, message in result.warnings])
+
+
+def _uploaded(public_id):
+    return Wallpaper.objects.filter(drive_file_id=public_id).first() if public_id else None
+
+
+def _remove_spooled(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _job_result(wp, warnings=()):
+    return {"slug": wp.slug, "title": wp.title, "warnings": list(warnings)}
@@ -0,0 +1,193 @@
+"""
+Database-backed background jobs.
+
+enqueue() writes a Job row; ``manage.py runworker`` claims due rows and runs
+the handler registered for their kind (HANDLERS, dotted paths) on a bounded
+thread pool. No broker is needed, and it runs the same on SQLite locally.
+
+* Claiming is an ``UPDATE ... WHERE id = ? AND status = 'queued'``: whichever
+  worker's update touches the row owns it, so several workers can poll the
+  same table without locks that SQLite doesn't have.
+* A handler that raises is retried with exponential backoff (run_after)
+  until max_attempts; raising PermanentError fails the job at once.
+* A job whose key is already taken isn't enqueued again, the existing job
+  is returned instead (uploads use the file's SHA-256).
+* Jobs left running by a worker that died are requeued after
+  JOB_LOCK_TIMEOUT.
+"""
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+HANDLERS = {
+    "ingest": "wallpapers.ingest.run_job",
+}
+
+# longest wait between two attempts, whatever the backoff works out to
+MAX_BACKOFF = 60 * 60
+
+
+class PermanentError(Exception):
+    """Raised by a handler when retrying can't help (bad input, duplicate, ...)"""
+
+
+def enqueue(kind, payload, key=None, max_attempts=None):
+    """(job, created). With a key, an existing job for it is returned instead."""
+    if kind not in HANDLERS:
+        raise ValueError(f"No job handler for {kind!r}")
+    fields = {
+        "kind": kind,
+        "payload": payload,
+        "max_attempts": max_attempts or settings.JOB_MAX_ATTEMPTS,
+        "run_after": timezone.now(),
+    }
+    if key is None:
+        return Job.objects.create(**fields), True
+    try:
+        with transaction.atomic():
+            return Job.objects.create(key=key, **fields), True
+    except IntegrityError:
+        return Job.objects.get(key=key), False
+
+
+def retry(job, payload=None):
+    """Queue a failed job again with a fresh set of attempts (and a new payload)"""
+    changes = {"status": Job.QUEUED, "attempts": 0, "run_after": timezone.now(), "last_error": ""}
+    if payload is not None:
+        changes["payload"] = payload
+    Job.objects.filter(pk=job.pk, status=Job.FAILED).update(**changes)
+    job.refresh_from_db()
+
+
+def backoff(attempts):
+    """Seconds to wait after the given number of failed attempts, with jitter"""
+    delay = min(MAX_BACKOFF, settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim(worker_id, limit):
+    """Take up to limit due jobs for worker_id"""
+    now = timezone.now()
+    candidates = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by("run_after", "id")
+    claimed = []
+    for pk in candidates.values_list("id", flat=True)[:limit * 2]:
+        taken = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker_id, locked_at=now
+        )
+        if taken:
+            claimed.append(pk)
+            if len(claimed) >= limit:
+                break
+    return list(Job.objects.filter(pk__in=claimed).order_by("id"))
+
+
+def requeue_stale():
+    """Give jobs of crashed workers back to the queue, returns how many"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.QUEUED, locked_by="", locked_at=None, run_after=timezone.now()
+    )
+
+
+def run(job):
+    """Run one claimed job and record the outcome"""
+    job.attempts += 1
+    try:
+        result = import_string(HANDLERS[job.kind])(job)
+    except Exception as e:
+        permanent = isinstance(e, PermanentError) or job.attempts >= job.max_attempts
+        job.last_error = str(e) if isinstance(e, PermanentError) else traceback.format_exc(limit=5)
+        job.locked_by, job.locked_at = "", None
+        if permanent:
+            job.status, job.finished_at = Job.FAILED, timezone.now()
+        else:
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=backoff(job.attempts))
+        job.save(update_fields=["attempts", "last_error", "status", "finished_at", "run_after", "locked_by", "locked_at"])
+        return False
+
+    job.result = result or {}
+    job.status, job.finished_at = Job.DONE, timezone.now()
+    job.last_error, job.locked_by, job.locked_at = "", "", None
+    job.save(update_fields=["attempts", "result", "status", "finished_at", "last_error", "locked_by", "locked_at"])
+    return True
+
+
+def describe(job):
+    """What the upload page's status poll returns"""
+    return {
+        "id": job.pk,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "retry_at": job.run_after.isoformat() if job.status == Job.QUEUED and job.attempts else None,
+        "error": job.last_error.strip().splitlines()[-1] if job.last_error.strip() else "",
+        "result": job.result,
+    }
+
+
+class Worker:
+    """Polls for due jobs and runs at most concurrency of them at a time"""
+
+    def __init__(self, concurrency=None, poll_interval=None):
+        self.concurrency = concurrency or settings.JOB_WORKER_CONCURRENCY
+        self.poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        self.done = self.failed = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def run(self, once=False):
+        """Work until stop() (or, with once, until the queue is empty)"""
+        last_sweep = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="job") as pool:
+            while not self.stopping.is_set():
+                if time.monotonic() - last_sweep > settings.JOB_LOCK_TIMEOUT / 4:
+                    requeue_stale()
+                    last_sweep = time.monotonic()
+
+                with self._lock:
+                    free = self.concurrency - self._running
+                jobs = claim(self.id, free) if free else []
+                for job in jobs:
+                    with self._lock:
+                        self._running += 1
+                    pool.submit(self._run, job)
+
+                with self._lock:
+                    idle = not jobs and self._running == 0
+                if once and idle:
+                    break
+                if not jobs:
+                    self.stopping.wait(self.poll_interval)
+
+    def _run(self, job):
+        ok = False
+        try:
+            ok = run(job)
+        finally:
+            # pool threads would otherwise each keep a connection open
+            connection.close()
+            with self._lock:
+                self._running -= 1
+                if ok:
+                    self.done += 1
+                else:
+                    self.failed += 1
@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from wallpapers import caching, colors, images
+from wallpapers.models import Wallpaper
+
+
+def extract(row):
+    """Worker process: (pk, palette string or None, error) for one (pk, public id)"""
+    pk, public_id = row
+    try:
+        rendition = images.fetch_rendition(public_id)
+        return pk, " ".join(f"{h}:{p}" for h, p in images.palette(rendition)), None
+    except Exception as e:
+        return pk, None, f"{public_id}: {e}"
+
+
+class Command(BaseCommand):
+    help = "Extract colour palettes and fill the colour index for wallpapers that have none"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Re-extract every wallpaper's palette")
+        parser.add_argument(
+            "--processes", type=int, default=os.cpu_count() or 4,
+            help="Worker processes fetching and quantizing renditions"
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=500,
+            help="Wallpapers in flight at once, bounds memory in both the parent and the workers"
+        )
+
+    def handle(self, *args, **opts):
+        qs = Wallpaper.objects.order_by("id")
+        if not opts["all"]:
+            qs = qs.filter(palette="")
+        rows = qs.values_list("id", "drive_file_id")
+
+        # forked children must not share the parent's database connections
+        connections.close_all()
+        started = time.perf_counter()
+        done = failed = 0
+        # workers are recycled so Pillow/requests memory can't build up
+        with multiprocessing.get_context("fork").Pool(opts["processes"], maxtasksperchild=1000) as pool:
+            chunk = []
+            for row in rows.iterator(chunk_size=opts["chunk_size"]):
+                chunk.append(row)
+                if len(chunk) >= opts["chunk_size"]:
+                    n, errors = self.process(chunk, pool)
+                    done, failed = done + n, failed + errors
+            n, errors = self.process(chunk, pool)
+            done, failed = done + n, failed + errors
+
+        if done:
+            # cached ?color= listings predate the new rows
+            caching.bump_generation()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed colours of {done} wallpapers in {elapsed:.1f}s, {failed} renditions failed"
+        ))
+
+    def process(self, chunk, pool):
+        if not chunk:
+            return 0, 0
+        updated, failed = [], 0
+        for pk, palette, error in pool.imap_unordered(extract, chunk, chunksize=8):
+            if error:
+                self.stderr.write(error)
+                failed += 1
+            else:
+                updated.append(Wallpaper(pk=pk, palette=palette))
+        chunk.clear()
+
+        Wallpaper.objects.bulk_update(updated, ["palette"])
+        colors.sync_colors_bulk(updated)
+        self.stdout.write(f"  {len(updated)} indexed")
+        return len(updated), failed
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from wallpapers import caching
+from wallpapers.models import Wallpaper
+
+FIELDS = ["resolution_label", "resolution_tier", "aspect_ratio", "orientation"]
+
+
+class Command(BaseCommand):
+    help = "Fill resolution tier, aspect ratio and orientation on wallpapers saved before they were stored"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Recompute every wallpaper")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **opts):
+        qs = Wallpaper.objects.filter(width__isnull=False, height__isnull=False).only("id", "width", "height", *FIELDS)
+        if not opts["all"]:
+            qs = qs.filter(orientation="")
+
+        batch, done = [], 0
+        for wp in qs.iterator(chunk_size=opts["batch_size"]):
+            wp.set_dimension_fields()
+            batch.append(wp)
+            if len(batch) >= opts["batch_size"]:
+                done += self.flush(batch)
+        done += self.flush(batch)
+        if done:
+            # ?res= results and cached listings were built before the tiers existed
+            caching.bump_generation()
+            # cards and detail bodies show the label, and updated_at didn't move
+            caching.bump_generation(caching.FRAGMENT_GENERATION_KEY)
+
+        self.stdout.write(self.style.SUCCESS(f"Updated dimension fields for {done} wallpapers"))
+
+    def flush(self, batch):
+        Wallpaper.objects.bulk_update(batch, FIELDS)
+        n = len(batch)
+        batch.clear()
+        return n
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from wallpapers import caching, images
+from wallpapers.models import Wallpaper
+
+HASH_FIELDS = ["phash", "phash_0", "phash_1", "phash_2", "phash_3"]
+
+
+class Command(BaseCommand):
+    help = "Store thumbnail URLs, blur-up placeholders and perceptual hashes for wallpapers uploaded before they existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Rebuild thumbnail URLs for every wallpaper")
+        parser.add_argument(
+            "--no-fetch", action="store_true",
+            help="Only build thumbnail URLs, skip placeholders and hashes (no network)"
+        )
+        parser.add_argument("--workers", type=int, default=8, help="Parallel rendition fetches")
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **opts):
+        qs = Wallpaper.objects.only("id", "drive_file_id", "width", "thumbnails", "placeholder", *HASH_FIELDS)
+        if not opts["all"]:
+            if opts["no_fetch"]:
+                qs = qs.filter(thumbnails={})
+            else:
+                qs = qs.filter(Q(thumbnails={}) | Q(placeholder="") | Q(phash__isnull=True))
+
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=opts["workers"]) as pool:
+            batch = []
+            for wp in qs.iterator(chunk_size=opts["batch_size"]):
+                batch.append(wp)
+                if len(batch) >= opts["batch_size"]:
+                    n, errors = self.process(batch, pool, opts)
+                    done, failed = done + n, failed + errors
+            n, errors = self.process(batch, pool, opts)
+            done, failed = done + n, failed + errors
+        if done:
+            # cached listing rows still have no thumbnails or placeholders
+            caching.bump_generation()
+            # and neither have the cards rendered from them, updated_at didn't move
+            caching.bump_generation(caching.FRAGMENT_GENERATION_KEY)
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {done} wallpapers, {failed} renditions failed"))
+
+    def process(self, batch, pool, opts):
+        if not batch:
+            return 0, 0
+        for wp in batch:
+            if opts["all"] or not wp.thumbnails:
+                wp.thumbnails = images.thumbnail_urls(wp.drive_file_id, wp.width)
+
+        failed = 0
+        if not opts["no_fetch"]:
+            missing = [wp for wp in batch if not wp.placeholder or wp.phash is None]
+            for wp, rendition in zip(missing, pool.map(self.fetch_rendition, missing)):
+                if rendition is None:
+                    failed += 1
+                    continue
+                wp.placeholder = wp.placeholder or images.placeholder(rendition)
+                if wp.phash is None:
+                    wp.set_phash(images.dhash(rendition))
+
+        Wallpaper.objects.bulk_update(batch, ["thumbnails", "placeholder", *HASH_FIELDS])
+        n = len(batch)
+        batch.clear()
+        return n, failed
+
+    def fetch_rendition(self, wp):
+        try:
+            return images.fetch_rendition(wp.drive_file_id)
+        except Exception as e:
+            self.stderr.write(f"{wp.drive_file_id}: {e}")
+            return None
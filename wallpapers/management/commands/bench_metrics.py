@@ -0,0 +1,88 @@
+import statistics
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, override_settings
+from django.urls import resolve
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from wallpapers import metrics, signals
+from wallpapers.bench.catalogue import fake_wallpapers
+from wallpapers.models import Wallpaper
+
+
+class Command(BaseCommand):
+    help = "Measure what the metrics middleware and template timing add to a request"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=2000, help="Wallpapers to seed")
+        parser.add_argument("--repeat", type=int, default=300, help="Requests per page and mode")
+        parser.add_argument("--observations", type=int, default=200000, help="Registry calls for the micro benchmark")
+
+    @override_settings(METRICS_ENABLED=True)
+    def handle(self, *args, **opts):
+        self.micro(opts["observations"])
+        setup_test_environment()
+        try:
+            with transaction.atomic():
+                self.pages(opts)
+                transaction.set_rollback(True)
+        finally:
+            teardown_test_environment()
+            metrics.registry.reset()
+
+    def micro(self, n):
+        labels = (("view", "wallpapers:home"), ("method", "GET"), ("status", "200"))
+        started = time.perf_counter()
+        for i in range(n):
+            metrics.registry.observe("http_request_duration_seconds", (i % 100) / 1000, labels)
+        per_call = (time.perf_counter() - started) / n * 1e9
+        self.stdout.write(f"registry.observe(): {per_call:.0f} ns per call")
+
+        # the middleware around a view that does nothing, against the bare view
+        request = RequestFactory().get("/")
+        request.resolver_match = resolve("/")
+        response = HttpResponse()
+        bare = lambda request: response  # noqa: E731
+        wrapped = metrics.MetricsMiddleware(bare)
+        timings = {}
+        for name, handler in (("bare", bare), ("wrapped", wrapped)):
+            started = time.perf_counter()
+            for _ in range(n // 10):
+                handler(request)
+            timings[name] = (time.perf_counter() - started) / (n // 10) * 1e6
+        metrics.registry.reset()
+        self.stdout.write(f"MetricsMiddleware: {timings['wrapped'] - timings['bare']:.1f} us per request")
+
+    def pages(self, opts):
+        batch = list(islice(fake_wallpapers(opts["count"], seed=int(time.time())), opts["count"]))
+        Wallpaper.objects.bulk_create(batch)
+        signals.wallpapers_created(batch)
+        slug = Wallpaper.objects.values_list("slug", flat=True).first()
+
+        without = [m for m in settings.MIDDLEWARE if m != "wallpapers.metrics.MetricsMiddleware"]
+        # the client builds its handler, and so its middleware, when created
+        with override_settings(MIDDLEWARE=without):
+            off_client = Client()
+        on_client = Client()
+
+        self.stdout.write(f"{'page':<10} {'off ms':>8} {'on ms':>8} {'overhead':>10}")
+        for name, url in [("home", "/"), ("search", "/?q=city"), ("detail", f"/w/{slug}/")]:
+            off, on = self.measure(off_client, on_client, url, opts["repeat"])
+            self.stdout.write(f"{name:<10} {off:8.3f} {on:8.3f} {(on - off) * 1000:8.0f} us")
+
+    def measure(self, off_client, on_client, url, repeat):
+        """Median ms without and with metrics, alternating so drift hits both alike"""
+        off_client.get(url)  # warm caches
+        timings = {False: [], True: []}
+        for _ in range(repeat):
+            for enabled, client in ((False, off_client), (True, on_client)):
+                with override_settings(METRICS_ENABLED=enabled, SLOW_REQUEST_MS=0):
+                    started = time.perf_counter()
+                    client.get(url)
+                    timings[enabled].append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings[False]), statistics.median(timings[True])
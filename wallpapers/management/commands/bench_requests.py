@@ -0,0 +1,69 @@
+import statistics
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from wallpapers import signals
+from wallpapers.bench.catalogue import fake_wallpapers
+from wallpapers.models import Wallpaper
+
+VISITORS = ("anonymous", "anonymous+cookie", "staff")
+
+
+class Command(BaseCommand):
+    help = "Count database queries and time per request for the public pages, anonymous and staff"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=2000, help="Wallpapers to seed")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **opts):
+        setup_test_environment()
+        try:
+            with transaction.atomic():
+                self.run(opts)
+                transaction.set_rollback(True)
+        finally:
+            teardown_test_environment()
+
+    def run(self, opts):
+        batch = list(islice(fake_wallpapers(opts["count"], seed=int(time.time())), opts["count"]))
+        Wallpaper.objects.bulk_create(batch)
+        signals.wallpapers_created(batch)
+        slug = Wallpaper.objects.values_list("slug", flat=True).first()
+        staff = get_user_model().objects.create_user("bench-staff", is_staff=True)
+
+        pages = [("home", "/"), ("home ?cat=", "/?cat=nature"), ("detail", f"/w/{slug}/")]
+        self.stdout.write(f"{'page':<14} {'visitor':<18} {'queries':>8} {'ms':>8}")
+        for name, url in pages:
+            for visitor in VISITORS:
+                client = Client()
+                if visitor == "staff":
+                    client.force_login(staff)
+                queries, ms = self.measure(client, url, visitor, opts["repeat"])
+                self.stdout.write(f"{name:<14} {visitor:<18} {queries:8.1f} {ms:8.2f}")
+
+        client = Client()
+        client.force_login(staff)
+        queries, ms = self.measure(client, f"/staff-tools/?slots=detail:{slug}", "staff", opts["repeat"])
+        self.stdout.write(f"{'staff tools':<14} {'staff':<18} {queries:8.1f} {ms:8.2f}")
+
+    def measure(self, client, url, visitor, repeat):
+        client.get(url)  # warm the listing cache
+        counts, timings = [], []
+        for _ in range(repeat):
+            if visitor == "anonymous+cookie":
+                # a left-over session cookie from an earlier visit
+                client.cookies["sessionid"] = "0" * 32
+            executed = []
+            started = time.perf_counter()
+            with connection.execute_wrapper(lambda execute, sql, *args: executed.append(sql) or execute(sql, *args)):
+                client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+            counts.append(len(executed))
+        return statistics.mean(counts), statistics.median(timings)
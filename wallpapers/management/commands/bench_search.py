@@ -0,0 +1,72 @@
+import statistics
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from wallpapers import search, signals
+from wallpapers.bench.catalogue import fake_wallpapers
+from wallpapers.models import Wallpaper
+
+QUERIES = ["naruto", "dark", "nat", "neon city", "space nebula", "ferrari", "aesthetic sunset", "zzz"]
+
+
+def legacy_search(q):
+    # what views.home did before the search backend
+    return Wallpaper.objects.filter(
+        Q(title__icontains=q) |
+        Q(category__icontains=q) |
+        Q(tags__icontains=q)
+    ).order_by("-created_at")
+
+
+def ranked_search(q):
+    return search.search(Wallpaper.objects.all(), q).order_by("-search_rank", "-created_at")
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic catalogue and compare legacy icontains search with the search backend"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--keep", action="store_true", help="Keep the seeded rows instead of rolling back")
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            self.seed(opts["count"], opts["batch_size"])
+
+            self.stdout.write(f"backend: {search.get_backend()}, {Wallpaper.objects.count()} wallpapers")
+            self.stdout.write(f"{'query':<18} {'legacy ms':>10} {'search ms':>10} {'legacy n':>9} {'search n':>9}")
+            for q in QUERIES:
+                legacy_ms, legacy_n = self.measure(legacy_search, q, opts["repeat"])
+                new_ms, new_n = self.measure(ranked_search, q, opts["repeat"])
+                self.stdout.write(f"{q:<18} {legacy_ms:10.1f} {new_ms:10.1f} {legacy_n:9d} {new_n:9d}")
+
+            if not opts["keep"]:
+                transaction.set_rollback(True)
+
+    def seed(self, count, batch_size):
+        start = time.perf_counter()
+        rows = fake_wallpapers(count, seed=int(time.time()))
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            Wallpaper.objects.bulk_create(batch)
+            signals.wallpapers_created(batch)
+        self.stdout.write(f"seeded {count} wallpapers in {time.perf_counter() - start:.1f}s")
+
+    def measure(self, fn, q, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            qs = fn(q)
+            # one page of results plus the paginator's count, like the home view
+            list(qs[:24])
+            n = qs.count()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), n
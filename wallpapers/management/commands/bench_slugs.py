@@ -0,0 +1,102 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models.signals import post_save, pre_save
+from django.utils.text import slugify
+
+from wallpapers import signals, slugs
+from wallpapers.models import Wallpaper
+
+TITLE = "Naruto"
+
+
+def legacy_slug(title):
+    # what Wallpaper.save() did before slugs.py
+    base_slug = slugify(title)
+    unique_slug = base_slug
+    num = 1
+    while Wallpaper.objects.filter(slug=unique_slug).exists():
+        unique_slug = f"{base_slug}-{num}"
+        num += 1
+    return unique_slug
+
+
+def make(i, slug=""):
+    return Wallpaper(
+        title=TITLE,
+        slug=slug,
+        drive_file_id=f"wallpapers/slug-bench-{i}-{time.time_ns()}",
+        view_link="https://res.cloudinary.com/demo/image/upload/sample.jpg",
+        download_link="https://res.cloudinary.com/demo/image/upload/sample.jpg",
+        download_urls={"original": "https://res.cloudinary.com/demo/image/upload/sample.jpg"},
+    )
+
+
+class Command(BaseCommand):
+    help = "Insert many same-title wallpapers and compare the legacy slug loop with the slug allocator"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10_000)
+        parser.add_argument(
+            "--legacy-count", type=int, default=500,
+            help="Inserts for the legacy loop, which is quadratic (default 500)"
+        )
+
+    def handle(self, *args, **opts):
+        # time the slug work, not the search/tag/stats signal handlers
+        receivers = [
+            (post_save, signals.wallpaper_saved),
+            (pre_save, signals.wallpaper_saving),
+        ]
+        for signal, receiver in receivers:
+            signal.disconnect(receiver, sender=Wallpaper)
+        try:
+            self.run("legacy exists() loop", opts["legacy_count"], self.insert_legacy)
+            self.run("allocator, save()", opts["count"], self.insert_allocator)
+            self.run("allocator, bulk_create", opts["count"], self.insert_bulk)
+        finally:
+            for signal, receiver in receivers:
+                signal.connect(receiver, sender=Wallpaper)
+
+    def run(self, label, count, insert):
+        with transaction.atomic():
+            queries = 0
+
+            def count_queries(execute, sql, params, many, context):
+                nonlocal queries
+                queries += 1
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count_queries):
+                start = time.perf_counter()
+                tail = insert(count)
+                elapsed = time.perf_counter() - start
+            slugs_seen = Wallpaper.objects.filter(title=TITLE).values_list("slug", flat=True)
+            unique = len(set(slugs_seen)) == len(slugs_seen) == count
+            self.stdout.write(
+                f"{label:<24} {count:>6} inserts  {elapsed:7.2f}s  {queries:>9} queries  "
+                f"last 100: {tail * 1000:6.2f} ms/insert  unique: {unique}"
+            )
+            transaction.set_rollback(True)
+
+    def insert_legacy(self, count):
+        return self.timed_inserts(count, lambda i: make(i, legacy_slug(TITLE)).save())
+
+    def insert_allocator(self, count):
+        return self.timed_inserts(count, lambda i: make(i).save())
+
+    def insert_bulk(self, count):
+        start = time.perf_counter()
+        batch = [make(i) for i in range(count)]
+        slugs.assign_slugs(batch)
+        Wallpaper.objects.bulk_create(batch, batch_size=1000)
+        return (time.perf_counter() - start) / count
+
+    def timed_inserts(self, count, insert):
+        tail_start = None
+        for i in range(count):
+            if i == count - 100:
+                tail_start = time.perf_counter()
+            insert(i)
+        return (time.perf_counter() - tail_start) / 100 if tail_start else 0.0
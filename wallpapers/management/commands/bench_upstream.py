@@ -0,0 +1,94 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from wallpapers import upstream
+from wallpapers.bench.stub_server import StubServer
+
+CHUNK = 64 * 1024
+
+
+def drain(r):
+    total = sum(len(c) for c in upstream.iter_chunks(r, CHUNK))
+    return total
+
+
+class Command(BaseCommand):
+    help = "Benchmark the Cloudinary fetch layer against a local stub server"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--size-kb", type=int, default=512)
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--read-timeout", type=float, default=0.5)
+
+    def handle(self, *args, **opts):
+        n, concurrency = opts["requests"], opts["concurrency"]
+        size = opts["size_kb"] * 1024
+
+        with StubServer() as stub:
+            url = f"{stub.base_url}/file/{size}"
+
+            self.report("bare requests.get", n, size, self.run_threads(
+                lambda: drain(requests.get(url, stream=True)), n, 1))
+            self.report("pooled session", n, size, self.run_threads(
+                lambda: drain(upstream.fetch(url)), n, 1))
+            self.report(f"pooled session x{concurrency} threads", n, size, self.run_threads(
+                lambda: drain(upstream.fetch(url)), n, concurrency))
+            self.report(f"async client x{concurrency} tasks", n, size,
+                        asyncio.run(self.run_async(url, n, concurrency)))
+
+            r = upstream.fetch(url, headers={"Range": "bytes=1024-"})
+            got = drain(r)
+            self.stdout.write(
+                f"range resume: status={r.status_code} bytes={got} "
+                f"content-range={r.headers.get('Content-Range')}"
+            )
+
+            with override_settings(UPSTREAM_READ_TIMEOUT=opts["read_timeout"]):
+                upstream._local.__dict__.clear()
+                start = time.perf_counter()
+                try:
+                    upstream.fetch(f"{stub.base_url}/slow/{opts['read_timeout'] * 20}")
+                    outcome = "no timeout!"
+                except Exception as e:
+                    outcome = type(e).__name__
+                    if upstream.is_timeout(e):
+                        outcome += " (timeout)"
+                elapsed = time.perf_counter() - start
+                upstream._local.__dict__.clear()
+            self.stdout.write(
+                f"read timeout {opts['read_timeout']}s: {outcome} after {elapsed:.2f}s "
+                f"(stub saw {stub.hits} requests in total)"
+            )
+
+    def run_threads(self, fn, n, workers):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda _: fn(), range(n)))
+        return time.perf_counter() - start
+
+    async def run_async(self, url, n, concurrency):
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with limit:
+                r = await upstream.afetch(url)
+                async for _ in upstream.aiter_chunks(r, CHUNK):
+                    pass
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n)))
+        elapsed = time.perf_counter() - start
+        await upstream.get_async_client().aclose()
+        return elapsed
+
+    def report(self, label, n, size, elapsed):
+        mb = n * size / (1024 * 1024)
+        self.stdout.write(
+            f"{label:<34} {n / elapsed:8.1f} req/s  {mb / elapsed:8.1f} MB/s  ({elapsed:.2f}s)"
+        )
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wallpapers import events
+
+
+class Command(BaseCommand):
+    help = "Roll the view/download event log up into hourly and daily counts and prune it (run hourly)"
+
+    def handle(self, *args, **opts):
+        started = time.perf_counter()
+        done = events.compact()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {done['hourly']} hourly and {done['daily']} daily rows, pruned "
+            f"{done['events_pruned']} events and {done['hourly_pruned']} hourly rows in {elapsed:.1f}s"
+        ))
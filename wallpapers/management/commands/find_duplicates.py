@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from wallpapers import duplicates
+from wallpapers.models import Wallpaper
+
+
+class Command(BaseCommand):
+    help = "List clusters of near-duplicate wallpapers by perceptual hash"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--distance", type=int, help="Max Hamming distance (default DUPLICATE_MAX_DISTANCE)")
+        parser.add_argument("--limit", type=int, default=50, help="Clusters to print")
+
+    def handle(self, *args, **opts):
+        unhashed = Wallpaper.objects.filter(phash__isnull=True).count()
+        if unhashed:
+            self.stdout.write(self.style.WARNING(
+                f"{unhashed} wallpapers have no hash yet, run backfill_image_features first"
+            ))
+
+        groups = duplicates.clusters(opts["distance"])
+        rows = Wallpaper.objects.filter(pk__in=[pk for g in groups for pk in g]).only(
+            "id", "slug", "title", "downloads", "size_bytes", "phash"
+        )
+        by_pk = {wp.pk: wp for wp in rows.iterator(chunk_size=2000)}
+
+        wasted = 0
+        for n, group in enumerate(groups):
+            # keep the most downloaded copy, the rest are candidates for removal
+            members = sorted((by_pk[pk] for pk in group), key=lambda wp: (-wp.downloads, wp.pk))
+            keep = members[0]
+            wasted += sum(wp.size_bytes or 0 for wp in members[1:])
+            if n >= opts["limit"]:
+                continue
+            self.stdout.write(f"{len(members)} copies of '{keep.title}'")
+            for wp in members:
+                marker = "keep" if wp is keep else f"d={duplicates.distance(keep.phash, wp.phash)}"
+                self.stdout.write(f"  {marker:<6} {wp.slug}  {wp.downloads} downloads  {wp.size_bytes or 0} bytes")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(groups)} duplicate clusters, {sum(len(g) - 1 for g in groups)} extra copies, {wasted} bytes"
+        ))
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from wallpapers import caching
+
+
+class Command(BaseCommand):
+    help = "Show hit rate and render time per cached template fragment (needs FRAGMENT_CACHE_STATS)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Zero the counters afterwards")
+
+    def handle(self, *args, **opts):
+        if not settings.FRAGMENT_CACHE_STATS:
+            self.stdout.write(self.style.WARNING("FRAGMENT_CACHE_STATS is off, nothing is being counted"))
+
+        stats = caching.fragment_stats()
+        self.stdout.write(f"{'fragment':<16} {'hits':>8} {'misses':>8} {'hit ratio':>10} {'hit ms':>8} {'render ms':>10}")
+        for name, row in sorted(stats.items()):
+            self.stdout.write(
+                f"{name:<16} {row['hits']:8d} {row['misses']:8d} {row['hit_ratio']:10.1%} "
+                f"{row['hit_ms']:8.3f} {row['render_ms']:10.3f}"
+            )
+        if opts["reset"]:
+            caching.reset_fragment_stats()
+            self.stdout.write("counters reset")
@@ -0,0 +1,71 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from wallpapers import ingest
+from wallpapers.models import Wallpaper
+
+
+class Command(BaseCommand):
+    help = "Upload every image in a directory and create the wallpapers in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument("--category", default="other", choices=[c for c, _ in Wallpaper.CATEGORY_CHOICES])
+        parser.add_argument("--device", default="pc", choices=[d for d, _ in Wallpaper.DEVICE_CHOICES])
+        parser.add_argument("--tags", default="", help="Comma-separated tags for every file")
+        parser.add_argument("--featured", action="store_true")
+        parser.add_argument("--recursive", action="store_true")
+        parser.add_argument("--workers", type=int, help="Parallel uploads (default INGEST_WORKERS)")
+        parser.add_argument("--uploader", help="Dotted path of the uploader class (default WALLPAPER_UPLOADER)")
+
+    def handle(self, *args, **opts):
+        directory = Path(opts["directory"])
+        if not directory.is_dir():
+            raise CommandError(f"{directory} is not a directory")
+
+        pattern = "**/*" if opts["recursive"] else "*"
+        paths = sorted(
+            p for p in directory.glob(pattern)
+            if p.is_file() and p.suffix.lower() in ingest.IMAGE_EXTENSIONS
+        )
+        if not paths:
+            raise CommandError(f"No images found in {directory}")
+
+        items = [
+            ingest.IngestItem(
+                name=str(path.relative_to(directory)),
+                source=path,
+                title=ingest.title_from_filename(path.name),
+                category=opts["category"],
+                device=opts["device"],
+                tags=opts["tags"],
+                featured=opts["featured"],
+            )
+            for path in paths
+        ]
+        uploader = import_string(opts["uploader"])() if opts["uploader"] else None
+
+        done = 0
+
+        def progress(item, error):
+            nonlocal done
+            done += 1
+            if error:
+                self.stderr.write(f"[{done}/{len(items)}] {item.name}: {error}")
+            else:
+                self.stdout.write(f"[{done}/{len(items)}] {item.name}")
+
+        started = time.perf_counter()
+        result = ingest.ingest(items, uploader=uploader, workers=opts["workers"], progress=progress)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(result.created)} wallpapers in {elapsed:.1f}s, {len(result.failed)} failed"
+        ))
+        for name, warning in result.warnings:
+            self.stdout.write(self.style.WARNING(f"  {name}: {warning}"))
+        for name, error in result.failed:
+            self.stdout.write(self.style.ERROR(f"  {name}: {error}"))
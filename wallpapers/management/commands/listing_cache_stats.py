@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from wallpapers import caching
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters of the home page listing cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Zero the counters afterwards")
+
+    def handle(self, *args, **opts):
+        stats = caching.listing_stats()
+        self.stdout.write(
+            f"generation {caching.get_generation()}: "
+            f"{stats['hits']} hits, {stats['misses']} misses, hit ratio {stats['hit_ratio']:.1%}"
+        )
+        if opts["reset"]:
+            caching.reset_listing_stats()
+            self.stdout.write("counters reset")
@@ -0,0 +1,192 @@
+import json
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from wallpapers import jobs
+from wallpapers.bench import loadtest
+from wallpapers.bench.transport import FakeCloudinaryAdapter
+from wallpapers.models import Job, Wallpaper
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test home, detail, download, sitemap and upload in process and report latency "
+        "percentiles, queries per request and RSS as JSON (seed the library first with seed_wallpapers)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenarios", default=",".join(loadtest.SCENARIOS),
+                            help=f"Comma-separated, from {', '.join(loadtest.SCENARIOS)}")
+        parser.add_argument("--requests", type=int, default=500, help="Requests per scenario")
+        parser.add_argument("--concurrency", type=int, default=8, help="Client threads")
+        parser.add_argument("--depth", type=int, default=20, help="Listing pages to follow for deep pages")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--cold", action="store_true", help="Clear the cache before each scenario")
+        parser.add_argument("--download-kb", type=int, default=2048, help="Size of every fake Cloudinary file")
+        parser.add_argument("--upstream-latency-ms", type=float, default=0, help="Added to every fake Cloudinary reply")
+        parser.add_argument("--upload-px", type=int, default=512, help="Side of the generated upload images")
+        parser.add_argument("--keep-uploads", action="store_true", help="Keep the wallpapers the upload scenario created")
+        parser.add_argument("--output", help="Write the JSON report here ('-' for stdout)")
+        parser.add_argument("--compare", help="An earlier JSON report to print the change against")
+
+    def handle(self, *args, **opts):
+        scenarios = [name.strip() for name in opts["scenarios"].split(",") if name.strip()]
+        unknown = set(scenarios) - set(loadtest.SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        if not Wallpaper.objects.exists():
+            raise CommandError("The library is empty, run seed_wallpapers first")
+
+        # the test client talks to "testserver"; setup_test_environment() is
+        # avoided on purpose, it instruments template rendering
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            report = self.run(scenarios, opts)
+
+        if opts["output"] == "-":
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_table(report)
+            if opts["output"]:
+                with open(opts["output"], "w") as f:
+                    json.dump(report, f, indent=2)
+                self.stdout.write(f"Report written to {opts['output']}")
+        if opts["compare"]:
+            with open(opts["compare"]) as f:
+                self.print_comparison(json.load(f), report)
+
+    def run(self, scenarios, opts):
+        rng = random.Random(opts["seed"])
+        adapter = FakeCloudinaryAdapter(opts["download_kb"] * 1024, opts["upstream_latency_ms"] / 1000)
+        runner = loadtest.Runner(opts["concurrency"], opts["requests"], adapter=adapter)
+        report = {
+            "commit": self.commit(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "environment": loadtest.environment(),
+            "options": {key: opts[key] for key in ("requests", "concurrency", "depth", "seed", "cold", "download_kb")},
+            "scenarios": {},
+        }
+
+        for name in scenarios:
+            if opts["cold"]:
+                cache.clear()
+            self.stderr.write(f"running {name}...")
+            result = getattr(self, f"scenario_{name}")(runner, rng, opts)
+            if result:
+                report["scenarios"][name] = result
+        return report
+
+    def scenario_home(self, runner, rng, opts):
+        urls = loadtest.home_urls(Client(), opts["depth"])
+        rng.shuffle(urls)
+        result = runner.run("home", lambda client, i: client.get(urls[i % len(urls)]))
+        result["urls"] = len(urls)
+        return result
+
+    def scenario_detail(self, runner, rng, opts):
+        urls = loadtest.detail_urls(rng, min(opts["requests"], 1000))
+        return runner.run("detail", lambda client, i: client.get(urls[i % len(urls)]))
+
+    def scenario_download(self, runner, rng, opts):
+        if settings.ASYNC_DOWNLOADS and settings.DOWNLOAD_MODE == "proxy":
+            # the async view fetches with httpx, which the fake transport doesn't cover
+            self.stderr.write("skipping download: ASYNC_DOWNLOADS would fetch from the real Cloudinary")
+            return None
+        urls = loadtest.download_urls(rng, min(opts["requests"], 1000))
+        return runner.run("download", lambda client, i: client.get(urls[i % len(urls)]))
+
+    def scenario_sitemap(self, runner, rng, opts):
+        urls = loadtest.sitemap_urls(Client())
+        return runner.run("sitemap", lambda client, i: client.get(urls[i % len(urls)]))
+
+    def scenario_upload(self, runner, rng, opts):
+        staff, _ = get_user_model().objects.get_or_create(username="loadtest-staff", defaults={"is_staff": True})
+        last_job = Job.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+        # images are made up front so their encoding isn't timed
+        forms = [loadtest.fake_upload(rng, opts["upload_px"]) for _ in range(opts["requests"])]
+        spool = tempfile.mkdtemp(prefix="loadtest-spool-")
+        try:
+            with override_settings(JOB_SPOOL_DIR=spool, WALLPAPER_UPLOADER="wallpapers.ingest.FakeUploader"):
+                staff_runner = loadtest.Runner(runner.concurrency, runner.requests, staff=staff, adapter=runner.adapter)
+                result = staff_runner.run("upload", lambda client, i: client.post("/upload/", forms[i]))
+
+                # then how long the queued ingests take a worker
+                worker = jobs.Worker(concurrency=runner.concurrency, poll_interval=0)
+                started = time.perf_counter()
+                worker.run(once=True)
+                result["ingest"] = {
+                    "jobs": worker.done + worker.failed,
+                    "done": worker.done,
+                    "failed": worker.failed,
+                    "seconds": round(time.perf_counter() - started, 3),
+                }
+        finally:
+            shutil.rmtree(spool, ignore_errors=True)
+            created = Job.objects.filter(pk__gt=last_job, kind="ingest")
+            if not opts["keep_uploads"]:
+                slugs = [job.result.get("slug") for job in created if job.result.get("slug")]
+                Wallpaper.objects.filter(slug__in=slugs).delete()
+                created.delete()
+                staff.delete()
+        return result
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    def print_table(self, report):
+        env = report["environment"]
+        self.stdout.write(
+            f"commit {report['commit']}, {env['wallpapers']} wallpapers, {env['database']}/{env['cache']}, "
+            f"python {report['python']} on {sys.platform}"
+        )
+        self.stdout.write(
+            f"{'scenario':<10} {'reqs':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'queries':>8} {'errors':>7} {'rss mb':>8}"
+        )
+        for name, r in report["scenarios"].items():
+            latency = r["latency_ms"]
+            self.stdout.write(
+                f"{name:<10} {r['requests']:>6} {r['rps']:>8} {latency['p50']:>8} {latency['p95']:>8} "
+                f"{latency['p99']:>8} {r['queries']['mean']:>8} {r['errors']:>7} {r['rss_mb']['after']!s:>8}"
+            )
+            if "ingest" in r:
+                ingest = r["ingest"]
+                self.stdout.write(f"{'':<10} ingest: {ingest['done']}/{ingest['jobs']} jobs in {ingest['seconds']}s")
+
+    def print_comparison(self, before, after):
+        self.stdout.write(f"\nchange from {before.get('commit')} to {after.get('commit')}")
+        for name, r in after["scenarios"].items():
+            old = before.get("scenarios", {}).get(name)
+            if not old:
+                continue
+            changes = []
+            for key in ("p50", "p95", "p99"):
+                changes.append(f"{key} {_change(old['latency_ms'][key], r['latency_ms'][key])}")
+            changes.append(f"queries {_change(old['queries']['mean'], r['queries']['mean'])}")
+            changes.append(f"rps {_change(old['rps'], r['rps'])}")
+            self.stdout.write(f"{name:<10} " + ", ".join(changes))
+
+
+def _change(old, new):
+    if not old or new is None:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
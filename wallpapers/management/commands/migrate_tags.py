@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from wallpapers import tags
+from wallpapers.models import Tag, Wallpaper
+
+
+class Command(BaseCommand):
+    help = "Copy the comma-separated Wallpaper.tags field into the normalized Tag table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **opts):
+        through = Wallpaper.tag_set.through
+        qs = Wallpaper.objects.only("id", "tags").order_by("id")
+
+        done = 0
+        with transaction.atomic():
+            # start from scratch so the command can be re-run safely
+            through.objects.all().delete()
+            Tag.objects.update(wallpaper_count=0)
+
+            batch = []
+            for wp in qs.iterator(chunk_size=opts["batch_size"]):
+                batch.append(wp)
+                if len(batch) >= opts["batch_size"]:
+                    tags.sync_tags_bulk(batch)
+                    done += len(batch)
+                    batch = []
+            tags.sync_tags_bulk(batch)
+            done += len(batch)
+
+            # counts were built incrementally, recount once to be exact
+            tags.rebuild_counts()
+            Tag.objects.filter(wallpaper_count=0).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Migrated tags of {done} wallpapers into {Tag.objects.count()} tags"
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from wallpapers import caching
+from wallpapers.models import Wallpaper
+
+
+class Command(BaseCommand):
+    help = "Store signed download URLs on wallpapers uploaded before they were precomputed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Rebuild URLs for every wallpaper")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        qs = Wallpaper.objects.only("id", "title", "drive_file_id", "mime_type", "download_urls")
+        if not opts["all"]:
+            qs = qs.filter(download_urls={})
+
+        batch, done = [], 0
+        for wp in qs.iterator(chunk_size=opts["batch_size"]):
+            wp.download_urls = wp.build_download_urls()
+            batch.append(wp)
+            if len(batch) >= opts["batch_size"]:
+                done += self.flush(batch)
+        done += self.flush(batch)
+        if done:
+            # bulk_update sends no signals, cached listing rows still carry the old URLs
+            caching.bump_generation()
+
+        self.stdout.write(self.style.SUCCESS(f"Updated download URLs for {done} wallpapers"))
+
+    def flush(self, batch):
+        Wallpaper.objects.bulk_update(batch, ["download_urls"])
+        n = len(batch)
+        batch.clear()
+        return n
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from wallpapers import stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed library statistics from the wallpaper table"
+
+    def handle(self, *args, **opts):
+        rows = stats.rebuild()
+        count, size = stats.totals()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rows} stat rows: {count} wallpapers, {size} bytes"
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from wallpapers import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index used by the home page query box"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **opts):
+        backend = search.get_backend()
+        count = search.rebuild_index(batch_size=opts["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {backend} search index ({count} terms)"))
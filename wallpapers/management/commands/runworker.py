@@ -0,0 +1,24 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from wallpapers import jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (upload page ingests) until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, help="Jobs run at once (default JOB_WORKER_CONCURRENCY)")
+        parser.add_argument("--poll-interval", type=float, help="Seconds between polls when idle (default JOB_POLL_INTERVAL)")
+        parser.add_argument("--once", action="store_true", help="Exit when no job is due instead of waiting for more")
+
+    def handle(self, *args, **opts):
+        worker = jobs.Worker(concurrency=opts["concurrency"], poll_interval=opts["poll_interval"])
+        # finish the jobs in hand, then exit
+        signal.signal(signal.SIGINT, worker.stop)
+        signal.signal(signal.SIGTERM, worker.stop)
+
+        self.stdout.write(f"Worker {worker.id} running {worker.concurrency} jobs at a time")
+        worker.run(once=opts["once"])
+        self.stdout.write(self.style.SUCCESS(f"Stopped: {worker.done} done, {worker.failed} failed or retrying"))
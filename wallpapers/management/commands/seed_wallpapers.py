@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from wallpapers import caching, signals, stats
+from wallpapers.bench.catalogue import fake_wallpapers
+from wallpapers.models import Wallpaper
+
+
+class Command(BaseCommand):
+    help = "Fill the library with synthetic wallpapers for load tests and benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10000)
+        parser.add_argument("--seed", type=int, default=0, help="Same seed, same catalogue")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--wipe", action="store_true", help="Delete earlier seeded wallpapers first")
+
+    def handle(self, *args, **opts):
+        seeded = Wallpaper.objects.filter(slug__startswith="bench-")
+        if opts["wipe"]:
+            _, deleted = seeded.delete()
+            stats.rebuild()
+            caching.bump_generation()
+            self.stdout.write(f"Deleted {deleted.get('wallpapers.Wallpaper', 0)} seeded wallpapers")
+
+        # carry on after what this seed already created, so reruns add rather than clash
+        start = seeded.filter(slug__startswith=f"bench-{opts['seed']}-").count()
+        count, batch_size = opts["count"], opts["batch_size"]
+        started = time.perf_counter()
+        created = 0
+        wallpapers = fake_wallpapers(count, seed=opts["seed"], start=start)
+        while created < count:
+            batch = [wp for _, wp in zip(range(min(batch_size, count - created)), wallpapers)]
+            with transaction.atomic():
+                Wallpaper.objects.bulk_create(batch)
+                signals.wallpapers_created(batch)
+            created += len(batch)
+            self.stdout.write(f"{created}/{count}", ending="\r")
+        if created:
+            # end the progress line so the summary doesn't land on top of it
+            self.stdout.write("")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created} wallpapers in {elapsed:.1f}s, the library now has {stats.totals()[0]}"
+        ))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wallpapers import related
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed related wallpapers (stale ones only, or --all)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Rebuild the neighbours of every wallpaper")
+
+    def handle(self, *args, **opts):
+        started = time.perf_counter()
+        done = related.rebuild() if opts["all"] else related.refresh()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Updated neighbours of {done} wallpapers in {elapsed:.1f}s"))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wallpapers import trending
+
+
+class Command(BaseCommand):
+    help = "Fold new views and downloads into the trending scores (run every few minutes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backfill",
+            action="store_true",
+            help="Score every wallpaper's lifetime counts as of its upload, once on an existing library"
+        )
+        parser.add_argument("--suggest", action="store_true", help="List the featured suggestions afterwards")
+
+    def handle(self, *args, **opts):
+        started = time.perf_counter()
+        done = trending.refresh(backfill=opts["backfill"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Updated trending scores of {done} wallpapers in {elapsed:.1f}s"))
+
+        if opts["suggest"]:
+            for wp in trending.featured_suggestions():
+                self.stdout.write(f"{trending.heat(wp.trending_score):10.1f}  {wp.slug}")
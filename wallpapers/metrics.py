@@ -0,0 +1,249 @@
+"""
+In-process performance metrics, exported in the Prometheus text format by
+views.metrics.
+
+MetricsMiddleware times every request and, through a connection execute
+wrapper, the queries it runs; the template backend below times page
+renders; timed() wraps calls to Cloudinary. Everything lands in one
+Registry of counters and fixed-bucket histograms: an observation is a
+bisect and a few additions under a lock, nothing is stored per request.
+
+Requests slower than SLOW_REQUEST_MS are logged with their slowest queries
+(grouped by statement, so an N+1 shows up as one line with a count).
+
+Each process keeps its own numbers, from its start. With several worker
+processes a scrape sees whichever one answered; the ``pid`` in every
+export tells them apart.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger(__name__)
+
+# seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# per request, enough for the slow log without growing on a runaway loop
+MAX_RECORDED_QUERIES = 500
+SLOW_LOG_QUERIES = 5
+
+METRICS = {
+    # name: (type, help, buckets)
+    "http_request_duration_seconds": ("histogram", "Time to build the response, by view", LATENCY_BUCKETS),
+    "http_request_db_queries": ("histogram", "Database queries per request, by view", QUERY_BUCKETS),
+    "http_request_db_seconds": ("histogram", "Time spent in database queries per request, by view", LATENCY_BUCKETS),
+    "template_render_seconds": ("histogram", "Page template render time, by template", LATENCY_BUCKETS),
+    "upstream_request_seconds": ("histogram", "Cloudinary call latency, by operation and outcome", LATENCY_BUCKETS),
+    "http_slow_requests_total": ("counter", "Requests slower than SLOW_REQUEST_MS, by view", None),
+}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        # (name, labels) -> per-bucket counts (last one is +Inf), sum
+        self._histograms = {}
+        self.started = time.time()
+
+    def inc(self, name, labels=(), amount=1):
+        with self._lock:
+            self._counters[name, labels] += amount
+
+    def observe(self, name, value, labels=()):
+        buckets = METRICS[name][2]
+        index = bisect_left(buckets, value)
+        with self._lock:
+            found = self._histograms.get((name, labels))
+            if found is None:
+                found = self._histograms[name, labels] = [[0] * (len(buckets) + 1), 0.0]
+            found[0][index] += 1
+            found[1] += value
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+        self.started = time.time()
+
+    def render(self):
+        """The Prometheus text exposition of everything recorded so far"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(counts), total) for key, (counts, total) in self._histograms.items()}
+
+        pid = (("pid", str(os.getpid())),)
+        lines = [
+            "# HELP process_start_time_seconds Start of the process that answered, metrics count from here",
+            "# TYPE process_start_time_seconds gauge",
+            f"process_start_time_seconds{_labels(pid)} {self.started:.3f}",
+        ]
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(labels + pid)} {value:g}")
+                continue
+            for (metric, labels), (counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + pid + (('le', _bound(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels + pid)} {total:.6f}")
+                lines.append(f"{name}_count{_labels(labels + pid)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _bound(bound):
+    return bound if isinstance(bound, str) else f"{bound:g}"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+
+# the RequestStats of the request being handled on this thread/task, if any
+_current = ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "template_time", "recorded")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.recorded = []
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if len(self.recorded) < MAX_RECORDED_QUERIES:
+                self.recorded.append((sql, elapsed))
+
+
+@contextmanager
+def timed(op):
+    """Record the enclosed Cloudinary call as upstream_request_seconds{op=...}"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        if settings.METRICS_ENABLED:
+            registry.observe(
+                "upstream_request_seconds", time.perf_counter() - started, (("op", op), ("outcome", outcome))
+            )
+
+
+class MetricsMiddleware:
+    """Outermost middleware: times the request and counts its queries"""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(stats):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        # for streamed downloads this is the time to the first byte
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        # unresolved paths (404s) share one label, whatever the URL
+        view = match.view_name if match else "<unresolved>"
+        registry.observe(
+            "http_request_duration_seconds",
+            elapsed,
+            (("view", view), ("method", request.method), ("status", str(response.status_code))),
+        )
+        registry.observe("http_request_db_queries", stats.queries, (("view", view),))
+        registry.observe("http_request_db_seconds", stats.db_time, (("view", view),))
+
+        if settings.SLOW_REQUEST_MS and elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+            registry.inc("http_slow_requests_total", (("view", view),))
+            log_slow_request(request, view, elapsed, stats)
+        return response
+
+
+def log_slow_request(request, view, elapsed, stats):
+    grouped = defaultdict(lambda: [0, 0.0])
+    for sql, seconds in stats.recorded:
+        grouped[sql][0] += 1
+        grouped[sql][1] += seconds
+    slowest = sorted(grouped.items(), key=lambda item: item[1][1], reverse=True)[:SLOW_LOG_QUERIES]
+
+    lines = [
+        f"slow request {request.method} {request.get_full_path()} ({view}): {elapsed * 1000:.0f} ms, "
+        f"{stats.queries} queries {stats.db_time * 1000:.0f} ms, templates {stats.template_time * 1000:.0f} ms"
+    ]
+    for sql, (count, seconds) in slowest:
+        lines.append(f"  {count:>4} x {seconds * 1000:8.1f} ms  {sql[:300]}")
+    logger.warning("\n".join(lines))
+
+
+class InstrumentedTemplate(django_backend.Template):
+    def render(self, context=None, request=None):
+        if not settings.METRICS_ENABLED:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.observe("template_render_seconds", elapsed, (("template", self.origin.template_name or "<string>"),))
+            stats = _current.get()
+            if stats is not None:
+                stats.template_time += elapsed
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The stock backend, with every page render timed (includes count towards their page)"""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
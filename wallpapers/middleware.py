@@ -0,0 +1,57 @@
+"""
+Staff hint cookie.
+
+Public pages render the same for everyone and never touch the session, so
+anonymous reads cost no session or user query and can be cached. Staff
+furniture (upload link, library totals, delete buttons) is fetched
+separately from views.staff_tools, and only by browsers that carry the
+readable STAFF_HINT_COOKIE this middleware keeps in step with the session.
+The cookie is only a hint: staff_tools checks the real user.
+
+The login/logout receivers below are connected when Django loads the
+middleware, before the first request.
+"""
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.dispatch import receiver
+
+
+class StaffHintMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        is_staff = getattr(request, "_staff_hint", None)
+        if is_staff is None:
+            # only when something else already loaded the user, never load it here
+            user = getattr(request, "_cached_user", None)
+            if user is None:
+                return response
+            is_staff = user.is_staff
+
+        has_hint = settings.STAFF_HINT_COOKIE in request.COOKIES
+        if is_staff and not has_hint:
+            response.set_cookie(
+                settings.STAFF_HINT_COOKIE,
+                "1",
+                max_age=settings.SESSION_COOKIE_AGE,
+                secure=settings.SESSION_COOKIE_SECURE,
+                samesite="Lax"
+            )
+        elif not is_staff and has_hint:
+            response.delete_cookie(settings.STAFF_HINT_COOKIE, samesite="Lax")
+        return response
+
+
+@receiver(user_logged_in)
+def staff_logged_in(sender, request, user, **kwargs):
+    if request is not None:
+        request._staff_hint = user.is_staff
+
+
+@receiver(user_logged_out)
+def staff_logged_out(sender, request, user, **kwargs):
+    if request is not None:
+        request._staff_hint = False
@@ -1,5 +1,9 @@
-from django.db import models
+import math
+
+from django.db import IntegrityError, models, transaction
 from django.utils.text import slugify
+from cloudinary.utils import cloudinary_url
+from . import counters, images, slugs
 
 class Wallpaper(models.Model):
     CATEGORY_CHOICES = [
@@ -24,6 +28,39 @@ class Wallpaper(models.Model):
         ('mobile', 'Mobile')
     ]
 
+    # ordinal so "at least 4K" is a range on one indexed column
+    RESOLUTION_TIERS = [
+        (0, 'Other'),
+        (1, 'HD'),
+        (2, 'FHD'),
+        (3, 'QHD'),
+        (4, '4K'),
+        (5, '8K'),
+    ]
+
+    # (tier, long side, short side) minimums, checked from the top
+    TIER_MINIMUMS = [
+        (5, 7680, 4320),
+        (4, 3840, 2160),
+        (3, 2560, 1440),
+        (2, 1920, 1080),
+        (1, 1280, 720),
+    ]
+
+    ORIENTATION_CHOICES = [
+        ('landscape', 'Landscape'),
+        ('portrait', 'Portrait'),
+        ('square', 'Square'),
+    ]
+
+    # Cloudinary transformations offered on the download buttons (?res=...)
+    DOWNLOAD_PRESETS = {
+        "hd": {"width": 1920, "height": 1080, "crop": "fill"},
+        "2k": {"width": 2560, "height": 1440, "crop": "fill"},
+        "4k": {"width": 3840, "height": 2160, "crop": "fill"},
+        "mobile": {"width": 1080, "height": 2400, "crop": "fill"},
+    }
+
     title = models.CharField(
         max_length=255,
         help_text="Descriptive title for the wallpaper"
@@ -45,6 +82,37 @@ class Wallpaper(models.Model):
     download_link = models.URLField(
         help_text="URL for downloading the image"
     )
+    download_urls = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Signed attachment URLs per download preset, computed at upload"
+    )
+    thumbnails = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Width-stepped preview URLs per format, see images.py"
+    )
+    placeholder = models.TextField(
+        blank=True,
+        help_text="Tiny inline image shown while the preview loads"
+    )
+    palette = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        help_text="Dominant colours as 'rrggbb:percent' pairs, most common first"
+    )
+    phash = models.BigIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="64-bit perceptual hash (dHash), stored signed"
+    )
+    # the hash split into four 16-bit bands, each indexed, see duplicates.py
+    phash_0 = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    phash_1 = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    phash_2 = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    phash_3 = models.PositiveIntegerField(null=True, blank=True, editable=False)
     mime_type = models.CharField(
         max_length=100,
         blank=True,
@@ -77,6 +145,24 @@ class Wallpaper(models.Model):
         editable=False,
         help_text="Auto-generated resolution label (e.g. '4K')"
     )
+    resolution_tier = models.PositiveSmallIntegerField(
+        default=0,
+        choices=RESOLUTION_TIERS,
+        editable=False,
+        help_text="Resolution class derived from width/height, 0 below HD"
+    )
+    aspect_ratio = models.CharField(
+        max_length=20,
+        blank=True,
+        editable=False,
+        help_text="Reduced aspect ratio (e.g. '16:9')"
+    )
+    orientation = models.CharField(
+        max_length=10,
+        blank=True,
+        choices=ORIENTATION_CHOICES,
+        editable=False
+    )
     downloads = models.PositiveIntegerField(
         default=0,
         help_text="Number of downloads"
@@ -98,6 +184,13 @@ class Wallpaper(models.Model):
         blank=True,
         help_text="Comma-separated tags for better discoverability"
     )
+    tag_set = models.ManyToManyField(
+        "Tag",
+        blank=True,
+        editable=False,
+        related_name="wallpapers",
+        help_text="Normalized tags, kept in sync with the tags field"
+    )
     device = models.CharField(
         max_length=100,
         default='pc',
@@ -109,6 +202,31 @@ class Wallpaper(models.Model):
         help_text="Date and time when last updated"
     )
     views = models.PositiveIntegerField(default=0)
+    trending_score = models.FloatField(
+        default=0,
+        editable=False,
+        help_text="Time-decayed views and downloads in forward-decay form, see trending.py"
+    )
+    trending_views = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Views already counted in trending_score"
+    )
+    trending_downloads = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Downloads already counted in trending_score"
+    )
+    related_stale = models.BooleanField(
+        default=True,
+        editable=False,
+        help_text="Neighbours need recomputing, see related.py"
+    )
+    related_features = models.BinaryField(
+        null=True,
+        editable=False,
+        help_text="Feature vector related.py computed at the last refresh, float32"
+    )
 
     class Meta:
         ordering = ["-created_at"]
@@ -116,70 +234,429 @@ class Wallpaper(models.Model):
         verbose_name_plural = "Wallpapers"
         indexes = [
             models.Index(fields=['slug']),
-            models.Index(fields=['category']),
-            models.Index(fields=['created_at']),
-            models.Index(fields=['downloads']),
-            models.Index(fields=['device']),
+            # keyset pagination walks these, see pagination.py
+            models.Index(fields=['-created_at', '-id'], name='wallpaper_recent_idx'),
+            models.Index(fields=['-downloads', '-id'], name='wallpaper_popular_idx'),
+            models.Index(fields=['-trending_score', '-id'], name='wallpaper_trending_idx'),
+            models.Index(fields=['is_featured', '-created_at', '-id'], name='wallpaper_featured_idx'),
+            # home filter combinations (category, device, tier) in date order
+            models.Index(fields=['category', '-created_at', '-id'], name='wallpaper_cat_recent_idx'),
+            models.Index(fields=['device', '-created_at', '-id'], name='wallpaper_device_recent_idx'),
+            models.Index(fields=['resolution_tier', '-created_at', '-id'], name='wallpaper_tier_recent_idx'),
+            models.Index(fields=['category', 'device', '-created_at', '-id'], name='wallpaper_cat_dev_idx'),
+            models.Index(fields=['category', 'resolution_tier', '-created_at', '-id'], name='wallpaper_cat_tier_idx'),
+            models.Index(fields=['device', 'resolution_tier', '-created_at', '-id'], name='wallpaper_dev_tier_idx'),
+            models.Index(
+                fields=['category', 'device', 'resolution_tier', '-created_at', '-id'],
+                name='wallpaper_cat_dev_tier_idx'
+            ),
+            models.Index(fields=['phash_0'], name='wallpaper_phash_0_idx'),
+            models.Index(fields=['phash_1'], name='wallpaper_phash_1_idx'),
+            models.Index(fields=['phash_2'], name='wallpaper_phash_2_idx'),
+            models.Index(fields=['phash_3'], name='wallpaper_phash_3_idx'),
         ]
 
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            base_slug = slugify(self.title)
-            unique_slug = base_slug
-            num = 1
-            while Wallpaper.objects.filter(slug=unique_slug).exists():
-                unique_slug = f"{base_slug}-{num}"
-                num += 1
-            self.slug = unique_slug
+        self.set_dimension_fields()
+        # tags, category or resolution may have changed
+        self.related_stale = True
+
+        if not self.download_urls and self.drive_file_id:
+            self.download_urls = self.build_download_urls()
+
+        if not self.thumbnails and self.drive_file_id:
+            self.thumbnails = images.thumbnail_urls(self.drive_file_id, self.width)
+
+        if self.slug:
+            return super().save(*args, **kwargs)
+
+        # allocated slugs can still clash with one set by hand, take the next
+        for attempt in range(slugs.MAX_ATTEMPTS):
+            self.slug = slugs.reserve(slugs.base_slug(self.title))[0]
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                taken = Wallpaper.objects.filter(slug=self.slug).exists()
+                self.slug = ""
+                if not taken or attempt == slugs.MAX_ATTEMPTS - 1:
+                    raise
+
+
+    def build_download_urls(self):
+        """Signed fl_attachment URLs for the original and every download preset"""
+        name = slugify(self.title) or "wallpaper"
+        file_extension = self.mime_type.split('/')[-1] if self.mime_type else 'jpg'
+
+        urls = {}
+        urls["original"], _ = cloudinary_url(
+            self.drive_file_id,
+            format=file_extension,
+            flags=f"attachment:{name}_original",
+            sign_url=True,
+            secure=True
+        )
+        for res, options in self.DOWNLOAD_PRESETS.items():
+            urls[res], _ = cloudinary_url(
+                self.drive_file_id,
+                transformation=[options],
+                flags=f"attachment:{name}_{res}",
+                sign_url=True,
+                secure=True
+            )
+        return urls
+
+
+    def set_phash(self, value):
+        """Store an unsigned 64-bit hash and its bands (None clears them)"""
+        if value is None:
+            self.phash = self.phash_0 = self.phash_1 = self.phash_2 = self.phash_3 = None
+            return
+        self.phash = value - (1 << 64) if value >= (1 << 63) else value
+        self.phash_0, self.phash_1, self.phash_2, self.phash_3 = (
+            (value >> shift) & 0xFFFF for shift in (48, 32, 16, 0)
+        )
+
+    def set_palette(self, colors):
+        """Store [(hex, percent), ...] from images.palette()"""
+        self.palette = " ".join(f"{hex_value}:{percent}" for hex_value, percent in colors)
 
-        if self.width and self.height:
-            self.resolution_label = self.generate_resolution_label()
-        
-        super().save(*args, **kwargs)
+    @property
+    def palette_colors(self):
+        """The stored palette as [(hex, percent), ...]"""
+        colors = []
+        for pair in self.palette.split():
+            hex_value, _, percent = pair.partition(":")
+            colors.append((hex_value, int(percent or 0)))
+        return colors
+
+    @property
+    def avif_srcset(self):
+        return images.srcset(self.thumbnails, "avif")
+
+    @property
+    def webp_srcset(self):
+        return images.srcset(self.thumbnails, "webp")
+
+
+    def set_dimension_fields(self):
+        """Fill the stored fields derived from width/height (save() and bulk paths)"""
+        if not self.width or not self.height:
+            return
+        self.resolution_label = self.generate_resolution_label()
+        self.resolution_tier = self.generate_resolution_tier()
+        divisor = math.gcd(self.width, self.height)
+        self.aspect_ratio = f"{self.width // divisor}:{self.height // divisor}"
+        if self.width > self.height:
+            self.orientation = "landscape"
+        elif self.width < self.height:
+            self.orientation = "portrait"
+        else:
+            self.orientation = "square"
+
+
+    def generate_resolution_tier(self):
+        # both orientations count, a 2160x3840 phone wallpaper is 4K too
+        long_side, short_side = max(self.width, self.height), min(self.width, self.height)
+        for tier, min_long, min_short in self.TIER_MINIMUMS:
+            if long_side >= min_long and short_side >= min_short:
+                return tier
+        return 0
 
 
     def generate_resolution_label(self):
-        w, h = self.width, self.height
-
-        # Check for 8K, 4K, QHD, FHD, and HD in both landscape and portrait orientations
-        if (w >= 7680 and h >= 4320) or (h >= 7680 and w >= 4320):
-            return "8K"
-        elif (w >= 3840 and h >= 2160) or (h >= 3840 and w >= 2160):
-            return "4K"
-        elif (w >= 2560 and h >= 1440) or (h >= 2560 and w >= 1440):
-            return "QHD"
-        elif (w >= 1920 and h >= 1080) or (h >= 1920 and w >= 1080):
-            return "FHD"
-        elif (w >= 1280 and h >= 720) or (h >= 1280 and w >= 720):
-            return "HD"
-    
+        tier = self.generate_resolution_tier()
+        if tier:
+            return dict(self.RESOLUTION_TIERS)[tier]
+
         # If none of the conditions match, return the resolution as-is (real one)
-        return f"{w}x{h}"
+        return f"{self.width}x{self.height}"
 
 
-    def increment_downloads(self):
-        """Increment download counter"""
+    def increment_downloads(self, res="", device=""):
+        """Increment download counter and log the event (buffered, written by counters.py)"""
         self.downloads += 1
-        self.save()
+        counters.record(self.pk, "downloads", res, device)
 
-    def increment_views(self):
-        """Increment download counter"""
+    def increment_views(self, device=""):
+        """Increment view counter and log the event (buffered, written by counters.py)"""
         self.views += 1
-        self.save()
+        counters.record(self.pk, "views", device=device)
+
+
+class Tag(models.Model):
+    name = models.CharField(
+        max_length=50,
+        unique=True
+    )
+    slug = models.SlugField(
+        max_length=60,
+        unique=True
+    )
+    wallpaper_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of wallpapers with this tag, maintained by tags.py"
+    )
+
+    class Meta:
+        ordering = ["-wallpaper_count", "name"]
+        indexes = [
+            models.Index(fields=['-wallpaper_count', 'name'], name='tag_popularity_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class LibraryStat(models.Model):
+    """Precomputed wallpaper count and size for one slice of the library"""
+
+    DIMENSION_CHOICES = [
+        ('total', 'Total'),
+        ('category', 'Category'),
+        ('device', 'Device'),
+        ('resolution', 'Resolution'),
+    ]
+
+    dimension = models.CharField(
+        max_length=20,
+        choices=DIMENSION_CHOICES
+    )
+    value = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="Category/device/resolution label, empty for the total row"
+    )
+    count = models.IntegerField(default=0)
+    total_bytes = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ["dimension", "-count"]
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'value'], name='unique_library_stat'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}:{self.value or '*'}"
 
     @property
-    def aspect_ratio(self):
-        """Return aspect ratio as string (e.g. '16:9')"""
-        if not self.width or not self.height:
-            return None
-            
-        def gcd(a, b):
-            while b:
-                a, b = b, a % b
-            return a
-            
-        divisor = gcd(self.width, self.height)
-        return f"{self.width//divisor}:{self.height//divisor}"
\ No newline at end of file
+    def average_bytes(self):
+        return self.total_bytes // self.count if self.count else 0
+
+
+class SlugCounter(models.Model):
+    """Next free numeric suffix for one base slug, see slugs.py"""
+
+    base = models.CharField(
+        max_length=255,
+        unique=True
+    )
+    next_suffix = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.base} -> {self.next_suffix}"
+
+
+class RelatedWallpaper(models.Model):
+    """One precomputed neighbour of a wallpaper, maintained by related.py"""
+
+    wallpaper = models.ForeignKey(
+        Wallpaper,
+        on_delete=models.CASCADE,
+        related_name="neighbour_links",
+        db_index=False
+    )
+    neighbour = models.ForeignKey(
+        Wallpaper,
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ["wallpaper", "rank"]
+        constraints = [
+            # doubles as the (wallpaper, rank) index detail() reads
+            models.UniqueConstraint(fields=['wallpaper', 'rank'], name='unique_related_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.wallpaper_id} -> {self.neighbour_id} ({self.score:.3f})"
+
+
+class WallpaperColor(models.Model):
+    """Share of one colour bin in a wallpaper's palette, maintained by colors.py"""
+
+    wallpaper = models.ForeignKey(
+        Wallpaper,
+        on_delete=models.CASCADE,
+        related_name="color_bins",
+        db_index=False
+    )
+    bin = models.PositiveSmallIntegerField()
+    weight = models.PositiveSmallIntegerField(help_text="Percent of the image in this bin")
+
+    class Meta:
+        constraints = [
+            # doubles as the per-wallpaper index sync_colors() reads and deletes by
+            models.UniqueConstraint(fields=['wallpaper', 'bin'], name='unique_wallpaper_color'),
+        ]
+        indexes = [
+            # the home ?color= filter, answered from the index alone
+            models.Index(fields=['bin', 'weight', 'wallpaper'], name='wallpaper_color_bin_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.wallpaper_id}: {self.bin} ({self.weight}%)"
+
+
+class Job(models.Model):
+    """One unit of background work, claimed and run by manage.py runworker (see jobs.py)"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    key = models.CharField(
+        max_length=100,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text="Idempotency key, enqueueing the same key again returns this job"
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(help_text="Not claimed before this time (retry backoff)")
+    last_error = models.TextField(blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            # the worker's claim query: due queued jobs, oldest first
+            models.Index(fields=['status', 'run_after', 'id'], name='job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class Event(models.Model):
+    """
+    One view or download, appended in batches by counters.py and rolled up
+    into EventRollup by events.compact(). Nothing reads it for display.
+    """
+
+    VIEW = "view"
+    DOWNLOAD = "download"
+    KIND_CHOICES = [
+        (VIEW, "View"),
+        (DOWNLOAD, "Download"),
+    ]
+
+    # no constraint or cascade: the log outlives deleted wallpapers until pruned
+    wallpaper = models.ForeignKey(
+        Wallpaper,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name="+"
+    )
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    res = models.CharField(max_length=10, blank=True, help_text="Download preset, blank for the original")
+    device = models.CharField(max_length=10, blank=True, help_text="Device class of the client, pc or mobile")
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # compaction reads and pruning deletes by time range
+            models.Index(fields=['created_at'], name='event_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} of {self.wallpaper_id} at {self.created_at}"
+
+
+class EventRollup(models.Model):
+    """Event counts per wallpaper, kind, resolution and device for one hour or day (UTC)"""
+
+    HOUR = "hour"
+    DAY = "day"
+    PERIOD_CHOICES = [
+        (HOUR, "Hour"),
+        (DAY, "Day"),
+    ]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField(help_text="Start of the hour or day")
+    wallpaper = models.ForeignKey(
+        Wallpaper,
+        on_delete=models.CASCADE,
+        related_name="event_rollups",
+        db_index=False
+    )
+    kind = models.CharField(max_length=8, choices=Event.KIND_CHOICES)
+    res = models.CharField(max_length=10, blank=True)
+    device = models.CharField(max_length=10, blank=True)
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            # wallpaper first, it also serves the per-wallpaper stats
+            models.UniqueConstraint(
+                fields=['wallpaper', 'period', 'bucket', 'kind', 'res', 'device'],
+                name='event_rollup_unique'
+            ),
+        ]
+        indexes = [
+            # library-wide charts
+            models.Index(fields=['period', 'bucket'], name='event_rollup_period_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.count} {self.kind}s of {self.wallpaper_id}, {self.period} of {self.bucket}"
+
+
+class SearchTerm(models.Model):
+    """Inverted index row: one token of a wallpaper's title, tags or category"""
+
+    term = models.CharField(max_length=64)
+    wallpaper = models.ForeignKey(
+        Wallpaper,
+        on_delete=models.CASCADE,
+        related_name="search_terms",
+        db_index=False
+    )
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        # also serves prefix lookups, search.py queries it as a term range
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'wallpaper'], name='unique_search_term'),
+        ]
+        indexes = [
+            # per-wallpaper lookups: ranking subqueries and reindexing on save
+            models.Index(fields=['wallpaper', 'term'], name='search_term_wallpaper_idx'),
+        ]
+
+    def __str__(self):
+        return self.term
+
@@ -0,0 +1,129 @@
+"""
+Keyset (cursor) pagination for the wallpaper grid.
+
+Instead of COUNT(*) + OFFSET, each page continues from the sort key of the
+last row it showed, e.g. ``WHERE created_at <= x AND (created_at < x OR
+(created_at = x AND id < y))``, which is an index range scan however deep
+the page is. Cursors are signed tokens so
+clients can't tamper with them; a bad or stale token just yields page one.
+"""
+from datetime import datetime
+
+from django.core import signing
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+CURSOR_SALT = "wallpapers.cursor"
+# stop counting here, "1000+" is all a listing needs to show
+APPROXIMATE_COUNT_CAP = 1000
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @cached_property
+    def next_cursor(self):
+        if self.has_next and self.object_list:
+            return self.paginator.encode(self.object_list[-1], "next")
+        return None
+
+    @cached_property
+    def previous_cursor(self):
+        if self.has_previous and self.object_list:
+            return self.paginator.encode(self.object_list[0], "prev")
+        return None
+
+    @cached_property
+    def approximate_count(self):
+        return self.paginator.approximate_count()
+
+
+class KeysetPaginator:
+    """
+    Paginate qs by descending (field, id). ``key`` names the sort field,
+    which must match the queryset ordering and have a composite index with id.
+    """
+
+    def __init__(self, qs, per_page, key):
+        self.qs = qs
+        self.per_page = per_page
+        self.key = key
+
+    def get_page(self, cursor):
+        values, direction = self.decode(cursor)
+        qs = self.qs
+        if values is None:
+            direction = "next"
+        else:
+            qs = qs.filter(self.seek(values, direction))
+
+        if direction == "next":
+            rows = list(qs.order_by(f"-{self.key}", "-id")[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            return KeysetPage(rows, self, has_next=has_more, has_previous=values is not None)
+
+        # walk backwards in ascending order, then flip back for display
+        rows = list(qs.order_by(self.key, "id")[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return KeysetPage(rows, self, has_next=True, has_previous=has_more)
+
+    def seek(self, values, direction):
+        """
+        (key, id) past values. The OR alone can't bound an index scan, so the
+        key <= value (>= going back) conjunct is repeated in front of it.
+        """
+        value, pk = values
+        op = "lt" if direction == "next" else "gt"
+        return Q(**{f"{self.key}__{op}e": value}) & (
+            Q(**{f"{self.key}__{op}": value}) | Q(**{self.key: value, f"id__{op}": pk})
+        )
+
+    def encode(self, obj, direction):
+        value = getattr(obj, self.key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        return signing.dumps([self.key, value, obj.pk, direction], salt=CURSOR_SALT, compress=True)
+
+    def decode(self, cursor):
+        if not cursor:
+            return None, None
+        try:
+            key, value, pk, direction = signing.loads(cursor, salt=CURSOR_SALT)
+        except (signing.BadSignature, ValueError, TypeError):
+            return None, None
+        # a cursor from another sort order is meaningless here
+        if key != self.key or direction not in ("next", "prev"):
+            return None, None
+        if self.qs.model._meta.get_field(key).get_internal_type() == "DateTimeField":
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                return None, None
+        return (value, pk), direction
+
+    def approximate_count(self):
+        """(count, is_exact) without scanning the whole table"""
+        if not self.qs.query.where and connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                    [self.qs.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return row[0], False
+        n = self.qs.order_by()[:APPROXIMATE_COUNT_CAP + 1].count()
+        return min(n, APPROXIMATE_COUNT_CAP), n <= APPROXIMATE_COUNT_CAP
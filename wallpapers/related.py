@@ -0,0 +1,268 @@
+"""
+Precomputed "More Like This" neighbours.
+
+Every wallpaper gets a feature vector built from four blocks, each L2
+normalized and scaled by the square root of its weight, so the cosine of
+two vectors is the weighted sum of the per-block similarities:
+
+* tags: hashed bag of the wallpaper's tag ids
+* colour: 4x4x4 RGB histogram of the stored blur-up placeholder
+* category: one-hot
+* resolution: one-hot tier and orientation
+
+NumPy scores a batch of rows against the whole library with one matrix
+product and keeps the top NEIGHBOURS per row in RelatedWallpaper, so the
+detail page reads its related strip with one indexed query. Of the stored
+neighbours, the strip shows the best after a boost for trending ones
+(trending.rerank).
+
+Each wallpaper's vector is kept in ``related_features``, so only changed
+wallpapers are decoded and looked up again. save() flags a wallpaper
+``related_stale``. refresh(), run by ``manage.py update_related``,
+recomputes the vectors and lists of the stale rows, plus every list the
+changed wallpapers would now enter or have to leave. Its flags are
+cleared only for rows not saved again while it ran. Both bump the related
+generation (caching.py), so cached detail pages revalidate.
+"""
+import base64
+import io
+
+import numpy as np
+from PIL import Image
+from django.db import transaction
+from django.db.models import Count, Min, Q
+
+from . import caching, trending
+from .models import RelatedWallpaper, Wallpaper
+
+NEIGHBOURS = 12
+TAG_DIMS = 256
+COLOR_LEVELS = 4
+
+WEIGHTS = {"tags": 0.5, "color": 0.25, "category": 0.15, "resolution": 0.1}
+
+CATEGORIES = [c for c, _ in Wallpaper.CATEGORY_CHOICES]
+ORIENTATIONS = [o for o, _ in Wallpaper.ORIENTATION_CHOICES]
+TIERS = [t for t, _ in Wallpaper.RESOLUTION_TIERS]
+
+DIMS = TAG_DIMS + COLOR_LEVELS ** 3 + len(CATEGORIES) + len(TIERS) + len(ORIENTATIONS)
+
+# cap on rows x library size per similarity batch, 16M float32 cells = 64 MB
+BATCH_CELLS = 16_000_000
+# wallpapers whose features are computed (and ids looked up) per query
+FEATURE_BATCH = 500
+
+
+def color_histogram(placeholder):
+    """Normalized 64-bin colour histogram of a placeholder data URI (zeros if none)"""
+    hist = np.zeros(COLOR_LEVELS ** 3, dtype=np.float32)
+    if not placeholder or "," not in placeholder:
+        return hist
+    try:
+        data = base64.b64decode(placeholder.split(",", 1)[1])
+        with Image.open(io.BytesIO(data)) as img:
+            pixels = np.asarray(img.convert("RGB"), dtype=np.uint16).reshape(-1, 3)
+    except Exception:
+        return hist
+    levels = pixels * COLOR_LEVELS // 256
+    bins = (levels[:, 0] * COLOR_LEVELS + levels[:, 1]) * COLOR_LEVELS + levels[:, 2]
+    np.add.at(hist, bins, 1)
+    return hist
+
+
+def build_matrix(recompute=None):
+    """
+    (ids, matrix) with one normalized feature row per wallpaper. Rows are
+    read from related_features; the ids in recompute (every row if None)
+    and rows without a usable stored vector are computed and stored.
+    """
+    rows = Wallpaper.objects.order_by("id").values_list("id", "related_features")
+    ids, stored = [], []
+    for pk, features in rows.iterator(chunk_size=2000):
+        ids.append(pk)
+        stored.append(features)
+    ids = np.asarray(ids, dtype=np.int64)
+    matrix = np.zeros((len(ids), DIMS), dtype=np.float32)
+
+    todo = []
+    for i, (pk, features) in enumerate(zip(ids.tolist(), stored)):
+        if recompute is None or pk in recompute or features is None or len(features) != DIMS * 4:
+            todo.append(i)
+        else:
+            matrix[i] = np.frombuffer(features, dtype=np.float32)
+
+    for start in range(0, len(todo), FEATURE_BATCH):
+        batch = todo[start:start + FEATURE_BATCH]
+        pks = ids[batch].tolist()
+        vectors = compute_features(pks)
+        matrix[batch] = vectors
+        Wallpaper.objects.bulk_update(
+            [Wallpaper(pk=pk, related_features=vector.tobytes()) for pk, vector in zip(pks, vectors)],
+            ["related_features"]
+        )
+    return ids, matrix
+
+
+def compute_features(pks):
+    """Feature rows of the wallpapers pks, in that order"""
+    position = {pk: i for i, pk in enumerate(pks)}
+    rows = Wallpaper.objects.filter(pk__in=pks).values_list(
+        "id", "category", "resolution_tier", "orientation", "placeholder"
+    )
+
+    tags = np.zeros((len(pks), TAG_DIMS), dtype=np.float32)
+    through = Wallpaper.tag_set.through.objects.filter(wallpaper_id__in=pks).values_list("wallpaper_id", "tag_id")
+    for wallpaper_id, tag_id in through:
+        tags[position[wallpaper_id], tag_id % TAG_DIMS] = 1
+
+    color = np.zeros((len(pks), COLOR_LEVELS ** 3), dtype=np.float32)
+    category = np.zeros((len(pks), len(CATEGORIES)), dtype=np.float32)
+    resolution = np.zeros((len(pks), len(TIERS) + len(ORIENTATIONS)), dtype=np.float32)
+    for pk, cat, tier, orientation, placeholder in rows:
+        i = position[pk]
+        color[i] = color_histogram(placeholder)
+        if cat in CATEGORIES:
+            category[i, CATEGORIES.index(cat)] = 1
+        if tier in TIERS:
+            resolution[i, TIERS.index(tier)] = 1
+        if orientation in ORIENTATIONS:
+            resolution[i, len(TIERS) + ORIENTATIONS.index(orientation)] = 1
+
+    blocks = {"tags": tags, "color": color, "category": category, "resolution": resolution}
+    matrix = np.hstack([_normalize(blocks[name]) * np.sqrt(weight) for name, weight in WEIGHTS.items()])
+    return matrix.astype(np.float32)
+
+
+def _normalize(block):
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    return np.divide(block, norms, out=np.zeros_like(block), where=norms > 0)
+
+
+def top_neighbours(ids, matrix, rows, k=NEIGHBOURS):
+    """Yield (wallpaper id, [(neighbour id, score), ...]) for the given row positions"""
+    if len(ids) < 2:
+        for row in rows:
+            yield int(ids[row]), []
+        return
+    k = min(k, len(ids) - 1)
+    batch_size = max(1, BATCH_CELLS // len(ids))
+    for start in range(0, len(rows), batch_size):
+        batch = np.asarray(rows[start:start + batch_size])
+        scores = matrix[batch] @ matrix.T
+        scores[np.arange(len(batch)), batch] = -np.inf
+        # unordered top k first, then sort only those k
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        for row, cols, vals in zip(batch, best, best_scores):
+            yield int(ids[row]), [(int(ids[c]), float(v)) for c, v in zip(cols, vals) if v > 0]
+
+
+def stale_snapshot():
+    """{id: updated_at} of the wallpapers flagged related_stale right now"""
+    return dict(Wallpaper.objects.filter(related_stale=True).values_list("id", "updated_at"))
+
+
+def rebuild():
+    """Recompute the features and neighbours of every wallpaper"""
+    stale = stale_snapshot()
+    ids, matrix = build_matrix()
+    done = _store(top_neighbours(ids, matrix, list(range(len(ids)))))
+    _stored(done)
+    _clear_stale(stale)
+    return done
+
+
+def refresh():
+    """Recompute stale wallpapers and the lists they now belong in"""
+    stale = stale_snapshot()
+    if not stale:
+        return 0
+    ids, matrix = build_matrix(recompute=stale)
+    position = {pk: i for i, pk in enumerate(ids.tolist())}
+    stale_rows = [position[pk] for pk in stale if pk in position]
+
+    # a list takes a changed wallpaper if it beats the list's weakest entry
+    floor = np.full(len(ids), np.inf, dtype=np.float32)
+    counts = np.zeros(len(ids), dtype=np.int32)
+    lists = RelatedWallpaper.objects.values("wallpaper_id").annotate(weakest=Min("score"), n=Count("id")).order_by()
+    for row in lists.iterator(chunk_size=10000):
+        i = position.get(row["wallpaper_id"])
+        if i is not None:
+            floor[i], counts[i] = row["weakest"], row["n"]
+    # lists that aren't full take anything similar at all
+    floor[counts < min(NEIGHBOURS, len(ids) - 1)] = 0
+
+    affected = set(stale_rows)
+    # a list pointing at a changed wallpaper may have to drop it
+    stale_ids = list(stale)
+    for start in range(0, len(stale_ids), FEATURE_BATCH):
+        pointing = RelatedWallpaper.objects.filter(neighbour_id__in=stale_ids[start:start + FEATURE_BATCH])
+        for wallpaper_id in pointing.values_list("wallpaper_id", flat=True):
+            if wallpaper_id in position:
+                affected.add(position[wallpaper_id])
+
+    if stale_rows:
+        batch_size = max(1, BATCH_CELLS // len(ids))
+        for start in range(0, len(stale_rows), batch_size):
+            batch = stale_rows[start:start + batch_size]
+            scores = matrix @ matrix[batch].T
+            scores[batch, np.arange(len(batch))] = -np.inf
+            affected.update(np.nonzero((scores > floor[:, None]).any(axis=1))[0].tolist())
+
+    done = _store(top_neighbours(ids, matrix, sorted(affected)))
+    _stored(done)
+    _clear_stale(stale)
+    return done
+
+
+def _stored(done):
+    # related strips changed, though no wallpaper's updated_at did
+    if done:
+        caching.bump_generation(caching.RELATED_GENERATION_KEY)
+
+
+def _clear_stale(snapshot):
+    """
+    Clear related_stale of the snapshotted wallpapers, except the ones saved
+    since (their updated_at moved): they were read too late, or changed after
+    their neighbours were computed, and need another refresh.
+    """
+    items = list(snapshot.items())
+    for start in range(0, len(items), FEATURE_BATCH):
+        unchanged = Q()
+        for pk, updated_at in items[start:start + FEATURE_BATCH]:
+            unchanged |= Q(pk=pk, updated_at=updated_at)
+        Wallpaper.objects.filter(unchanged, related_stale=True).update(related_stale=False)
+
+
+def _store(results, batch_size=500):
+    """Replace the stored neighbours of each wallpaper in results"""
+    done, pks, rows = 0, [], []
+
+    def flush():
+        with transaction.atomic():
+            RelatedWallpaper.objects.filter(wallpaper_id__in=pks).delete()
+            RelatedWallpaper.objects.bulk_create(rows)
+        pks.clear()
+        rows.clear()
+
+    for pk, neighbours in results:
+        pks.append(pk)
+        rows.extend(
+            RelatedWallpaper(wallpaper_id=pk, neighbour_id=n, rank=rank, score=score)
+            for rank, (n, score) in enumerate(neighbours)
+        )
+        done += 1
+        if len(pks) >= batch_size:
+            flush()
+    flush()
+    return done
+
+
+def related_for(wp, limit=6):
+    """The stored neighbours of wp, best first, trending ones nudged up"""
+    links = RelatedWallpaper.objects.filter(wallpaper=wp).select_related("neighbour").order_by("rank")[:NEIGHBOURS]
+    return trending.rerank([(link.neighbour, link.score) for link in links], limit)
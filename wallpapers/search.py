@@ -0,0 +1,165 @@
+"""
+Search for the home page query box.
+
+Two backends share one interface, ``search(qs, q)``, which filters ``qs``
+to wallpapers matching every word of ``q`` (prefix match on each word) and
+annotates ``search_rank`` for relevance ordering.
+
+* ``postgres``: a weighted ``SearchVector`` over title/tags/category with a
+  GIN expression index on exactly that vector (created by ensure_index()
+  after migrate), so Postgres maintains it on every write.
+* ``inverted``: our own ``SearchTerm`` table (token -> wallpaper, weight),
+  kept up to date from the Wallpaper save signal. Works on any database,
+  which is what SQLite/dev uses.
+
+SEARCH_BACKEND = "auto" picks postgres when running on Postgres.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Max, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import SearchTerm, Wallpaper
+
+# field -> relevance weight, title matches count most
+FIELD_WEIGHTS = {"title": 3, "tags": 2, "category": 1}
+POSTGRES_WEIGHTS = {"title": "A", "tags": "B", "category": "C"}
+
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+INDEX_NAME = "wallpaper_search_gin"
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# sorts after every real character, closes the range for prefix scans
+PREFIX_END = "\U0010ffff"
+
+
+def tokenize(text):
+    return [t[:MAX_TERM_LENGTH] for t in TOKEN_RE.findall((text or "").lower())]
+
+
+def get_backend():
+    backend = settings.SEARCH_BACKEND
+    if backend == "auto":
+        backend = "postgres" if connection.vendor == "postgresql" else "inverted"
+    return backend
+
+
+def search(qs, q):
+    terms = list(dict.fromkeys(tokenize(q)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return qs.none()
+    if get_backend() == "postgres":
+        return _search_postgres(qs, terms)
+    return _search_inverted(qs, terms)
+
+
+# Postgres full-text ---------------------------------------------------------
+
+def search_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    vector = None
+    for field, weight in POSTGRES_WEIGHTS.items():
+        part = SearchVector(field, weight=weight, config="simple")
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def _search_postgres(qs, terms):
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+
+    # tokens are \w+ only, so they are safe to splice into a raw tsquery
+    query = SearchQuery(" & ".join(f"{t}:*" for t in terms), search_type="raw", config="simple")
+    vector = search_vector()
+    return qs.annotate(search_document=vector).filter(search_document=query).annotate(
+        search_rank=SearchRank(vector, query)
+    )
+
+
+def ensure_index(using="default"):
+    """Create the GIN index for the Postgres backend if it is missing"""
+    from django.contrib.postgres.indexes import GinIndex
+    from django.db import connections
+
+    conn = connections[using]
+    if conn.vendor != "postgresql":
+        return False
+    with conn.cursor() as cursor:
+        existing = conn.introspection.get_constraints(cursor, Wallpaper._meta.db_table)
+    if INDEX_NAME in existing:
+        return False
+    with conn.schema_editor() as editor:
+        editor.add_index(Wallpaper, GinIndex(search_vector(), name=INDEX_NAME))
+    return True
+
+
+# Inverted index -------------------------------------------------------------
+
+def _terms_for(pk, title, tags, category):
+    weights = {}
+    category_label = dict(Wallpaper.CATEGORY_CHOICES).get(category, "")
+    sources = {
+        "title": title,
+        "tags": tags,
+        "category": f"{category} {category_label}",
+    }
+    for field, text in sources.items():
+        for token in tokenize(text):
+            weights[token] = max(weights.get(token, 0), FIELD_WEIGHTS[field])
+    return [SearchTerm(term=t, wallpaper_id=pk, weight=w) for t, w in weights.items()]
+
+
+def index_wallpaper(wp):
+    """Refresh the inverted index rows of one wallpaper"""
+    if get_backend() != "inverted":
+        return
+    with transaction.atomic():
+        SearchTerm.objects.filter(wallpaper_id=wp.pk).delete()
+        SearchTerm.objects.bulk_create(_terms_for(wp.pk, wp.title, wp.tags, wp.category))
+
+
+def index_wallpapers(rows, batch_size=5000):
+    """Bulk-add index rows for (pk, title, tags, category) tuples of new wallpapers"""
+    batch, count = [], 0
+    for row in rows:
+        batch.extend(_terms_for(*row))
+        if len(batch) >= batch_size:
+            SearchTerm.objects.bulk_create(batch, ignore_conflicts=True)
+            count += len(batch)
+            batch = []
+    SearchTerm.objects.bulk_create(batch, ignore_conflicts=True)
+    return count + len(batch)
+
+
+def rebuild_index(batch_size=5000):
+    """Throw away and rebuild the inverted index (or create the GIN index on Postgres)"""
+    if get_backend() == "postgres":
+        ensure_index()
+        return 0
+    with transaction.atomic():
+        SearchTerm.objects.all().delete()
+        rows = Wallpaper.objects.values_list("pk", "title", "tags", "category").iterator(
+            chunk_size=batch_size
+        )
+        return index_wallpapers(rows, batch_size)
+
+
+def _search_inverted(qs, terms):
+    rank = Value(0)
+    for term in terms:
+        matches = SearchTerm.objects.filter(term__gte=term, term__lt=term + PREFIX_END)
+        # every word has to match somewhere
+        qs = qs.filter(pk__in=matches.values("wallpaper_id"))
+        # exact word matches score double compared to prefix-only ones
+        best = matches.filter(wallpaper_id=OuterRef("pk")).values("wallpaper_id").annotate(
+            best=Max(Case(
+                When(term=term, then=F("weight") * 2),
+                default=F("weight"),
+                output_field=IntegerField()
+            ))
+        ).values("best")[:1]
+        rank = rank + Coalesce(Subquery(best), 0)
+    return qs.annotate(search_rank=rank)
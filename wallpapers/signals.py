@@ -0,0 +1,65 @@
+"""
+Model signal handlers that keep derived data (search index, ...) in step
+with Wallpaper writes. Connected in WallpapersConfig.ready().
+"""
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import caching, colors, search, stats, tags
+from .models import RelatedWallpaper, Wallpaper
+
+
+@receiver(pre_save, sender=Wallpaper)
+def wallpaper_saving(sender, instance, **kwargs):
+    # remember what the stats currently count this wallpaper as
+    instance._stats_before = None
+    if instance.pk and not instance._state.adding:
+        instance._stats_before = Wallpaper.objects.filter(pk=instance.pk).values(
+            *stats.TRACKED_FIELDS
+        ).first()
+
+
+@receiver(post_save, sender=Wallpaper)
+def wallpaper_saved(sender, instance, **kwargs):
+    search.index_wallpaper(instance)
+    tags.sync_tags(instance)
+    colors.sync_colors(instance)
+
+    before, after = getattr(instance, "_stats_before", None), stats.snapshot(instance)
+    if before != after:
+        if before:
+            stats.apply([before], -1)
+        stats.apply([after], 1)
+
+    caching.bump_generation()
+
+
+@receiver(pre_delete, sender=Wallpaper)
+def wallpaper_deleting(sender, instance, **kwargs):
+    tags.wallpaper_deleted(instance)
+    # lists that showed it lose an entry, let related.refresh() refill them;
+    # updated_at moves too, so a refresh already under way keeps the flag
+    Wallpaper.objects.filter(
+        pk__in=RelatedWallpaper.objects.filter(neighbour=instance).values("wallpaper_id")
+    ).update(related_stale=True, updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Wallpaper)
+def wallpaper_deleted(sender, instance, **kwargs):
+    stats.apply([stats.snapshot(instance)], -1)
+    caching.bump_generation()
+
+
+def wallpapers_created(instances):
+    """bulk_create() sends no post_save, call this for the created rows instead"""
+    if search.get_backend() == "inverted":
+        search.index_wallpapers((wp.pk, wp.title, wp.tags, wp.category) for wp in instances)
+    tags.sync_tags_bulk(instances)
+    colors.sync_colors_bulk(instances)
+    stats.apply([stats.snapshot(wp) for wp in instances], 1)
+    caching.bump_generation()
+
+
+def ensure_search_index(sender, using="default", **kwargs):
+    search.ensure_index(using)
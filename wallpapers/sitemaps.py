@@ -0,0 +1,198 @@
+"""
+Sitemap index and numbered child sitemaps.
+
+The protocol caps a sitemap at 50,000 URLs, so ``sitemap.xml`` is an index
+pointing at ``sitemap-1.xml``, ``sitemap-2.xml``... Each child covers a
+contiguous id range holding at most SITEMAP_SECTION_SIZE URLs, the home
+page included in the first. The section boundaries and their last-modified
+times come from one pass over (id, updated_at), cached per library
+generation, which is also what the ETag/Last-Modified validators are built
+from, so crawlers re-fetching an unchanged sitemap get a 304 without
+touching the wallpaper rows.
+
+Child sitemaps are streamed straight from a ``values_list`` iterator and the
+finished body is kept (compressed) in the cache until the next upload.
+"""
+import hashlib
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from xml.sax.saxutils import escape
+
+from . import caching
+from .models import Wallpaper
+from .tags import parse_tags
+
+SECTIONS_KEY = "wallpapers:sitemap:{}:sections"
+BODY_KEY = "wallpapers:sitemap:{}:{}:{}"
+
+# urls joined per yielded chunk when streaming
+STREAM_BATCH = 500
+
+URLSET_OPEN = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"\n'
+    '        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">\n'
+)
+URLSET_CLOSE = "</urlset>\n"
+
+
+class Section:
+    def __init__(self, number, first_id, last_id, count, lastmod):
+        self.number = number
+        self.first_id = first_id
+        self.last_id = last_id
+        self.count = count
+        self.lastmod = lastmod
+
+    @property
+    def etag(self):
+        key = f"{self.number}:{self.first_id}:{self.last_id}:{self.count}:{self.lastmod}"
+        return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+def sections():
+    """The child sitemaps as a list of Section, cached per library generation"""
+    key = SECTIONS_KEY.format(caching.get_generation())
+    result = cache.get(key)
+    if result is None:
+        result = _compute_sections(settings.SITEMAP_SECTION_SIZE)
+        cache.set(key, result, settings.SITEMAP_CACHE_TIMEOUT)
+    return result
+
+
+def get_section(number):
+    all_sections = sections()
+    if 1 <= number <= len(all_sections):
+        return all_sections[number - 1]
+    return None
+
+
+def _compute_sections(size):
+    result = []
+    current = None
+    rows = Wallpaper.objects.order_by("id").values_list("id", "updated_at").iterator(chunk_size=5000)
+    for pk, updated_at in rows:
+        # section 1 keeps a slot for the home page
+        if current is None or current.count >= (max(1, size - 1) if current.number == 1 else size):
+            current = Section(len(result) + 1, pk, pk, 0, updated_at)
+            result.append(current)
+        current.last_id = pk
+        current.count += 1
+        if updated_at and (current.lastmod is None or updated_at > current.lastmod):
+            current.lastmod = updated_at
+    if not result:
+        # an empty library still gets one sitemap with the home page
+        result.append(Section(1, 0, 0, 0, None))
+    return result
+
+
+def index_etag():
+    return hashlib.md5(
+        "|".join(s.etag for s in sections()).encode(), usedforsecurity=False
+    ).hexdigest()
+
+
+def index_lastmod():
+    dates = [s.lastmod for s in sections() if s.lastmod]
+    return max(dates) if dates else None
+
+
+def render_index(base_url):
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n',
+    ]
+    for section in sections():
+        loc = base_url + reverse("wallpapers:sitemap_section", args=[section.number])
+        parts.append("  <sitemap>\n")
+        parts.append(f"    <loc>{escape(loc)}</loc>\n")
+        if section.lastmod:
+            parts.append(f"    <lastmod>{section.lastmod.strftime('%Y-%m-%d')}</lastmod>\n")
+        parts.append("  </sitemap>\n")
+    parts.append("</sitemapindex>\n")
+    return "".join(parts)
+
+
+def cached_section(section, base_url):
+    """The finished body of a child sitemap, or None if it isn't cached"""
+    body = cache.get(_body_key(section, base_url))
+    return zlib.decompress(body) if body is not None else None
+
+
+def stream_section(section, base_url):
+    """Yield a child sitemap in chunks, caching the complete body at the end"""
+    chunks = []
+    for chunk in _generate_section(section, base_url):
+        chunk = chunk.encode()
+        chunks.append(chunk)
+        yield chunk
+    cache.set(
+        _body_key(section, base_url),
+        zlib.compress(b"".join(chunks)),
+        settings.SITEMAP_CACHE_TIMEOUT
+    )
+
+
+def _body_key(section, base_url):
+    host = hashlib.md5(base_url.encode(), usedforsecurity=False).hexdigest()
+    return BODY_KEY.format(caching.get_generation(), section.number, host)
+
+
+def _generate_section(section, base_url):
+    yield URLSET_OPEN
+    if section.number == 1:
+        yield _url_xml(base_url + reverse("wallpapers:home"), "1.0", "daily")
+
+    # only the columns the XML needs, no model instances
+    rows = Wallpaper.objects.filter(
+        id__gte=section.first_id, id__lte=section.last_id
+    ).order_by("id").values_list(
+        "slug", "title", "tags", "view_link", "download_link", "updated_at"
+    ).iterator(chunk_size=2000)
+
+    detail_prefix = base_url + reverse("wallpapers:detail", args=["slug-placeholder"])
+    batch = []
+    for slug, title, tags, view_link, download_link, updated_at in rows:
+        image_url = view_link or download_link
+        batch.append(_url_xml(
+            detail_prefix.replace("slug-placeholder", slug),
+            "0.9",
+            "weekly",
+            lastmod=updated_at,
+            image=_image(title, tags, image_url) if image_url else None
+        ))
+        if len(batch) >= STREAM_BATCH:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+    yield URLSET_CLOSE
+
+
+def _image(title, tags, image_url):
+    names = parse_tags(tags)
+    seo_keywords = ", ".join(names[:5]) if names else "HD, 4K, wallpaper"
+    return {
+        "loc": image_url,
+        "title": f"{title} | {seo_keywords}",
+        "caption": f"Download {title} in {seo_keywords} resolution from WallPortal.",
+    }
+
+
+def _url_xml(loc, priority, changefreq, lastmod=None, image=None):
+    parts = ["  <url>\n", f"    <loc>{escape(loc)}</loc>\n"]
+    if lastmod:
+        parts.append(f"    <lastmod>{lastmod.strftime('%Y-%m-%d')}</lastmod>\n")
+    parts.append(f"    <changefreq>{changefreq}</changefreq>\n")
+    parts.append(f"    <priority>{priority}</priority>\n")
+    if image:
+        parts.append("    <image:image>\n")
+        parts.append(f"      <image:loc>{escape(image['loc'])}</image:loc>\n")
+        parts.append(f"      <image:title>{escape(image['title'])}</image:title>\n")
+        parts.append(f"      <image:caption>{escape(image['caption'])}</image:caption>\n")
+        parts.append("    </image:image>\n")
+    parts.append("  </url>\n")
+    return "".join(parts)
@@ -0,0 +1,75 @@
+"""
+Unique slug allocation.
+
+Each base slug ("naruto") has a SlugCounter row holding the next free
+suffix: 0 hands out the bare base, n hands out "naruto-n". Reserving k slugs
+is one ``UPDATE ... SET next_suffix = next_suffix + k`` plus a read-back, so
+it costs the same however many "Naruto" wallpapers already exist, and the
+row lock makes concurrent uploads take turns instead of racing to the same
+slug.
+
+A counter row is created on first use and starts after the highest numeric
+suffix already in the table (one indexed prefix query). Slugs set by hand
+can still collide with a reserved one; save() and the bulk paths catch the
+IntegrityError and reserve again.
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.text import slugify
+
+# leave room for "-<suffix>" within Wallpaper.slug's 255 characters
+MAX_BASE_LENGTH = 240
+MAX_ATTEMPTS = 5
+SUFFIX_RE = re.compile(r"^-(\d+)$")
+
+
+def base_slug(title):
+    return slugify(title)[:MAX_BASE_LENGTH].strip("-") or "wallpaper"
+
+
+def reserve(base, count=1):
+    """Reserve count unused slugs for base, in order"""
+    from .models import SlugCounter
+
+    with transaction.atomic():
+        updated = SlugCounter.objects.filter(base=base).update(next_suffix=F("next_suffix") + count)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    SlugCounter.objects.create(base=base, next_suffix=_first_free_suffix(base) + count)
+            except IntegrityError:
+                # another upload created the counter first, take the next block
+                SlugCounter.objects.filter(base=base).update(next_suffix=F("next_suffix") + count)
+        end = SlugCounter.objects.filter(base=base).values_list("next_suffix", flat=True).get()
+    return [_format(base, n) for n in range(end - count, end)]
+
+
+def assign_slugs(wallpapers):
+    """Give every wallpaper without a slug a unique one, one reservation per base"""
+    groups = {}
+    for wp in wallpapers:
+        if not wp.slug:
+            groups.setdefault(base_slug(wp.title), []).append(wp)
+    for base, group in groups.items():
+        for wp, slug in zip(group, reserve(base, len(group))):
+            wp.slug = slug
+
+
+def _format(base, n):
+    return base if n == 0 else f"{base}-{n}"
+
+
+def _first_free_suffix(base):
+    from .models import Wallpaper
+
+    highest = -1
+    for slug in Wallpaper.objects.filter(slug__startswith=base).values_list("slug", flat=True):
+        if slug == base:
+            highest = max(highest, 0)
+        else:
+            match = SUFFIX_RE.match(slug[len(base):])
+            if match:
+                highest = max(highest, int(match.group(1)))
+    return highest + 1
@@ -0,0 +1,86 @@
+"""
+Precomputed library statistics (count and bytes: total, per category,
+device and resolution label) for the staff header and the admin.
+
+Rows in LibraryStat are adjusted with F() deltas from the Wallpaper
+signals, so reading them is a single small query instead of aggregating
+the whole wallpaper table. rebuild() recomputes everything from scratch.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+
+from .models import LibraryStat, Wallpaper
+
+# LibraryStat.dimension -> Wallpaper field
+DIMENSIONS = {
+    "category": "category",
+    "device": "device",
+    "resolution": "resolution_label",
+}
+TRACKED_FIELDS = ["size_bytes", *DIMENSIONS.values()]
+
+
+def snapshot(wp):
+    """The values of wp that stats depend on"""
+    return {field: getattr(wp, field) for field in TRACKED_FIELDS}
+
+
+def apply(snapshots, sign):
+    """Add (sign=1) or remove (sign=-1) wallpapers, given as snapshot() dicts"""
+    deltas = defaultdict(lambda: [0, 0])
+    for snap in snapshots:
+        size = snap["size_bytes"] or 0
+        keys = [("total", "")] + [(dim, snap[field] or "") for dim, field in DIMENSIONS.items()]
+        for key in keys:
+            deltas[key][0] += sign
+            deltas[key][1] += sign * size
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        LibraryStat.objects.bulk_create(
+            [LibraryStat(dimension=dim, value=value) for dim, value in deltas],
+            ignore_conflicts=True
+        )
+        for (dim, value), (count, size) in deltas.items():
+            LibraryStat.objects.filter(dimension=dim, value=value).update(
+                count=F("count") + count,
+                total_bytes=F("total_bytes") + size
+            )
+
+
+def rebuild():
+    """Recompute all rows from the wallpaper table"""
+    rows = []
+    totals = Wallpaper.objects.aggregate(n=Count("id"), size=Coalesce(Sum("size_bytes"), 0))
+    rows.append(LibraryStat(dimension="total", value="", count=totals["n"], total_bytes=totals["size"]))
+    for dim, field in DIMENSIONS.items():
+        groups = Wallpaper.objects.order_by().values(field).annotate(
+            n=Count("id"), size=Coalesce(Sum("size_bytes"), 0)
+        )
+        for group in groups:
+            rows.append(LibraryStat(
+                dimension=dim, value=group[field] or "", count=group["n"], total_bytes=group["size"]
+            ))
+
+    with transaction.atomic():
+        LibraryStat.objects.all().delete()
+        LibraryStat.objects.bulk_create(rows)
+    return len(rows)
+
+
+def totals():
+    """(count, total_bytes) of the whole library"""
+    row = LibraryStat.objects.filter(dimension="total", value="").values_list("count", "total_bytes").first()
+    return row or (0, 0)
+
+
+def breakdown():
+    """{dimension: [LibraryStat, ...]} for every non-empty slice"""
+    result = defaultdict(list)
+    for stat in LibraryStat.objects.filter(count__gt=0).exclude(dimension="total"):
+        result[stat.dimension].append(stat)
+    return dict(result)
@@ -0,0 +1,128 @@
+"""
+Normalized tags.
+
+The comma-separated ``Wallpaper.tags`` field stays the editable source (upload
+form, admin). sync_tags() mirrors it into ``Wallpaper.tag_set`` and adjusts
+``Tag.wallpaper_count`` with F() increments, so the "popular tags" facet is a
+short index read, cached until a count changes, rather than a GROUP BY.
+"""
+import zlib
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.text import slugify
+
+from .models import Tag, Wallpaper
+
+POPULAR_TAGS_KEY = "wallpapers:popular_tags"
+POPULAR_TAGS_TIMEOUT = 60 * 60
+POPULAR_TAGS_LIMIT = 12
+MAX_TAG_LENGTH = 50
+
+
+def parse_tags(text):
+    """Split a comma-separated tag string into unique, normalized names"""
+    names = []
+    for part in (text or "").split(","):
+        name = " ".join(part.split()).lower()[:MAX_TAG_LENGTH]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def get_or_create_tags(names):
+    """Return {name: Tag} for names, creating the missing ones in one insert"""
+    if not names:
+        return {}
+    found = {t.name: t for t in Tag.objects.filter(name__in=names)}
+    missing = [n for n in names if n not in found]
+    if missing:
+        bases = {n: slugify(n, allow_unicode=True)[:MAX_TAG_LENGTH] or "tag" for n in missing}
+        taken = set(Tag.objects.filter(slug__in=bases.values()).values_list("slug", flat=True))
+        new_tags = []
+        for name in missing:
+            slug = bases[name]
+            # "c++" and "c" both slugify to "c", keep slugs unique
+            if slug in taken:
+                slug = f"{slug}-{zlib.crc32(name.encode()):08x}"
+            taken.add(slug)
+            new_tags.append(Tag(name=name, slug=slug))
+        Tag.objects.bulk_create(new_tags, ignore_conflicts=True)
+        found.update({t.name: t for t in Tag.objects.filter(name__in=missing)})
+    return found
+
+
+def sync_tags(wp):
+    """Make wp.tag_set match wp.tags"""
+    wanted = {t.pk for t in get_or_create_tags(parse_tags(wp.tags)).values()}
+    current = set(wp.tag_set.values_list("pk", flat=True))
+    added, removed = wanted - current, current - wanted
+    if not added and not removed:
+        return
+
+    with transaction.atomic():
+        if added:
+            wp.tag_set.add(*added)
+        if removed:
+            wp.tag_set.remove(*removed)
+        _adjust_counts({pk: 1 for pk in added} | {pk: -1 for pk in removed})
+
+
+def sync_tags_bulk(instances):
+    """sync_tags() for freshly bulk-created wallpapers, in a handful of queries"""
+    parsed = {wp.pk: parse_tags(wp.tags) for wp in instances}
+    tags = get_or_create_tags(list(dict.fromkeys(n for names in parsed.values() for n in names)))
+
+    through = Wallpaper.tag_set.through
+    rows = [
+        through(wallpaper_id=pk, tag_id=tags[name].pk)
+        for pk, names in parsed.items()
+        for name in names
+        if name in tags
+    ]
+    with transaction.atomic():
+        through.objects.bulk_create(rows, ignore_conflicts=True)
+        _adjust_counts(Counter(row.tag_id for row in rows))
+
+
+def wallpaper_deleted(wp):
+    """Release the tag counts of a wallpaper that is about to be deleted"""
+    pks = list(wp.tag_set.values_list("pk", flat=True))
+    if pks:
+        _adjust_counts({pk: -1 for pk in pks})
+
+
+def rebuild_counts():
+    """Recount every tag from the through table"""
+    through = Wallpaper.tag_set.through
+    counts = through.objects.filter(tag_id=OuterRef("pk")).values("tag_id").annotate(
+        n=Count("wallpaper_id")
+    ).values("n")
+    Tag.objects.update(wallpaper_count=Coalesce(Subquery(counts), 0))
+    cache.delete(POPULAR_TAGS_KEY)
+
+
+def popular_tags():
+    """The most used tags, for the home page strip"""
+    tags = cache.get(POPULAR_TAGS_KEY)
+    if tags is None:
+        tags = list(
+            Tag.objects.filter(wallpaper_count__gt=0)
+            .order_by("-wallpaper_count", "name")[:POPULAR_TAGS_LIMIT]
+        )
+        cache.set(POPULAR_TAGS_KEY, tags, POPULAR_TAGS_TIMEOUT)
+    return tags
+
+
+def _adjust_counts(deltas):
+    # one UPDATE per distinct delta rather than per tag
+    groups = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            groups[delta].append(pk)
+    for delta, pks in groups.items():
+        Tag.objects.filter(pk__in=pks).update(wallpaper_count=F("wallpaper_count") + delta)
+    cache.delete(POPULAR_TAGS_KEY)
@@ -0,0 +1,50 @@
+"""
+{% fragment_cache "card" wp grid_sizes %} ... {% endfragment_cache %}
+
+Caches the enclosed markup under the fragment name and the vary-on values
+(see caching.get_fragment). A wallpaper varies by id and ``updated_at``, so
+its fragments are replaced as soon as it is saved; a list of wallpapers
+varies by all of theirs; anything else by its string value. The fragment
+generation (bumped by backfills) is read once per page render.
+"""
+from django import template
+
+from wallpapers import caching
+
+register = template.Library()
+
+# render_context key of the fragment generation
+GENERATION = "fragment_cache_generation"
+
+
+def vary_part(value):
+    if hasattr(value, "pk") and hasattr(value, "updated_at"):
+        return f"{value.pk}:{value.updated_at.timestamp() if value.updated_at else ''}"
+    if isinstance(value, (list, tuple)) or hasattr(value, "model"):
+        return tuple(vary_part(item) for item in value)
+    return str(value)
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        parts = tuple(vary_part(var.resolve(context)) for var in self.vary_on)
+        if GENERATION not in context.render_context:
+            context.render_context[GENERATION] = caching.get_generation(caching.FRAGMENT_GENERATION_KEY)
+        return caching.get_fragment(
+            self.name.resolve(context), parts, lambda: self.nodelist.render(context), context.render_context[GENERATION]
+        )
+
+
+@register.tag
+def fragment_cache(parser, token):
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a fragment name and the values to vary on")
+    nodelist = parser.parse(("endfragment_cache",))
+    parser.delete_first_token()
+    return FragmentCacheNode(nodelist, parser.compile_filter(bits[1]), [parser.compile_filter(b) for b in bits[2:]])
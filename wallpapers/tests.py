@@ -1,3 +1,966 @@
-from django.test import TestCase
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, IntegrityError, connection
+from django.db.models import F
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import (
+    caching, counters, duplicates, events, httpcache, images, ingest, related, search, signals, sitemaps, slugs, stats,
+    tags, trending, upstream,
+)
+from .bench.stub_server import StubServer
+from .bench.catalogue import fake_wallpapers
+from .models import Event, EventRollup, LibraryStat, RelatedWallpaper, SearchTerm, Tag, Wallpaper
+from .pagination import KeysetPaginator
+
+
+def make_wallpapers(count, seed=0):
+    """count saved wallpapers from the benchmark catalogue"""
+    return Wallpaper.objects.bulk_create(fake_wallpapers(count, seed))
+
+
+@override_settings(COUNTER_FLUSH_INTERVAL=60, COUNTER_MAX_PENDING=1000, EVENT_LOG_ENABLED=True)
+class CounterBufferTests(TestCase):
+    def setUp(self):
+        self.wp, self.other = make_wallpapers(2)
+        self.buffer = counters.CounterBuffer()
+        # no flusher thread, flushes are explicit
+        self.buffer._ensure_thread = lambda: None
+
+    def test_flush_writes_counts_and_events(self):
+        views, downloads = self.wp.views, self.wp.downloads
+        self.buffer.record(self.wp.pk, "views", device="pc")
+        self.buffer.record(self.wp.pk, "downloads", res="4k", device="mobile")
+        self.buffer.increment(self.other.pk, "views", 3)
+        self.assertEqual(self.buffer.pending(self.wp.pk, "views"), 1)
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.wp.refresh_from_db()
+        self.assertEqual((self.wp.views, self.wp.downloads), (views + 1, downloads + 1))
+        self.assertEqual(
+            sorted(Event.objects.values_list("kind", "res", "device")),
+            [("download", "4k", "mobile"), ("view", "", "pc")],
+        )
+        self.assertEqual(self.buffer.pending(self.wp.pk, "views"), 0)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_failed_flush_keeps_everything_for_the_next(self):
+        views = self.wp.views
+        self.buffer.record(self.wp.pk, "views")
+        with mock.patch.object(Event.objects, "bulk_create", side_effect=DatabaseError), \
+                self.assertLogs("wallpapers.counters", "ERROR"):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.wp.refresh_from_db()
+        self.assertEqual(self.wp.views, views)
+        self.assertEqual(self.buffer.pending(self.wp.pk, "views"), 1)
+
+        self.buffer.record(self.wp.pk, "views")
+        self.assertEqual(self.buffer.flush(), 1)
+        self.wp.refresh_from_db()
+        self.assertEqual(self.wp.views, views + 2)
+        self.assertEqual(Event.objects.count(), 2)
+
+    @override_settings(COUNTER_MAX_PENDING=1)
+    def test_full_buffer_backs_off_after_a_failure(self):
+        with mock.patch.object(self.buffer, "_flush", wraps=self.buffer._flush) as flush, \
+                mock.patch.object(Event.objects, "bulk_create", side_effect=DatabaseError), \
+                self.assertLogs("wallpapers.counters", "ERROR"):
+            for _ in range(5):
+                self.buffer.increment(self.wp.pk, "views")
+        # one doomed inline flush, not one per request
+        self.assertEqual(flush.call_count, 1)
+        self.assertEqual(self.buffer.pending(self.wp.pk, "views"), 5)
+
+    def test_download_counts_move_downloads_listings_on_throttled(self):
+        cache.clear()
+        plain, by_downloads = caching.listing_key(("",)), caching.listing_key(("",), sort="downloads")
+        self.buffer.record(self.wp.pk, "views")
+        self.buffer.flush()
+        self.assertEqual(caching.listing_key(("",), sort="downloads"), by_downloads)
+
+        self.buffer.record(self.wp.pk, "downloads")
+        self.buffer.flush()
+        moved = caching.listing_key(("",), sort="downloads")
+        self.assertNotEqual(moved, by_downloads)
+        self.assertEqual(caching.listing_key(("",)), plain)
+
+        # the next change waits out COUNTS_GENERATION_INTERVAL, then shows up
+        self.buffer.record(self.wp.pk, "downloads")
+        self.buffer.flush()
+        self.assertEqual(caching.listing_key(("",), sort="downloads"), moved)
+        cache.delete(caching.COUNTS_THROTTLE_KEY)
+        self.assertNotEqual(caching.listing_key(("",), sort="downloads"), moved)
+
+    def test_shutdown_waits_for_the_flusher(self):
+        self.buffer.record(self.wp.pk, "views")
+        thread = mock.Mock()
+        self.buffer._thread = thread
+        self.buffer.shutdown()
+        thread.join.assert_called_once_with(counters.SHUTDOWN_TIMEOUT)
+        self.assertEqual(self.buffer.pending(self.wp.pk, "views"), 0)
+        self.assertEqual(Event.objects.count(), 1)
+
+
+@override_settings(SEARCH_BACKEND="inverted")
+class SearchTests(TestCase):
+    def setUp(self):
+        self.sunset, self.beach, self.city = fake_wallpapers(3)
+        for wp, title, tags, category in (
+            (self.sunset, "Golden Sunset", "evening, sky", "nature"),
+            (self.beach, "Quiet Beach", "sunset, ocean", "nature"),
+            (self.city, "Night City", "sunlight, neon", "cityscape"),
+        ):
+            wp.title, wp.tags, wp.category = title, tags, category
+            wp.save()
+
+    def found(self, q):
+        qs = search.search(Wallpaper.objects.all(), q).order_by("-search_rank", "title")
+        return [wp.title for wp in qs]
+
+    def test_every_word_has_to_match(self):
+        self.assertEqual(self.found("golden sunset"), ["Golden Sunset"])
+        self.assertEqual(self.found("ocean sunset"), ["Quiet Beach"])
+        self.assertEqual(self.found("desert"), [])
+        self.assertFalse(search.search(Wallpaper.objects.all(), "  ,, ").exists())
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(self.found("sun"), ["Golden Sunset", "Night City", "Quiet Beach"])
+        self.assertEqual(self.found("sunsets"), [])
+        # the category label is indexed as well as the stored value
+        self.assertEqual(self.found("Cityscape"), ["Night City"])
+
+    def test_title_beats_tags_and_exact_beats_prefix(self):
+        self.assertEqual(self.found("sunset"), ["Golden Sunset", "Quiet Beach"])
+        ranks = dict(search.search(Wallpaper.objects.all(), "sun").values_list("title", "search_rank"))
+        self.assertEqual(ranks, {"Golden Sunset": 3, "Quiet Beach": 2, "Night City": 2})
+
+    def test_saving_reindexes(self):
+        self.sunset.title = "Golden Hour"
+        self.sunset.tags = "dusk"
+        self.sunset.save()
+        self.assertEqual(self.found("sunset"), ["Quiet Beach"])
+        self.assertEqual(self.found("dusk"), ["Golden Hour"])
+        self.assertEqual(self.found("golden"), ["Golden Hour"])
+
+    def test_bulk_created_wallpapers_are_indexed(self):
+        zebra, other = fake_wallpapers(2, seed=1, start=3)
+        zebra.title = "Zebra Stripes"
+        Wallpaper.objects.bulk_create([zebra, other])
+        self.assertEqual(self.found("zebra"), [])
+        signals.wallpapers_created([zebra, other])
+        self.assertEqual(self.found("zebra"), ["Zebra Stripes"])
+        self.assertEqual(search.rebuild_index(), SearchTerm.objects.count())
+
+
+class TagCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.first, self.second = fake_wallpapers(2)
+        for wp, text in ((self.first, "Sky, sea"), (self.second, "sky")):
+            wp.tags = text
+            wp.save()
+
+    def counts(self):
+        """{name: wallpaper_count}, checked against the through table"""
+        counted = dict(Tag.objects.values_list("name", "wallpaper_count"))
+        linked = dict.fromkeys(counted, 0)
+        for name in Wallpaper.tag_set.through.objects.values_list("tag__name", flat=True):
+            linked[name] += 1
+        self.assertEqual(counted, linked)
+        return {name: n for name, n in counted.items() if n}
+
+    def test_save_counts_each_tag_once(self):
+        self.assertEqual(self.counts(), {"sky": 2, "sea": 1})
+        self.assertEqual(list(self.first.tag_set.values_list("name", flat=True).order_by("name")), ["sea", "sky"])
+
+    def test_edits_add_remove_and_rename(self):
+        self.first.tags = " SKY ,  Deep   Ocean, sky"
+        self.first.save()
+        self.assertEqual(self.counts(), {"sky": 2, "deep ocean": 1})
+        self.second.tags = ""
+        self.second.save()
+        self.assertEqual(self.counts(), {"sky": 1, "deep ocean": 1})
+        # saving again without a change leaves the counts alone
+        self.first.save()
+        self.assertEqual(self.counts(), {"sky": 1, "deep ocean": 1})
+        self.assertEqual([t.name for t in tags.popular_tags()], ["deep ocean", "sky"])
+
+    def test_delete_releases_its_tags(self):
+        tags.popular_tags()
+        self.first.delete()
+        self.assertEqual(self.counts(), {"sky": 1})
+        self.assertEqual([t.name for t in tags.popular_tags()], ["sky"])
+
+    def test_bulk_path_matches_saving(self):
+        new = list(fake_wallpapers(3, seed=1, start=2))
+        for wp, text in zip(new, ("sky, c++", "c, sea", "")):
+            wp.tags = text
+        Wallpaper.objects.bulk_create(new)
+        signals.wallpapers_created(new)
+        self.assertEqual(self.counts(), {"sky": 3, "sea": 2, "c++": 1, "c": 1})
+        self.assertEqual(len(set(Tag.objects.values_list("slug", flat=True))), Tag.objects.count())
+        tags.rebuild_counts()
+        self.assertEqual(self.counts(), {"sky": 3, "sea": 2, "c++": 1, "c": 1})
+
+
+class LibraryStatTests(TestCase):
+    def stored(self):
+        rows = LibraryStat.objects.filter(count__gt=0).values_list("dimension", "value", "count", "total_bytes")
+        return {(dim, value): (count, size) for dim, value, count, size in rows}
+
+    def assertMatchesRebuild(self):
+        incremental = self.stored()
+        stats.rebuild()
+        self.assertEqual(incremental, self.stored())
+        return incremental
+
+    def test_signals_keep_the_rebuilt_numbers(self):
+        first, second, third = fake_wallpapers(3)
+        for wp, category, device, size in (
+            (first, "nature", "pc", 1000), (second, "nature", "mobile", 2000), (third, "cars", "pc", 4000)
+        ):
+            wp.category, wp.device, wp.size_bytes = category, device, size
+            wp.save()
+        self.assertEqual(self.assertMatchesRebuild()[("category", "nature")], (2, 3000))
+
+        second.category, second.device, second.size_bytes = "space", "pc", 2500
+        second.width, second.height = 7680, 4320
+        second.save()
+        found = self.assertMatchesRebuild()
+        self.assertEqual(found[("device", "pc")], (3, 7500))
+        self.assertEqual(found[("resolution", "8K")], (1, 2500))
+
+        # saved again unchanged, counted once
+        second.save()
+        self.assertMatchesRebuild()
+
+        third.delete()
+        self.assertEqual(self.assertMatchesRebuild()[("total", "")], (2, 3500))
+        self.assertEqual(stats.totals(), (2, 3500))
+
+    def test_bulk_creates_keep_the_rebuilt_numbers(self):
+        created = Wallpaper.objects.bulk_create(fake_wallpapers(5))
+        signals.wallpapers_created(created)
+        self.assertEqual(self.assertMatchesRebuild()[("total", "")][0], 5)
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        make_wallpapers(10)
+        # ties on the key, so id has to break them
+        Wallpaper.objects.update(downloads=1)
+        Wallpaper.objects.filter(pk__in=Wallpaper.objects.order_by("id").values("pk")[:3]).update(downloads=5)
+        self.ordered = list(Wallpaper.objects.order_by("-downloads", "-id").values_list("pk", flat=True))
+        self.paginator = KeysetPaginator(Wallpaper.objects.order_by("-downloads", "-id"), 4, "downloads")
+
+    def pks(self, page):
+        return [wp.pk for wp in page]
+
+    def test_next_cursors_walk_every_row_once(self):
+        page = self.paginator.get_page(None)
+        seen = self.pks(page)
+        self.assertFalse(page.has_previous)
+        while page.has_next:
+            page = self.paginator.get_page(page.next_cursor)
+            self.assertTrue(page.has_previous)
+            seen += self.pks(page)
+        self.assertEqual(seen, self.ordered)
+
+    def test_previous_cursor_returns_the_page_before(self):
+        first = self.paginator.get_page(None)
+        second = self.paginator.get_page(first.next_cursor)
+        back = self.paginator.get_page(second.previous_cursor)
+        self.assertEqual(self.pks(back), self.pks(first))
+        self.assertFalse(back.has_previous)
+        self.assertTrue(back.has_next)
+
+    def test_seek_bounds_the_key(self):
+        sql = str(self.paginator.qs.filter(self.paginator.seek((5, 1), "next")).query)
+        self.assertIn('"downloads" <= 5', sql)
+
+    def test_bad_or_foreign_cursor_is_page_one(self):
+        other = KeysetPaginator(Wallpaper.objects.order_by("-views", "-id"), 4, "views")
+        foreign = other.get_page(None).next_cursor
+        for cursor in ("garbage", foreign):
+            self.assertEqual(self.pks(self.paginator.get_page(cursor)), self.ordered[:4])
+
+
+@override_settings(HOME_PAGINATION="keyset", HOME_APPROXIMATE_COUNT=True)
+class HomeCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_wallpapers(30)
+        # a second page, so the pager and its total are shown
+        Wallpaper.objects.update(category="nature")
+
+    def counts(self, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/", {"cat": "nature"}, **headers)
+        return sum("COUNT(" in q["sql"].upper() for q in queries.captured_queries), response
+
+    def test_people_see_the_approximate_total(self):
+        count, response = self.counts(HTTP_USER_AGENT="Mozilla/5.0")
+        self.assertEqual(count, 1)
+        self.assertContains(response, " wallpapers</span>")
+
+    def test_crawlers_skip_the_count(self):
+        count, response = self.counts(HTTP_USER_AGENT="Mozilla/5.0 (compatible; Googlebot/2.1)")
+        self.assertEqual(count, 0)
+        self.assertNotContains(response, " wallpapers</span>")
+        # and don't hand their countless page to people
+        self.assertEqual(self.counts(HTTP_USER_AGENT="Mozilla/5.0")[0], 1)
+
+    @override_settings(HOME_APPROXIMATE_COUNT=False)
+    def test_the_count_can_be_turned_off(self):
+        self.assertEqual(self.counts(HTTP_USER_AGENT="Mozilla/5.0")[0], 0)
+
+
+@override_settings(TRENDING_HALF_LIFE_HOURS=48, TRENDING_VIEW_WEIGHT=1, TRENDING_DOWNLOAD_WEIGHT=5)
+class TrendingTests(TestCase):
+    now = datetime(2026, 6, 1, tzinfo=dt_timezone.utc)
+
+    def test_heat_halves_every_half_life(self):
+        score = trending.add(0.0, 8, self.now)
+        self.assertAlmostEqual(trending.heat(score, self.now), 8)
+        self.assertAlmostEqual(trending.heat(score, self.now + timedelta(hours=48)), 4)
+        self.assertAlmostEqual(trending.heat(score, self.now + timedelta(hours=96)), 2)
+
+    def test_add_sums_decayed_activity(self):
+        earlier = self.now - timedelta(hours=48)
+        score = trending.add(trending.add(0.0, 4, earlier), 3, self.now)
+        self.assertAlmostEqual(trending.heat(score, self.now), 2 + 3)
+        self.assertEqual(trending.add(score, 0, self.now), score)
+
+    def test_recent_activity_outranks_older_and_larger(self):
+        old = trending.add(0.0, 10, self.now - timedelta(days=10))
+        new = trending.add(0.0, 2, self.now)
+        self.assertGreater(new, old)
+
+    def test_refresh_scores_only_new_activity(self):
+        hot, cold = make_wallpapers(2)
+        self.assertEqual(trending.refresh(now=self.now, backfill=True), 2)
+        self.assertEqual(trending.refresh(now=self.now), 0)
+
+        Wallpaper.objects.filter(pk=hot.pk).update(views=F("views") + 2, downloads=F("downloads") + 1)
+        before = Wallpaper.objects.get(pk=hot.pk).trending_score
+        self.assertEqual(trending.refresh(now=self.now), 1)
+        after = Wallpaper.objects.get(pk=hot.pk).trending_score
+        self.assertAlmostEqual(trending.heat(after, self.now) - trending.heat(before, self.now), 2 + 5)
+
+    def test_refresh_leaves_library_caches_alone(self):
+        make_wallpapers(1)
+        library = caching.get_generation()
+        plain = caching.listing_key(("",))
+        hot = caching.listing_key(("",), sort="trending")
+        trending.refresh(now=self.now, backfill=True)
+        self.assertEqual(caching.get_generation(), library)
+        self.assertEqual(caching.listing_key(("",)), plain)
+        self.assertNotEqual(caching.listing_key(("",), sort="trending"), hot)
+
+
+@override_settings(EVENT_COMPACT_GRACE=300, EVENT_RETENTION_DAYS=14, EVENT_HOURLY_RETENTION_DAYS=90)
+class EventsCompactTests(TestCase):
+    start = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.wp, self.other = make_wallpapers(2)
+
+    def log(self, *offsets, wp=None, kind=Event.VIEW):
+        Event.objects.bulk_create(
+            Event(wallpaper_id=(wp or self.wp).pk, kind=kind, created_at=self.start + offset) for offset in offsets
+        )
+
+    def rollups(self, period):
+        rows = EventRollup.objects.filter(period=period).order_by("bucket")
+        return [(row.bucket - self.start, row.count) for row in rows]
+
+    def test_events_land_in_the_hour_they_happened(self):
+        self.log(timedelta(minutes=59, seconds=59), timedelta(hours=1), timedelta(hours=1, minutes=30))
+        events.compact(now=self.start + timedelta(hours=3))
+        self.assertEqual(self.rollups(EventRollup.HOUR), [(timedelta(0), 1), (timedelta(hours=1), 2)])
+
+    def test_an_hour_waits_out_the_grace_period(self):
+        self.log(timedelta(minutes=30))
+        events.compact(now=self.start + timedelta(hours=1, seconds=299))
+        self.assertEqual(self.rollups(EventRollup.HOUR), [])
+        events.compact(now=self.start + timedelta(hours=1, seconds=300))
+        self.assertEqual(self.rollups(EventRollup.HOUR), [(timedelta(0), 1)])
+
+    def test_rerunning_counts_nothing_twice(self):
+        self.log(timedelta(minutes=10), timedelta(hours=2))
+        now = self.start + timedelta(hours=5)
+        first = events.compact(now=now)
+        again = events.compact(now=now)
+        self.assertEqual((first["hourly"], again["hourly"]), (2, 0))
+        # an hour with nothing in it yet is looked at again, the ones before it are not
+        self.log(timedelta(hours=3), timedelta(minutes=20))
+        events.compact(now=now)
+        self.assertEqual(
+            self.rollups(EventRollup.HOUR), [(timedelta(0), 1), (timedelta(hours=2), 1), (timedelta(hours=3), 1)]
+        )
+
+    def test_days_roll_up_once_their_last_hour_has(self):
+        self.log(timedelta(hours=1), timedelta(hours=23, minutes=59), timedelta(days=1))
+        events.compact(now=self.start + timedelta(days=1, minutes=4))
+        self.assertEqual(self.rollups(EventRollup.DAY), [])
+        events.compact(now=self.start + timedelta(days=1, minutes=5))
+        self.assertEqual(self.rollups(EventRollup.DAY), [(timedelta(0), 2)])
+        self.assertEqual(events.series(2, wallpaper_id=self.wp.pk), {})
+
+    def test_rollups_skip_deleted_wallpapers(self):
+        self.log(timedelta(minutes=1))
+        self.log(timedelta(minutes=1), wp=self.other)
+        self.other.delete()
+        events.compact(now=self.start + timedelta(hours=2))
+        self.assertEqual(list(EventRollup.objects.values_list("wallpaper_id", flat=True)), [self.wp.pk])
+
+    def test_raw_events_are_pruned_after_retention_only_once_rolled_up(self):
+        self.log(timedelta(minutes=1), timedelta(days=20))
+        done = events.compact(now=self.start + timedelta(days=20, minutes=2))
+        self.assertEqual(done["events_pruned"], 1)
+        self.assertEqual(Event.objects.get().created_at, self.start + timedelta(days=20))
+        self.assertEqual(self.rollups(EventRollup.DAY), [(timedelta(0), 1)])
+
+    @override_settings(EVENT_HOURLY_RETENTION_DAYS=7)
+    def test_pruned_hours_are_not_rolled_up_again(self):
+        self.log(timedelta(minutes=1), timedelta(days=1, minutes=1))
+        events.compact(now=self.start + timedelta(days=2, hours=1))
+        done = events.compact(now=self.start + timedelta(days=9, hours=1))
+        self.assertEqual(done["hourly_pruned"], 2)
+        done = events.compact(now=self.start + timedelta(days=9, hours=2))
+        self.assertEqual((done["hourly"], done["hourly_pruned"]), (0, 0))
+        self.assertEqual(self.rollups(EventRollup.HOUR), [])
+        self.assertEqual(self.rollups(EventRollup.DAY), [(timedelta(0), 1), (timedelta(days=1), 1)])
+
+
+@override_settings(WALLPAPER_UPLOADER="wallpapers.ingest.FakeUploader", DUPLICATE_POLICY="warn")
+class IngestJobTests(TestCase):
+    def setUp(self):
+        spool = tempfile.mkdtemp(prefix="wallpapers-tests-")
+        self.addCleanup(shutil.rmtree, spool, ignore_errors=True)
+        spool_settings = override_settings(JOB_SPOOL_DIR=spool)
+        spool_settings.enable()
+        self.addCleanup(spool_settings.disable)
+
+    def queue(self):
+        buf = io.BytesIO()
+        Image.new("RGB", (64, 48), "#336699").save(buf, "JPEG")
+        job, _ = ingest.enqueue_upload(SimpleUploadedFile("sky.jpg", buf.getvalue()), "Sky", category="nature")
+        return job
+
+    def test_job_creates_its_wallpaper(self):
+        job = self.queue()
+        result = ingest.run_job(job)
+        wp = Wallpaper.objects.get(slug=result["slug"])
+        self.assertEqual(wp.drive_file_id, f"wallpapers/{job.payload['sha256']}")
+        self.assertFalse(os.path.exists(job.payload["path"]))
+
+    def test_running_a_job_again_returns_its_wallpaper(self):
+        job = self.queue()
+        first = ingest.run_job(job)
+        # requeued after JOB_LOCK_TIMEOUT, or a crash before it was marked done
+        with mock.patch.object(ingest.FakeUploader, "upload") as upload:
+            again = ingest.run_job(job)
+        upload.assert_not_called()
+        self.assertEqual(again["slug"], first["slug"])
+        self.assertEqual(Wallpaper.objects.count(), 1)
+
+    def test_losing_the_insert_race_returns_the_winner(self):
+        job = self.queue()
+        winner = make_wallpapers(1)[0]
+        Wallpaper.objects.filter(pk=winner.pk).update(drive_file_id=f"wallpapers/{job.payload['sha256']}")
+        with mock.patch.object(ingest, "_uploaded", side_effect=[None, winner]), \
+                mock.patch.object(ingest.FakeUploader, "delete") as delete:
+            result = ingest.run_job(job)
+        self.assertEqual(result["slug"], winner.slug)
+        delete.assert_not_called()
+        self.assertEqual(Wallpaper.objects.count(), 1)
+
+
+class SitemapSectionTests(TestCase):
+    def test_no_section_exceeds_the_size_with_the_home_page(self):
+        make_wallpapers(7)
+        found = sitemaps._compute_sections(3)
+        self.assertEqual([s.count for s in found], [2, 3, 2])
+        for section in found:
+            body = "".join(sitemaps._generate_section(section, "https://example.com"))
+            self.assertLessEqual(body.count("<url>"), 3)
+        first = "".join(sitemaps._generate_section(found[0], "https://example.com"))
+        self.assertIn("<loc>https://example.com/</loc>", first)
+
+    def test_sections_cover_every_wallpaper_once(self):
+        make_wallpapers(7)
+        found = sitemaps._compute_sections(3)
+        self.assertEqual(sum(s.count for s in found), 7)
+        self.assertEqual(found[0].first_id, Wallpaper.objects.order_by("id").first().pk)
+        for before, after in zip(found, found[1:]):
+            self.assertLess(before.last_id, after.first_id)
+
+
+class HomeResolutionFilterTests(TestCase):
+    def setUp(self):
+        sizes = [(1024, 768), (1920, 1080), (3840, 2160), (7680, 4320)]
+        wallpapers = make_wallpapers(len(sizes))
+        for wp, (width, height) in zip(wallpapers, sizes):
+            wp.width, wp.height = width, height
+            wp.set_dimension_fields()
+        Wallpaper.objects.bulk_update(wallpapers, ["width", "height", "resolution_label", "resolution_tier"])
+        caching.bump_generation()
+        self.labels = {wp.pk: wp.resolution_label for wp in wallpapers}
+
+    def listed(self, res):
+        response = self.client.get("/", {"res": res})
+        self.assertEqual(response.status_code, 200)
+        return sorted(self.labels[wp.pk] for wp in response.context["page_obj"].object_list)
+
+    def test_tiers_match_exactly_and_4k_means_at_least(self):
+        self.assertEqual(self.listed("fhd"), ["FHD"])
+        self.assertEqual(self.listed("4K"), ["4K", "8K"])
+
+    def test_size_below_hd_matches_the_stored_label(self):
+        self.assertEqual(self.listed("1024X768"), ["1024x768"])
+        self.assertEqual(self.listed("other"), ["1024x768"])
+
+    def test_unknown_value_lists_nothing(self):
+        self.assertEqual(self.listed("ultra"), [])
+
+
+class ListingCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.wp = make_wallpapers(1)[0]
+        self.builds = 0
+
+    def listing(self):
+        def build():
+            self.builds += 1
+            return list(Wallpaper.objects.values_list("title", flat=True))
+        return caching.get_listing(("", "date"), build)
+
+    def test_cached_until_the_library_changes(self):
+        self.listing()
+        self.listing()
+        self.assertEqual(self.builds, 1)
+
+        self.wp.title = "Renamed"
+        self.wp.save()
+        self.assertEqual(self.listing(), ["Renamed"])
+        self.assertEqual(self.builds, 2)
+
+        created = Wallpaper.objects.bulk_create(fake_wallpapers(1, seed=1, start=1))
+        signals.wallpapers_created(created)
+        self.assertEqual(len(self.listing()), 2)
+
+        self.wp.delete()
+        self.assertEqual(self.listing(), [created[0].title])
+        self.assertEqual(self.builds, 4)
+
+    def test_home_page_shows_a_new_upload_at_once(self):
+        self.assertNotContains(self.client.get("/"), "Fresh Upload")
+        fresh = next(iter(fake_wallpapers(1, seed=2, start=5)))
+        fresh.title = "Fresh Upload"
+        fresh.save()
+        self.assertContains(self.client.get("/"), "Fresh Upload")
+
+
+class FragmentCacheTests(TestCase):
+    card = Template("{% load fragment_cache %}{% fragment_cache 'card' wp %}{{ wp.title }}{% endfragment_cache %}")
+
+    def setUp(self):
+        cache.clear()
+        self.wp = make_wallpapers(1)[0]
+
+    def render(self):
+        return self.card.render(Context({"wp": self.wp}))
+
+    def test_saving_rerenders_only_that_wallpapers_fragments(self):
+        other = next(iter(fake_wallpapers(1, seed=1, start=1)))
+        other.save()
+        other_card = self.card.render(Context({"wp": other}))
+        self.assertEqual(self.render(), self.wp.title)
+        with mock.patch.object(caching.cache, "set", wraps=caching.cache.set) as stored:
+            self.assertEqual(self.render(), self.wp.title)
+        stored.assert_not_called()
+
+        self.wp.refresh_from_db()
+        self.wp.title = "Renamed"
+        self.wp.save()
+        self.assertEqual(self.render(), "Renamed")
+        # the other wallpaper's card is still cached under its updated_at
+        other.title = "Not rendered again"
+        self.assertEqual(self.card.render(Context({"wp": other})), other_card)
+
+    def test_fragment_generation_rerenders_every_fragment(self):
+        self.assertEqual(self.render(), self.wp.title)
+        # a backfill rewrites the row without moving updated_at
+        self.wp.title = "Backfilled"
+        self.assertNotEqual(self.render(), "Backfilled")
+        caching.bump_generation(caching.FRAGMENT_GENERATION_KEY)
+        self.assertEqual(self.render(), "Backfilled")
+
+
+class HttpCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.wp = make_wallpapers(1)[0]
+        self.detail = f"/w/{self.wp.slug}/"
+
+    def test_home_revalidation_is_answered_before_the_view(self):
+        etag = self.client.get("/")["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("public", response["Cache-Control"])
+
+    def test_detail_revalidation_costs_one_lookup(self):
+        etag = self.client.get(self.detail)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(self.detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_a_save_changes_the_etag(self):
+        etag = self.client.get(self.detail)["ETag"]
+        self.wp.title = "Renamed"
+        self.wp.save()
+        self.assertEqual(self.client.get(self.detail, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_staff_get_private_pages_and_no_shortcut(self):
+        etag = self.client.get("/")["ETag"]
+        staff = get_user_model().objects.create_user("staff", password="x", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("no-store", response["Cache-Control"])
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_view_beacon_counts_posts_only(self):
+        with mock.patch.object(counters, "record") as record:
+            self.assertEqual(self.client.post(f"{self.detail}view/").status_code, 204)
+            self.assertEqual(self.client.get(f"{self.detail}view/").status_code, 405)
+            self.assertEqual(self.client.post("/w/missing/view/").status_code, 404)
+        record.assert_called_once_with(self.wp.pk, "views", device="pc")
+
+    def test_public_pages_never_load_the_session_or_user(self):
+        # an old session cookie, as a logged-out visitor still carries
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = "stale"
+        with mock.patch.object(SessionStore, "load") as load, \
+                mock.patch("django.contrib.auth.middleware.get_user") as get_user:
+            for path in ("/", self.detail):
+                self.assertEqual(self.client.get(path).status_code, 200)
+        load.assert_not_called()
+        get_user.assert_not_called()
+
+
+@override_settings(DOWNLOAD_MODE="proxy", ASYNC_DOWNLOADS=False)
+class DownloadViewTests(TestCase):
+    def setUp(self):
+        self.wp = make_wallpapers(1)[0]
+        self.urls = {"original": "https://cdn.example/original.jpg", "4k": "https://cdn.example/4k.jpg"}
+        Wallpaper.objects.filter(pk=self.wp.pk).update(download_urls=self.urls)
+        self.path = f"/w/{self.wp.slug}/download/"
+        record = mock.patch.object(counters, "record")
+        self.record = record.start()
+        self.addCleanup(record.stop)
+
+    def upstream_reply(self, status, headers=None, body=b""):
+        reply = mock.Mock(status_code=status, headers=headers or {})
+        reply.iter_content.return_value = [body[i:i + 4] for i in range(0, len(body), 4)]
+        return reply
+
+    def test_partial_content_is_forwarded(self):
+        reply = self.upstream_reply(206, {"Content-Range": "bytes 2-9/10", "Content-Length": "8"}, b"23456789")
+        with mock.patch.object(upstream, "fetch", return_value=reply) as fetch:
+            response = self.client.get(self.path, {"res": "4k"}, HTTP_RANGE="bytes=2-", HTTP_IF_RANGE='"v1"')
+            body = b"".join(response.streaming_content)
+        fetch.assert_called_once_with(
+            self.urls["4k"], headers={"Accept-Encoding": "identity", "Range": "bytes=2-", "If-Range": '"v1"'}
+        )
+        self.assertEqual((response.status_code, body), (206, b"23456789"))
+        self.assertEqual(response["Content-Range"], "bytes 2-9/10")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        reply.close.assert_called_once_with()
+
+    def test_unsatisfiable_range_is_forwarded(self):
+        reply = self.upstream_reply(416, {"Content-Range": "bytes */10"})
+        with mock.patch.object(upstream, "fetch", return_value=reply):
+            response = self.client.get(self.path, HTTP_RANGE="bytes=10-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+        self.assertFalse(response.has_header("Content-Disposition"))
+        reply.close.assert_called_once_with()
+
+    def test_only_downloads_from_the_start_are_counted(self):
+        counted = {}
+        for range_header in ("", "bytes=0-", "bytes=0-99", "bytes=100-", "bytes=-500", "items=5-"):
+            self.record.reset_mock()
+            with mock.patch.object(upstream, "fetch", return_value=self.upstream_reply(200)):
+                self.client.get(self.path, HTTP_RANGE=range_header)
+            counted[range_header] = self.record.call_count
+        self.assertEqual(
+            counted, {"": 1, "bytes=0-": 1, "bytes=0-99": 1, "bytes=100-": 0, "bytes=-500": 0, "items=5-": 1}
+        )
+
+    @override_settings(DOWNLOAD_MODE="redirect")
+    def test_redirect_mode_sends_the_stored_signed_url(self):
+        with mock.patch.object(upstream, "fetch") as fetch, \
+                mock.patch.object(Wallpaper, "build_download_urls") as build:
+            original = self.client.get(self.path)
+            sized = self.client.get(self.path, {"res": "4K"})
+        self.assertEqual((original.status_code, original["Location"]), (302, self.urls["original"]))
+        self.assertEqual(sized["Location"], self.urls["4k"])
+        fetch.assert_not_called()
+        build.assert_not_called()
+        self.assertEqual(self.record.call_count, 2)
+
+
+@override_settings(UPSTREAM_MAX_RETRIES=1, UPSTREAM_READ_TIMEOUT=5, DOWNLOAD_MODE="proxy", ASYNC_DOWNLOADS=False)
+class UpstreamTests(TestCase):
+    size = 200_000
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = StubServer().__enter__()
+        cls.addClassCleanup(cls.stub.__exit__, None, None, None)
+
+    def setUp(self):
+        # sessions are built from the settings in effect on first use
+        upstream._local.__dict__.clear()
+        self.addCleanup(upstream._local.__dict__.clear)
+        self.file_url = f"{self.stub.base_url}/file/{self.size}"
+
+    def drain(self, r):
+        return b"".join(upstream.iter_chunks(r, 64 * 1024))
+
+    def test_fetch_streams_the_whole_file(self):
+        r = upstream.fetch(self.file_url)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(self.drain(r)), self.size)
+
+    def test_range_is_passed_through(self):
+        r = upstream.fetch(self.file_url, headers={"Range": "bytes=1000-"})
+        self.assertEqual(r.status_code, 206)
+        self.assertEqual(r.headers["Content-Range"], f"bytes 1000-{self.size - 1}/{self.size}")
+        self.assertEqual(len(self.drain(r)), self.size - 1000)
+
+        r = upstream.fetch(self.file_url, headers={"Range": f"bytes={self.size}-"})
+        self.assertEqual(r.status_code, 416)
+        r.close()
+
+    def test_5xx_is_retried_then_returned(self):
+        hits = self.stub.hits
+        r = upstream.fetch(f"{self.stub.base_url}/status/503")
+        r.close()
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(self.stub.hits - hits, 2)
+
+    @override_settings(UPSTREAM_READ_TIMEOUT=0.2)
+    def test_read_timeout_is_reported_as_timeout(self):
+        with self.assertRaises(Exception) as caught:
+            upstream.fetch(f"{self.stub.base_url}/slow/2")
+        self.assertTrue(upstream.is_timeout(caught.exception))
+
+    def test_async_fetch_retries_and_honours_range(self):
+        async def fetch_both():
+            try:
+                partial = await upstream.afetch(self.file_url, headers={"Range": "bytes=-500"})
+                body = b"".join([chunk async for chunk in upstream.aiter_chunks(partial, 64 * 1024)])
+                failing = await upstream.afetch(f"{self.stub.base_url}/status/503")
+                await failing.aclose()
+                return partial.status_code, len(body), failing.status_code
+            finally:
+                await upstream.get_async_client().aclose()
+
+        hits = self.stub.hits
+        self.assertEqual(asyncio.run(fetch_both()), (206, 500, 503))
+        self.assertEqual(self.stub.hits - hits, 3)
+
+    def test_download_view_streams_a_resumed_range(self):
+        wp = make_wallpapers(1)[0]
+        Wallpaper.objects.filter(pk=wp.pk).update(download_urls={"original": self.file_url})
+        response = self.client.get(f"/w/{wp.slug}/download/", HTTP_RANGE="bytes=100-")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(len(b"".join(response.streaming_content)), self.size - 100)
+        self.assertIn("attachment;", response["Content-Disposition"])
+
+    def test_download_view_reports_upstream_failures(self):
+        wp = make_wallpapers(1)[0]
+        Wallpaper.objects.filter(pk=wp.pk).update(download_urls={"original": f"{self.stub.base_url}/status/503"})
+        with self.assertLogs("django.request", "ERROR"):
+            response = self.client.get(f"/w/{wp.slug}/download/")
+        self.assertEqual(response.status_code, 502)
+
+
+class SlugTests(TestCase):
+    def new_wallpaper(self, title, slug=""):
+        wp = next(fake_wallpapers(1))
+        wp.title, wp.slug = title, slug
+        wp.drive_file_id = f"wallpapers/test-{Wallpaper.objects.count()}-{slug or 'auto'}"
+        return wp
+
+    def test_base_slug(self):
+        self.assertEqual(slugs.base_slug("Naruto Sage Mode!"), "naruto-sage-mode")
+        self.assertEqual(slugs.base_slug("!!!"), "wallpaper")
+        self.assertEqual(len(slugs.base_slug("x" * 300)), slugs.MAX_BASE_LENGTH)
+
+    def test_reserve_hands_out_the_base_then_suffixes(self):
+        self.assertEqual(slugs.reserve("naruto"), ["naruto"])
+        self.assertEqual(slugs.reserve("naruto", 3), ["naruto-1", "naruto-2", "naruto-3"])
+        self.assertEqual(slugs.reserve("goku"), ["goku"])
+
+    def test_new_counter_starts_after_existing_suffixes(self):
+        for slug in ("naruto", "naruto-7", "naruto-x", "narutos"):
+            self.new_wallpaper("Naruto", slug).save()
+        self.assertEqual(slugs.reserve("naruto"), ["naruto-8"])
+
+    def test_assign_slugs_keeps_hand_set_ones(self):
+        wallpapers = [self.new_wallpaper("Sky"), self.new_wallpaper("Sky", "my-sky"), self.new_wallpaper("Sky")]
+        slugs.assign_slugs(wallpapers)
+        self.assertEqual([wp.slug for wp in wallpapers], ["sky", "my-sky", "sky-1"])
+
+    def test_save_retries_past_a_hand_set_collision(self):
+        self.new_wallpaper("Sky").save()
+        # the next reservation would be "sky-1"
+        self.new_wallpaper("Other", "sky-1").save()
+        wp = self.new_wallpaper("Sky")
+        wp.save()
+        self.assertEqual(wp.slug, "sky-2")
+
+    def test_save_gives_up_after_max_attempts(self):
+        with mock.patch.object(slugs, "reserve", return_value=["taken"]):
+            self.new_wallpaper("Taken", "taken").save()
+            with self.assertRaises(IntegrityError):
+                self.new_wallpaper("Taken").save()
+
+
+class RelatedTests(TestCase):
+    def setUp(self):
+        self.wallpapers = make_wallpapers(8)
+        for wp in self.wallpapers:
+            wp.refresh_from_db()
+            # a placeholder to decode, and tags to look up
+            wp.placeholder = images.placeholder(self.image())
+            wp.save()
+
+    def image(self):
+        buf = io.BytesIO()
+        Image.new("RGB", (32, 32), "#884422").save(buf, "JPEG")
+        return buf
+
+    def test_refresh_stores_neighbours_and_clears_flags(self):
+        self.assertEqual(related.refresh(), len(self.wallpapers))
+        self.assertFalse(Wallpaper.objects.filter(related_stale=True).exists())
+        self.assertFalse(Wallpaper.objects.filter(related_features=None).exists())
+        self.assertEqual(
+            RelatedWallpaper.objects.filter(wallpaper=self.wallpapers[0]).count(), len(self.wallpapers) - 1
+        )
+        self.assertEqual(related.refresh(), 0)
+
+    def test_refresh_decodes_only_changed_wallpapers(self):
+        related.refresh()
+        changed = self.wallpapers[3]
+        changed.tags = "brand, new, tags"
+        changed.save()
+        with mock.patch.object(related, "color_histogram", wraps=related.color_histogram) as decode:
+            related.refresh()
+        self.assertEqual(decode.call_count, 1)
+
+    def test_detail_etag_follows_neighbours_and_trending(self):
+        slug = self.wallpapers[0].slug
+        etags = [httpcache.wallpaper_validators(None, slug)[0]]
+        related.refresh()
+        etags.append(httpcache.wallpaper_validators(None, slug)[0])
+        trending.refresh(backfill=True)
+        etags.append(httpcache.wallpaper_validators(None, slug)[0])
+        self.assertEqual(len(set(etags)), 3)
+        # nothing stale, nothing rewritten
+        related.refresh()
+        self.assertEqual(httpcache.wallpaper_validators(None, slug)[0], etags[-1])
+
+    def test_refresh_matches_a_full_rebuild(self):
+        related.refresh()
+        self.wallpapers[2].category = "space"
+        self.wallpapers[2].save()
+        related.refresh()
+        links = RelatedWallpaper.objects.values_list("wallpaper_id", "neighbour_id", "rank")
+        refreshed = sorted(links)
+        related.rebuild()
+        self.assertEqual(refreshed, sorted(links))
+
+    def test_a_save_during_refresh_keeps_its_flag(self):
+        saved_meanwhile = self.wallpapers[5]
+        store = related._store
+
+        def store_then_save(results):
+            done = store(results)
+            saved_meanwhile.save()
+            return done
+
+        with mock.patch.object(related, "_store", side_effect=store_then_save):
+            related.refresh()
+        still_stale = Wallpaper.objects.filter(related_stale=True).values_list("pk", flat=True)
+        self.assertEqual(list(still_stale), [saved_meanwhile.pk])
+
+
+@override_settings(DUPLICATE_MAX_DISTANCE=3)
+class DuplicateTests(TestCase):
+    base = 0x1234_5678_9ABC_DEF0
+
+    def store(self, *hashes):
+        wallpapers = list(fake_wallpapers(len(hashes), start=Wallpaper.objects.count()))
+        for wp, value in zip(wallpapers, hashes):
+            wp.set_phash(value)
+        return Wallpaper.objects.bulk_create(wallpapers)
+
+    def test_finds_hashes_within_the_distance(self):
+        near, far = self.store(self.base ^ 0b1011, self.base ^ 0b11111)
+        found = duplicates.find_matches([self.base])[self.base]
+        self.assertEqual([(wp.pk, d) for wp, d in found], [(near.pk, 3)])
+
+    def test_flat_bands_are_not_probed(self):
+        self.assertEqual(duplicates.probes(0, 3), [])
+        self.assertEqual(duplicates.probes((1 << 64) - 1, 3), [])
+        widths = [(i, len(values)) for i, values in duplicates.probes(self.base, 3)]
+        self.assertEqual(widths, [(i, 1) for i in range(4)])
+        # one informative band left carries the whole distance
+        ((position, values),) = duplicates.probes(0x1234, 3)
+        self.assertEqual(position, 3)
+        self.assertEqual(len(values), 1 + 16 + 120 + 560)
+
+    def test_dark_image_only_loads_its_own_candidates(self):
+        dark = 0x0000_0000_0000_1234
+        self.store(*[0x0000_0000_0000_4000 + n * 0x10000 for n in range(1, 30)])
+        near, = self.store(dark ^ (0b101 << 8) ^ (1 << 40))
+        exact, = self.store(0)
+        with self.assertNumQueries(1), \
+                mock.patch.object(duplicates, "distance", wraps=duplicates.distance) as compared:
+            found = duplicates.find_matches([dark, 0])
+        # two candidates checked against two hashes, none of the other dark ones
+        self.assertEqual(compared.call_count, 4)
+        self.assertEqual([wp.pk for wp, _ in found[dark]], [near.pk])
+        self.assertEqual([wp.pk for wp, _ in found[0]], [exact.pk])
+
+    def test_band_index_keeps_flat_hashes_apart(self):
+        index = duplicates.BandIndex()
+        for n in range(1, 50):
+            index.add(n << 16, f"flat-{n}")
+        index.add(0, "blank")
+        index.add(self.base, "photo")
+        self.assertEqual(index.find(0), ["blank"])
+        self.assertEqual(index.find(self.base ^ 0b111), ["photo"])
+        self.assertEqual(len(index._buckets[(3, 0)]), 0)
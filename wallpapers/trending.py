@@ -0,0 +1,127 @@
+"""
+Time-decayed "trending" score.
+
+A wallpaper's heat is its views and downloads, weighted
+(TRENDING_VIEW_WEIGHT, TRENDING_DOWNLOAD_WEIGHT) and halved every
+TRENDING_HALF_LIFE_HOURS. Decaying every row on every run would rewrite
+the whole table, so the score is stored in forward-decay form instead:
+
+    trending_score = log(sum of weight * e^(decay * (t - EPOCH)))
+
+Activity at time t counts more the later t is, which orders rows exactly
+as decaying them all to "now" would. A row only changes when it gets new
+activity, and the log keeps the number small. heat() turns it back into
+the decayed amount as of now.
+
+New activity is what ``views``/``downloads`` gained since the last run
+(``trending_views``/``trending_downloads`` hold the counts already scored),
+so refresh(), run by ``manage.py update_trending``, only touches rows that
+were viewed or downloaded since. Run one at a time.
+
+The score sorts ``?sort=trending`` on the home page (wallpaper_trending_idx),
+ranks featured suggestions and boosts hot wallpapers in the related strip.
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Wallpaper
+
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def decay_rate():
+    """Per second, from the half-life"""
+    return math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def offset(when):
+    """log weight of one unit of activity at when"""
+    return decay_rate() * (when - EPOCH).total_seconds()
+
+
+def add(score, amount, when):
+    """score with amount of activity at when folded in"""
+    if amount <= 0:
+        return score
+    new = math.log(amount) + offset(when)
+    high, low = max(score, new), min(score, new)
+    return high + math.log1p(math.exp(low - high))
+
+
+def heat(score, now=None):
+    """Decayed activity as of now: 1.0 is a weighted view just now"""
+    return math.exp(min(score - offset(now or timezone.now()), 700))
+
+
+def activity(views, downloads):
+    return views * settings.TRENDING_VIEW_WEIGHT + downloads * settings.TRENDING_DOWNLOAD_WEIGHT
+
+
+def refresh(now=None, batch_size=1000, backfill=False):
+    """
+    Fold the views and downloads gained since the last run into the score,
+    returns the number of rows updated. With backfill, every row's lifetime
+    counts are scored as if they happened at its upload (first run on an
+    existing library, so old favourites don't all trend at once).
+    """
+    now = now or timezone.now()
+    qs = Wallpaper.objects.all()
+    if not backfill:
+        qs = qs.filter(~Q(views=F("trending_views")) | ~Q(downloads=F("trending_downloads")))
+    rows = qs.order_by().values_list(
+        "id", "views", "downloads", "trending_views", "trending_downloads", "trending_score", "created_at"
+    )
+
+    done, batch = 0, []
+    for pk, views, downloads, seen_views, seen_downloads, score, created_at in rows.iterator(chunk_size=batch_size):
+        if backfill:
+            score = add(0.0, activity(views, downloads), min(created_at, now))
+        else:
+            # a counter edited down by hand is just re-based
+            score = add(score, activity(max(0, views - seen_views), max(0, downloads - seen_downloads)), now)
+        batch.append(Wallpaper(pk=pk, trending_score=score, trending_views=views, trending_downloads=downloads))
+        if len(batch) >= batch_size:
+            done += _save(batch)
+    done += _save(batch)
+
+    if done:
+        # only the ?sort=trending listings, not every library cache
+        from .caching import TRENDING_GENERATION_KEY, bump_generation
+
+        bump_generation(TRENDING_GENERATION_KEY)
+    return done
+
+
+def _save(batch):
+    # bulk_update() leaves updated_at alone, so page validators don't change
+    Wallpaper.objects.bulk_update(batch, ["trending_score", "trending_views", "trending_downloads"])
+    saved = len(batch)
+    batch.clear()
+    return saved
+
+
+def featured_suggestions(limit=None):
+    """The hottest wallpapers that aren't featured yet"""
+    limit = limit or settings.FEATURED_SUGGESTIONS
+    return Wallpaper.objects.filter(is_featured=False).order_by("-trending_score", "-id")[:limit]
+
+
+def rerank(pairs, limit, now=None):
+    """
+    [(wallpaper, similarity), ...] re-ordered with hot wallpapers nudged up:
+    similarity * (1 + TRENDING_RELATED_WEIGHT * log(1 + heat))
+    """
+    weight = settings.TRENDING_RELATED_WEIGHT
+    if weight <= 0:
+        return [wp for wp, _ in pairs[:limit]]
+    now = now or timezone.now()
+    boosted = sorted(
+        pairs,
+        key=lambda pair: pair[1] * (1 + weight * math.log1p(heat(pair[0].trending_score, now))),
+        reverse=True,
+    )
+    return [wp for wp, _ in boosted[:limit]]
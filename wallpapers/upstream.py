@@ -0,0 +1,134 @@
+"""
+Shared HTTP layer for fetching wallpaper files from Cloudinary.
+
+Sync views use a pooled keep-alive ``requests.Session`` (one per worker
+thread), async views use a shared ``httpx.AsyncClient`` per event loop.
+Both apply the same connect/read timeouts and a bounded number of retries.
+"""
+import asyncio
+import threading
+import weakref
+
+import requests
+import urllib3
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+
+# retried on top of connection errors, Cloudinary returns these on hiccups
+RETRY_STATUSES = (502, 503, 504)
+
+_local = threading.local()
+# keyed weakly so clients of finished loops (async views under WSGI) go away
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_timeouts():
+    return (settings.UPSTREAM_CONNECT_TIMEOUT, settings.UPSTREAM_READ_TIMEOUT)
+
+
+def get_session():
+    """Return this thread's pooled session, creating it on first use"""
+    session = getattr(_local, "session", None)
+    if session is None:
+        retry = Retry(
+            total=settings.UPSTREAM_MAX_RETRIES,
+            # a read timeout already cost us UPSTREAM_READ_TIMEOUT, don't pay it again
+            read=0,
+            backoff_factor=0.3,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=settings.UPSTREAM_POOL_SIZE,
+            pool_maxsize=settings.UPSTREAM_POOL_SIZE,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _local.session = session
+    return session
+
+
+def fetch(url, headers=None):
+    """Start a streamed GET; the caller must close() the response"""
+    # timed up to the response headers, the body is streamed afterwards
+    with metrics.timed("download"):
+        return get_session().get(url, headers=headers, stream=True, timeout=get_timeouts())
+
+
+def get_async_client():
+    """Return the httpx client for the running event loop"""
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        connect, read = get_timeouts()
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(
+                max_connections=settings.UPSTREAM_POOL_SIZE * 10,
+                max_keepalive_connections=settings.UPSTREAM_POOL_SIZE,
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=settings.UPSTREAM_MAX_RETRIES),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def afetch(url, headers=None):
+    """Async counterpart of fetch(); the caller must aclose() the response"""
+    with metrics.timed("download"):
+        return await _afetch(url, headers)
+
+
+async def _afetch(url, headers):
+    client = get_async_client()
+    attempts = settings.UPSTREAM_MAX_RETRIES + 1
+    for attempt in range(attempts):
+        request = client.build_request("GET", url, headers=headers)
+        response = await client.send(request, stream=True)
+        if response.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+            return response
+        await response.aclose()
+        await asyncio.sleep(0.3 * (2 ** attempt))
+
+
+def iter_chunks(r, chunk_size):
+    """Yield a requests response body chunk by chunk and release the connection at the end"""
+    try:
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            if chunk:
+                yield chunk
+    finally:
+        r.close()
+
+
+async def aiter_chunks(r, chunk_size):
+    """Async version of iter_chunks() for httpx responses"""
+    try:
+        async for chunk in r.aiter_bytes(chunk_size):
+            yield chunk
+    finally:
+        await r.aclose()
+
+
+def is_timeout(exc):
+    """True for read/connect timeouts from either client"""
+    if isinstance(exc, requests.exceptions.Timeout):
+        return True
+    # requests reports a read timeout that exhausted the retries as ConnectionError
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    if isinstance(reason, urllib3.exceptions.TimeoutError):
+        return True
+    try:
+        import httpx
+    except ImportError:
+        return False
+    return isinstance(exc, httpx.TimeoutException)
+
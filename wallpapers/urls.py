@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -7,8 +8,17 @@ urlpatterns = [
     path("", views.home, name="home"),
     path("logout/", views.logout_view, name="logout"),
     path("upload/", views.upload, name="upload"),
+    path("jobs/<int:pk>/", views.job_status, name="job_status"),
+    path("staff-tools/", views.staff_tools, name="staff_tools"),
+    path("metrics/", views.metrics, name="metrics"),
     path("w/<slug:slug>/", views.detail, name="detail"),
+    path("w/<slug:slug>/view/", views.count_view, name="count_view"),
     path("<slug:slug>/delete/", views.delete_wallpaper, name="delete"),
-    path("w/<slug:slug>/download/", views.download, name="download"),
+    path(
+        "w/<slug:slug>/download/",
+        views.download_async if settings.ASYNC_DOWNLOADS else views.download,
+        name="download"
+    ),
     path("sitemap.xml", views.sitemap, name="sitemap"),
+    path("sitemap-<int:section>.xml", views.sitemap_section, name="sitemap_section"),
 ]
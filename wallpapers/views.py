@@ -1,121 +1,308 @@
-from PIL import Image
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse, Http404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.views.decorators.cache import never_cache
-from django.core.paginator import Paginator
-from django.db.models import Q, Sum
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
+from django.core.paginator import Page, Paginator
 from django.utils.text import slugify
-from .models import Wallpaper
+from .models import Job, Wallpaper
+from .pagination import KeysetPage, KeysetPaginator
+from . import (
+    caching, colors, events, images, ingest, jobs, metrics as perf_metrics, related as related_wallpapers,
+    search, sitemaps, stats as library_stats, tags as wallpaper_tags,
+)
 import cloudinary.uploader
-from cloudinary.utils import cloudinary_url
-import requests
+from asgiref.sync import sync_to_async
+from . import counters, upstream
+from .httpcache import cache_policy, library_validators, static_page, wallpaper_validators
 from django.contrib import messages
 from django.contrib.auth import logout
-from xml.sax.saxutils import escape # Import the escape function
+from django.core.exceptions import PermissionDenied
+from django.utils.crypto import constant_time_compare
+import logging
+import re
 
 
 from django.urls import reverse
+from django.utils.http import urlencode
 
+logger = logging.getLogger(__name__)
+
+# 64 KB keeps memory per in-flight download bounded regardless of file size
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# headers we pass through from Cloudinary to the client
+FORWARDED_DOWNLOAD_HEADERS = ("Content-Length", "Content-Range", "ETag", "Last-Modified")
+
+RANGE_START_RE = re.compile(r"^\s*bytes=(\d*)-")
+
+# a home page shows 24 cards, leave room for the detail slot and odd layouts
+STAFF_TOOLS_MAX_SLOTS = 50
+
+# user agents that page through listings but never read the total
+CRAWLER_RE = re.compile(r"bot|crawl|spider|slurp|facebookexternalhit", re.IGNORECASE)
+
+# ?res= values, "4k" and "8k" mean "at least"
+RESOLUTION_TIERS_BY_LABEL = {label.lower(): tier for tier, label in Wallpaper.RESOLUTION_TIERS}
+RESOLUTION_EXACT_RE = re.compile(r"^(\d+)x(\d+)$", re.IGNORECASE)
+
+@cache_policy(library_validators)
 def home(request):
     q = request.GET.get("q", "").strip()
     cat = request.GET.get("cat", "").strip()
     res = request.GET.get("res", "").strip()
     device = request.GET.get("device", "").strip()
-    sort = request.GET.get("sort", "date").strip()  # new
+    tag = request.GET.get("tag", "").strip()
+    color = request.GET.get("color", "").strip().lower()
+    # best matches first when searching, unless the user picked a sort
+    sort = request.GET.get("sort", "relevance" if q else "date").strip()
 
     qs = Wallpaper.objects.all()
-    count = 0
-    size = 0
-
-    if request.user.is_staff:
-        count = qs.count()
-        size = qs.aggregate(total_size=Sum('size_bytes'))['total_size'] 
 
     # Filtering
     if q:
-        qs = qs.filter(
-            Q(title__icontains=q) |
-            Q(category__icontains=q) |
-            Q(tags__icontains=q)
-        )
+        qs = search.search(qs, q)
+    # plain equality on the stored columns so the composite indexes apply
     if cat:
-        qs = qs.filter(category__iexact=cat)
+        qs = qs.filter(category=cat.lower())
     if res:
-        if res.lower() == '4k':
-            qs = qs.filter(Q(width__gte=3840) | Q(height__gte=2160))
-        elif res.lower() == '8k':
-            qs = qs.filter(Q(width__gte=7680) | Q(height__gte=4320))
+        tier = RESOLUTION_TIERS_BY_LABEL.get(res.lower())
+        exact = RESOLUTION_EXACT_RE.match(res)
+        if res.lower() in ('4k', '8k'):
+            qs = qs.filter(resolution_tier__gte=tier)
+        elif tier is not None:
+            qs = qs.filter(resolution_tier=tier)
+        elif exact:
+            # below HD the stored label is the real size, e.g. "1024x768"
+            qs = qs.filter(resolution_label=f"{int(exact[1])}x{int(exact[2])}")
         else:
-            qs = qs.filter(resolution_label__iexact=res)
+            qs = qs.none()
     if device:
         qs = qs.filter(device=device)
+    if tag:
+        qs = qs.filter(tag_set__slug=tag)
+    if color:
+        qs = colors.filter_wallpapers(qs, color)
 
-    # Sorting
+    # Sorting, keyset_key is the column cursor pagination continues from
+    keyset_key = "created_at"
     if sort == "downloads":
-        qs = qs.order_by("-downloads")
+        qs = qs.order_by("-downloads", "-id")
+        keyset_key = "downloads"
+    elif sort == "trending":
+        # precomputed by trending.py, recent views and downloads with decay
+        qs = qs.order_by("-trending_score", "-id")
+        keyset_key = "trending_score"
     elif sort == "featured":
-        qs = qs.filter(is_featured=True).order_by("-created_at")
+        qs = qs.filter(is_featured=True).order_by("-created_at", "-id")
+    elif sort == "relevance" and q:
+        qs = qs.order_by("-search_rank", "-created_at")
+        keyset_key = None
     else:  # default = date
-        qs = qs.order_by("-created_at")
+        qs = qs.order_by("-created_at", "-id")
+
+    # Pagination: cursors for browsing, ?page=N still works for old links and search
+    page = request.GET.get("page")
+    cursor = request.GET.get("cursor", "")
+    use_keyset = bool(settings.HOME_PAGINATION == "keyset" and keyset_key and not page)
+    # cursor pages work without a total, only count when it's shown to a person
+    with_count = not use_keyset or (
+        settings.HOME_APPROXIMATE_COUNT and not CRAWLER_RE.search(request.headers.get("User-Agent", ""))
+    )
 
-    # Pagination
-    paginator = Paginator(qs, 24)
-    page = request.GET.get("page", 1)
-    page_obj = paginator.get_page(page)
+    # the same filters give everyone the same page, cached until the library changes
+    filters = (
+        q.lower(), cat.lower(), res.lower(), device, tag, color, sort, page or "", cursor if use_keyset else "",
+        with_count,
+    )
+    if use_keyset:
+        paginator = KeysetPaginator(qs, 24, keyset_key)
+        cached = caching.get_listing(filters, lambda: _keyset_payload(paginator, cursor, with_count), sort)
+        page_obj = KeysetPage(cached["rows"], paginator, cached["has_next"], cached["has_previous"])
+        page_obj.approximate_count = cached["count"]
+    else:
+        paginator = Paginator(qs, 24)
+        cached = caching.get_listing(filters, lambda: _offset_payload(paginator, page), sort)
+        paginator.count = cached["count"]
+        page_obj = Page(cached["rows"], cached["number"], paginator)
+
+    # filters to carry over in pagination links
+    filter_query = urlencode({
+        key: value for key, value in
+        {"q": q, "cat": cat, "res": res, "device": device, "tag": tag, "color": color, "sort": request.GET.get("sort", "")}.items()
+        if value
+    })
 
     return render(
         request,
         "wallpapers/home.html",
         {
             "page_obj": page_obj,
+            "keyset": use_keyset,
+            "filter_query": filter_query,
             "q": q,
             "cat": cat,
             "res": res,
             "device": device,
+            "tag": tag,
+            "color": color,
             "sort": sort,  # send to template
             "categories": Wallpaper.CATEGORY_CHOICES,
-            "count": count,
-            "size": size
+            "popular_tags": wallpaper_tags.popular_tags(),
+            "colors": colors.COLORS,
+            "grid_sizes": images.GRID_SIZES,
         }
     )
 
-def download(request, slug):
-    wp = get_object_or_404(Wallpaper, slug=slug)
-    wp.increment_downloads()
+def _keyset_payload(paginator, cursor, with_count=True):
+    page_obj = paginator.get_page(cursor)
+    return {
+        "rows": page_obj.object_list,
+        "has_next": page_obj.has_next,
+        "has_previous": page_obj.has_previous,
+        "count": page_obj.approximate_count if with_count else None,
+    }
 
-    # resolution from query (?res=4k, ?res=hd, etc.)
-    res = request.GET.get("res", "").lower()
 
-    transformations = {
-        "hd": {"width": 1920, "height": 1080, "crop": "fill"},
-        "2k": {"width": 2560, "height": 1440, "crop": "fill"},
-        "4k": {"width": 3840, "height": 2160, "crop": "fill"},
-        "mobile": {"width": 1080, "height": 2400, "crop": "fill"},
-    }
+def _offset_payload(paginator, page):
+    page_obj = paginator.get_page(page or 1)
+    return {"rows": list(page_obj.object_list), "number": page_obj.number, "count": paginator.count}
+
+
+def _is_resumed_download(range_header):
+    """True if the Range header asks for anything but the start of the file"""
+    match = RANGE_START_RE.match(range_header or "")
+    if not match:
+        return False
+    # "bytes=-500" is a suffix range, the end of the file
+    return match.group(1) == "" or int(match.group(1)) > 0
 
-    options = transformations.get(res)
-    if options:
-        # Generate transformed URL with Cloudinary
-        download_url, _ = cloudinary_url(
-            wp.drive_file_id,
-            transformation=[options],
-            flags="attachment"
-        )
-    else:
-        # Default = original
-        download_url = wp.download_link.replace("/upload/", "/upload/fl_attachment/")
 
-    # Fetch from Cloudinary and return as response
-    r = requests.get(download_url, stream=True)
+def _upstream_request_headers(request):
+    # Range requests are passed straight to Cloudinary so downloads can resume
+    headers = {"Accept-Encoding": "identity"}
+    if request.headers.get("Range"):
+        headers["Range"] = request.headers["Range"]
+        if request.headers.get("If-Range"):
+            headers["If-Range"] = request.headers["If-Range"]
+    return headers
+
+
+def _download_preset(res):
+    """The DOWNLOAD_PRESETS key asked for, "" for the original"""
+    return res if res in Wallpaper.DOWNLOAD_PRESETS else ""
+
+
+def _download_target(wp, res):
+    """Return (url, filename, content_type) for the requested resolution"""
+    res = _download_preset(res)
+
+    # URLs are signed once at upload, only legacy rows fall back to building them
+    urls = wp.download_urls or wp.build_download_urls()
+    download_url = urls[res or "original"]
+
     file_extension = wp.mime_type.split('/')[-1] if wp.mime_type else 'jpg'
     filename = f"{slugify(wp.title)}_{res or 'original'}.{file_extension}"
+    return download_url, filename, f"application/{file_extension}"
 
-    response = HttpResponse(r.content, content_type=f"application/{file_extension}")
+
+def _download_response(status, upstream_headers, body, filename, content_type):
+    """Build the client response for an upstream reply, streaming body when given"""
+    if status == 416:
+        response = HttpResponse(status=416)
+        if upstream_headers.get("Content-Range"):
+            response["Content-Range"] = upstream_headers["Content-Range"]
+        return response
+
+    if status not in (200, 206):
+        return HttpResponse("Could not fetch wallpaper, please try again.", status=502)
+
+    response = StreamingHttpResponse(body, status=status, content_type=content_type)
+    for header in FORWARDED_DOWNLOAD_HEADERS:
+        if upstream_headers.get(header):
+            response[header] = upstream_headers[header]
+    response['Accept-Ranges'] = "bytes"
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
 
 
+def _upstream_error_response(exc):
+    logger.warning("Cloudinary download error: %s", exc)
+    status = 504 if upstream.is_timeout(exc) else 502
+    return HttpResponse("Could not fetch wallpaper, please try again.", status=status)
+
+
+def download(request, slug):
+    wp = get_object_or_404(Wallpaper, slug=slug)
+
+    # resolution from query (?res=4k, ?res=hd, etc.)
+    res = request.GET.get("res", "").lower()
+
+    # a resumed download is the same download, don't count it twice
+    if not _is_resumed_download(request.headers.get("Range")):
+        wp.increment_downloads(_download_preset(res), events.client_device(request))
+
+    download_url, filename, content_type = _download_target(wp, res)
+
+    # let the CDN serve the bytes, we only record the download
+    if settings.DOWNLOAD_MODE == "redirect":
+        return HttpResponseRedirect(download_url)
+
+    # Fetch from Cloudinary and stream it through without buffering the whole file
+    try:
+        r = upstream.fetch(download_url, headers=_upstream_request_headers(request))
+    except Exception as e:
+        return _upstream_error_response(e)
+
+    if r.status_code not in (200, 206):
+        r.close()
+        return _download_response(r.status_code, r.headers, None, filename, content_type)
+
+    return _download_response(
+        r.status_code,
+        r.headers,
+        upstream.iter_chunks(r, DOWNLOAD_CHUNK_SIZE),
+        filename,
+        content_type
+    )
+
+
+async def download_async(request, slug):
+    """Same as download() but awaits Cloudinary, for serving under ASGI"""
+    try:
+        wp = await Wallpaper.objects.aget(slug=slug)
+    except Wallpaper.DoesNotExist:
+        raise Http404("No Wallpaper matches the given query.")
+
+    res = request.GET.get("res", "").lower()
+
+    if not _is_resumed_download(request.headers.get("Range")):
+        await sync_to_async(wp.increment_downloads)(_download_preset(res), events.client_device(request))
+    download_url, filename, content_type = _download_target(wp, res)
+
+    if settings.DOWNLOAD_MODE == "redirect":
+        return HttpResponseRedirect(download_url)
+
+    try:
+        r = await upstream.afetch(download_url, headers=_upstream_request_headers(request))
+    except Exception as e:
+        return _upstream_error_response(e)
+
+    if r.status_code not in (200, 206):
+        await r.aclose()
+        return _download_response(r.status_code, r.headers, None, filename, content_type)
+
+    return _download_response(
+        r.status_code,
+        r.headers,
+        upstream.aiter_chunks(r, DOWNLOAD_CHUNK_SIZE),
+        filename,
+        content_type
+    )
+
+
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def upload(request):
@@ -126,97 +313,63 @@ def upload(request):
         tags = request.POST.get("tags", "")
         featured = "featured" in request.POST
         image_file = request.FILES.get("image")
-        print(category)
 
         if not title or not image_file:
             messages.error(request, "Title and Image file are required.")
             return redirect("wallpapers:upload")
 
+        # the upload to Cloudinary and the wallpaper row happen in a job
+        # (manage.py runworker), the page polls job_status until it is done
         try:
-            uploaded = cloudinary.uploader.upload(
-                image_file,
-                folder="wallpapers",
-                resource_type="image",
-                context={
-                    "site_name": "WallPortal",
-                    "author": "Sreerag A",
-                    "url": f"https://wallportal.onrender.com/wallpapers/{title.replace(' ', '-').lower()}/"
-                }
-            )
-
-
-            width = uploaded.get("width")
-            height = uploaded.get("height")
-            size_bytes = uploaded.get("bytes", 0)
-            img_format = uploaded.get("format", "")
-
-            if not width or not height:
-                try:
-                    image_file.seek(0)
-                    with Image.open(image_file) as img:
-                        width, height = img.size
-                except Exception as e:
-                    print(f"Pillow error getting image dimensions: {e}")
-
-            public_id = uploaded["public_id"]  
-
-            preview_size = {"width": 600, "height": 600, "crop": "limit"}
-
-            if device == "mobile":
-                preview_size = {"width": 1000, "height": 1000, "crop": "limit"}
-
-            preview_url, _ = cloudinary_url(
-                public_id,
-                transformation=[
-                    preview_size,
-                    {"quality": "auto:low", "fetch_format": "auto"}
-                ],
-                secure=True
-            )
-
-            # Original download URL (full quality, original format)
-            download_url = uploaded["secure_url"]
-
-            wp = Wallpaper(
-                title=title,
-                category=category,
-                drive_file_id=public_id,
-                view_link=preview_url,
-                download_link=download_url,
-                mime_type=f"image/{img_format}",
-                width=width,
-                height=height,
-                device=device,
-                is_featured=featured,
-                tags=tags,
-                size_bytes=size_bytes
-            )
-            
-            wp.save()
-            messages.success(request, f"'{wp.title}' uploaded successfully!")
-            return redirect("wallpapers:detail", slug=wp.slug)
-        
+            job, created = ingest.enqueue_upload(image_file, title, category, device, tags, featured)
         except Exception as e:
             messages.error(request, f"An error occurred during upload: {str(e)}")
+            return redirect("wallpapers:upload")
+
+        if not created:
+            if job.status == Job.DONE:
+                messages.info(request, "This file has already been uploaded.")
+            else:
+                messages.info(request, "This file is already being uploaded.")
+        return redirect(f"{reverse('wallpapers:upload')}?{urlencode({'job': job.pk})}")
+
+    job = None
+    job_id = request.GET.get("job", "")
+    if job_id.isdigit():
+        job = Job.objects.filter(pk=job_id, kind="ingest").first()
 
     context = {
         "max_size_mb": 10, 
         'categories': Wallpaper.CATEGORY_CHOICES,
-        'devices': Wallpaper.DEVICE_CHOICES
+        'devices': Wallpaper.DEVICE_CHOICES,
+        "job": jobs.describe(job) if job else None,
     }
 
     return render(request, "wallpapers/upload.html", context)
 
 
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+@never_cache
+def job_status(request, pk):
+    """Polled by the upload page while its job is queued or running"""
+    job = get_object_or_404(Job, pk=pk)
+    return JsonResponse(jobs.describe(job))
+
+
+@cache_policy(wallpaper_validators)
 def detail(request, slug):
+    # views are counted by count_view(), cached copies never get here
     wp = get_object_or_404(Wallpaper, slug=slug)
-    wp.increment_views()
     
-    related = Wallpaper.objects.filter(
-        category=wp.category
-    ).exclude(
-        slug=wp.slug
-    ).order_by('-downloads')[:6]
+    # precomputed by related.py, the old per-category query until it has run
+    related = related_wallpapers.related_for(wp, 6)
+    if not related:
+        related = Wallpaper.objects.filter(
+            category=wp.category
+        ).exclude(
+            slug=wp.slug
+        ).order_by('-trending_score', '-downloads')[:6]
     
     return render(
         request, 
@@ -224,12 +377,55 @@ def detail(request, slug):
         {
             "wp": wp,
             "related": related,
-            "tags": wp.tags.split(","),
+            "tags": wp.tag_set.all(),
+            "related_sizes": images.RELATED_SIZES,
             "aspect_ratio": wp.aspect_ratio
         }
     )
 
 
+@csrf_exempt
+@require_POST
+@never_cache
+def count_view(request, slug):
+    """View beacon sent by the detail page, so cached pages are counted too"""
+    pk = Wallpaper.objects.filter(slug=slug).values_list("pk", flat=True).first()
+    if pk is None:
+        raise Http404("No Wallpaper matches the given query.")
+    counters.record(pk, "views", device=events.client_device(request))
+    return HttpResponse(status=204)
+
+
+@never_cache
+def staff_tools(request):
+    """
+    Staff links, library totals and delete buttons for a public page, which
+    renders without them so it never needs the session. ?slots= lists the
+    page's wallpaper slots ("slug", or "detail:slug" on the detail page).
+    """
+    if not request.user.is_staff:
+        return HttpResponse(status=204)
+
+    slots = [s for s in request.GET.get("slots", "").split(",") if s][:STAFF_TOOLS_MAX_SLOTS]
+    slugs = {slot: slot.removeprefix("detail:") for slot in slots}
+    wallpapers = {
+        wp.slug: wp for wp in Wallpaper.objects.filter(slug__in=slugs.values()).only("slug", "title")
+    }
+    count, size = library_stats.totals()
+    return render(
+        request,
+        "wallpapers/staff_tools.html",
+        {
+            "detail_slots": [
+                (slot, wallpapers[slug]) for slot, slug in slugs.items()
+                if slot != slug and slug in wallpapers
+            ],
+            "grid_wallpapers": [wallpapers[slug] for slot, slug in slugs.items() if slot == slug and slug in wallpapers],
+            "count": count,
+            "size": size
+        }
+    )
+
 
 @login_required
 @user_passes_test(lambda u: u.is_staff)
@@ -240,9 +436,10 @@ def delete_wallpaper(request, slug):
         # Delete from Cloudinary first
         try:
             if wp.drive_file_id:
-                cloudinary.uploader.destroy(wp.drive_file_id, resource_type="image")
+                with perf_metrics.timed("delete"):
+                    cloudinary.uploader.destroy(wp.drive_file_id, resource_type="image")
         except Exception as e:
-            print(f"Cloudinary delete error: {e}")
+            logger.warning("Cloudinary delete error: %s", e)
 
         wp.delete()
         messages.success(request, f"'{wp.title}' deleted successfully!")
@@ -253,17 +450,30 @@ def delete_wallpaper(request, slug):
 
 
 
+@never_cache
+def metrics(request):
+    """Prometheus scrape endpoint, for staff or a bearer METRICS_TOKEN"""
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not (settings.METRICS_TOKEN and constant_time_compare(token, settings.METRICS_TOKEN)):
+        if not request.user.is_staff:
+            raise PermissionDenied
+    return HttpResponse(perf_metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 def logout_view(request):
     logout(request)
     return redirect('wallpapers:home')
 
 
+@static_page
 def about_view(request):
     return render(request, 'pages/about.html')
 
+@static_page
 def privacy_policy_view(request):
     return render(request, 'pages/privacy_policy.html')
 
+@static_page
 def terms_of_service_view(request):
     return render(request, 'pages/terms_of_service.html')
 
@@ -274,64 +484,39 @@ def contact_view(request):
 
 
 
+def _sitemap_section_etag(request, section):
+    found = sitemaps.get_section(section)
+    return found.etag if found else None
+
+
+def _sitemap_section_lastmod(request, section):
+    found = sitemaps.get_section(section)
+    return found.lastmod if found else None
+
+
+@cache_policy()
+@condition(
+    etag_func=lambda request: sitemaps.index_etag(),
+    last_modified_func=lambda request: sitemaps.index_lastmod()
+)
 def sitemap(request):
+    """Sitemap index pointing at the numbered child sitemaps"""
     base_url = request.build_absolute_uri('/')[:-1]
-    urls = []
-
-    # Homepage
-    urls.append({
-        "loc": base_url + reverse("wallpapers:home"),
-        "priority": "1.0",
-        "changefreq": "daily",
-        "images": []
-    })
+    return HttpResponse(sitemaps.render_index(base_url), content_type="application/xml; charset=utf-8")
 
-    # Wallpaper detail pages
-    for wp in Wallpaper.objects.all().iterator():
-        image_url = wp.view_link or wp.download_link
-        tags = [t.name for t in wp.tags.all()] if hasattr(wp.tags, "all") else []
-        seo_keywords = ", ".join(tags[:5]) if tags else "HD, 4K, wallpaper"
-        seo_title = f"{wp.title} | {seo_keywords}"
-        seo_caption = f"Download {wp.title} in {seo_keywords} resolution from WallPortal."
-
-        urls.append({
-            "loc": base_url + reverse("wallpapers:detail", args=[wp.slug]),
-            "priority": "0.9",
-            "changefreq": "weekly",
-            "lastmod": wp.updated_at.strftime("%Y-%m-%d") if hasattr(wp, "updated_at") and wp.updated_at else None,
-            "images": [{
-                "loc": image_url,
-                "title": seo_title,
-                "caption": seo_caption
-            }] if image_url else []
-        })
-    
-    # Generate XML with image namespace
-    xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"\n'
-    xml += '        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">\n'
-
-    for u in urls:
-        xml += "  <url>\n"
-        xml += f"    <loc>{escape(u['loc'])}</loc>\n"
-        if u.get("lastmod"):
-            xml += f"    <lastmod>{u['lastmod']}</lastmod>\n"
-        xml += f"    <changefreq>{u['changefreq']}</changefreq>\n"
-        xml += f"    <priority>{u['priority']}</priority>\n"
-
-        # Add images if available
-        for img in u.get("images", []):
-            if img.get("loc"):
-                xml += "    <image:image>\n"
-                xml += f"      <image:loc>{escape(img['loc'])}</image:loc>\n"
-                if img.get("title"):
-                    xml += f"      <image:title>{escape(img['title'])}</image:title>\n"
-                if img.get("caption"):
-                    xml += f"      <image:caption>{escape(img['caption'])}</image:caption>\n"
-                xml += "    </image:image>\n"
-
-        xml += "  </url>\n"
-
-    xml += "</urlset>"
-
-    return HttpResponse(xml, content_type="application/xml; charset=utf-8")
+
+@cache_policy()
+@condition(etag_func=_sitemap_section_etag, last_modified_func=_sitemap_section_lastmod)
+def sitemap_section(request, section):
+    found = sitemaps.get_section(section)
+    if found is None:
+        raise Http404("No such sitemap")
+
+    base_url = request.build_absolute_uri('/')[:-1]
+    body = sitemaps.cached_section(found, base_url)
+    if body is not None:
+        return HttpResponse(body, content_type="application/xml; charset=utf-8")
+    return StreamingHttpResponse(
+        sitemaps.stream_section(found, base_url),
+        content_type="application/xml; charset=utf-8"
+    )